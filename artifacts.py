@@ -0,0 +1,160 @@
+import os
+import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List, Union
+
+import numpy as np
+
+from config import PATH_TO_EVALUATION_ARTIFACTS, RENDER_PLOTS, ARTIFACT_WORKERS
+
+
+def artifact_prefix(model_name: str, directory: str = PATH_TO_EVALUATION_ARTIFACTS) -> str:
+    return os.path.join(directory, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+
+def save_evaluation_numbers(artifact: Dict, path: str):
+    """
+    This function stores the curves and confusion matrices of an evaluated model, every plot can be redrawn from them.
+    :param artifact: Evaluation artifact, see EvaluationStage.evaluate_model
+    :param path: Path to the .npz file
+    :return: This function returns nothing.
+    """
+
+    temporary_path = f"{path}.tmp.npz"
+    np.savez_compressed(temporary_path, **{key: np.asarray(value) for key, value in artifact.items()})
+    os.replace(temporary_path, path)
+
+
+def _figure():
+    # Figures are created without pyplot, so they hold no global state and can be drawn by any thread
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=(6.4, 4.8))
+    return figure, figure.subplots()
+
+
+def render_roc_curve(artifact: Dict, path: str):
+    figure, axes = _figure()
+
+    axes.plot(artifact["false_positive_rates"], artifact["true_positive_rates"],
+              label=f"{artifact['model']} (AUC = {float(artifact['roc_auc']):.2f})")
+    axes.plot([0, 1], [0, 1], linestyle="--", color="grey", linewidth=0.8)
+    axes.set(xlabel="False Positive Rate", ylabel="True Positive Rate", xlim=(-0.01, 1.01), ylim=(-0.01, 1.01),
+             title=artifact["title"])
+    axes.legend(loc="lower right")
+
+    figure.savefig(path)
+
+
+def render_precision_recall_curve(artifact: Dict, path: str):
+    figure, axes = _figure()
+
+    axes.plot(artifact["recalls"], artifact["precisions"], drawstyle="steps-post",
+              label=f"{artifact['model']} (AP = {float(artifact['average_precision']):.2f})")
+    axes.set(xlabel="Recall", ylabel="Precision", xlim=(-0.01, 1.01), ylim=(-0.01, 1.01), title=artifact["title"])
+    axes.legend(loc="lower left")
+
+    figure.savefig(path)
+
+
+def render_confusion_matrix(matrix: np.ndarray, classes: List, title: str, path: str):
+    figure, axes = _figure()
+
+    image = axes.imshow(matrix, interpolation="nearest", cmap="viridis")
+    figure.colorbar(image, ax=axes)
+
+    # Counts are written in dark on the bright cells and in bright on the dark ones
+    for row in range(matrix.shape[0]):
+        for column in range(matrix.shape[1]):
+            bright = matrix[row, column] > (matrix.max() + matrix.min()) / 2
+            axes.text(column, row, f"{matrix[row, column]}", ha="center", va="center",
+                      color="black" if bright else "white")
+
+    axes.set(xticks=range(len(classes)), yticks=range(len(classes)), xticklabels=classes, yticklabels=classes,
+             xlabel="Predicted label", ylabel="True label", title=title)
+
+    figure.savefig(path)
+
+
+def write_evaluation_artifact(artifact: Dict, directory: str = PATH_TO_EVALUATION_ARTIFACTS,
+                              render: bool = RENDER_PLOTS) -> List[str]:
+    """
+    This function stores the numbers of an evaluated model and renders its ROC, precision-recall and confusion
+    matrix plots.
+    :param artifact: Evaluation artifact, see EvaluationStage.evaluate_model
+    :param directory: Directory of the artifacts
+    :param render: False only stores the numbers, for headless runs
+    :return: Paths to the written files.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+    prefix = artifact_prefix(artifact["model"], directory)
+
+    paths = [f"{prefix}-evaluation.npz"]
+    save_evaluation_numbers(artifact, paths[0])
+
+    if not render:
+        return paths
+
+    classes = [str(label) for label in artifact["classes"]]
+
+    threshold_title = f"{artifact['title']} at {float(artifact['threshold']):.3g}"
+
+    plots = [("ROC-", lambda path: render_roc_curve(artifact, path)),
+             ("PR-", lambda path: render_precision_recall_curve(artifact, path)),
+             ("CM-", lambda path: render_confusion_matrix(artifact["confusion_matrix"], classes, artifact["title"],
+                                                          path)),
+             ("CM-threshold-", lambda path: render_confusion_matrix(artifact["confusion_matrix_at_threshold"],
+                                                                    classes, threshold_title, path))]
+
+    for kind, render_plot in plots:
+        path = os.path.join(directory, f"{kind}{os.path.basename(prefix)}.png")
+        render_plot(path)
+        paths.append(path)
+
+    return paths
+
+
+class ArtifactWriter:
+    """
+    Writes evaluation artifacts in background threads, so evaluation goes on with the next model while the plots of
+    the previous one are rendered. Matplotlib is only used through figures of its own, never through pyplot.
+    """
+
+    def __init__(self, directory: str = PATH_TO_EVALUATION_ARTIFACTS, render: bool = RENDER_PLOTS,
+                 n_workers: int = ARTIFACT_WORKERS):
+
+        self.directory = directory
+        self.render = render
+        self.n_workers = n_workers
+
+        self._executor: Union[None, ThreadPoolExecutor] = None
+        self._futures: List[Future] = []
+
+    def submit(self, artifact: Dict):
+        """
+        This function queues an evaluation artifact to be written.
+        :param artifact: Evaluation artifact, see EvaluationStage.evaluate_model
+        :return: This function returns nothing.
+        """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.n_workers, thread_name_prefix="artifacts")
+
+        self._futures.append(self._executor.submit(write_evaluation_artifact, artifact, self.directory, self.render))
+
+    def close(self) -> List[str]:
+        """
+        This function waits until every queued artifact is written.
+        :return: Paths to the written files, errors of the writers are raised here.
+        """
+
+        if self._executor is None:
+            return []
+
+        try:
+            return [path for future in self._futures for path in future.result()]
+        finally:
+            self._executor.shutdown()
+            self._executor = None
+            self._futures = []
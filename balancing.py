@@ -1,24 +1,43 @@
-from typing import Union
+import os
+from typing import Union, Dict, TYPE_CHECKING
 
+import numpy as np
 import pandas as pd
-from imblearn.over_sampling import SMOTE, ADASYN
-from sklearn.utils import resample
 
-from config import PATH_TO_TEMPORARY_DATA, RANDOM_SEED
+from config import PATH_TO_TEMPORARY_DATA, RANDOM_SEED, BALANCING_CHUNKED, BALANCING_CHUNK_SIZE, BALANCING_N_JOBS
+from instrumentation import traced
+from schema import apply_schema, print_memory_usage, print_peak_memory
+from storage import read_intermediate, write_intermediate, iter_intermediate_chunks, write_intermediate_chunks
+from undersampling import StreamingUndersampler
+
+# scikit-learn and imblearn take seconds to import, they are imported by the methods that use them
+if TYPE_CHECKING:
+    from neighbors import GraphNeighbors, NeighborGraph
+
+# Neighbors interpolated between by SMOTE and ADASYN, their defaults
+SAMPLER_NEIGHBORS = 5
 
 
 class DataBalancingStage:
 
-    def __init__(self, method: str = "smote"):
+    def __init__(self, method: str = "smote", checkpoint: bool = False, chunked: bool = BALANCING_CHUNKED,
+                 chunk_size: int = BALANCING_CHUNK_SIZE, n_jobs: int = BALANCING_N_JOBS):
 
         self.data: Union[None, pd.DataFrame] = None
 
-        self.available_methods = ["random_undersample", "smote", "adasyn"]
+        self.checkpoint = checkpoint
+
+        self.chunked = chunked
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+        self.available_methods = ["random_undersample", "smote", "adasyn", "streaming_undersample"]
 
         self.method = self.available_methods[0]
         if method.lower() in self.available_methods:
             self.method = method.lower()
 
+    @traced
     def load_data(self):
         """
         This function is used for reading the data produced by previous stage.
@@ -27,32 +46,41 @@ class DataBalancingStage:
 
         try:
             print("Loading data...")
-            self.data = pd.read_csv(PATH_TO_TEMPORARY_DATA)
+            self.data = read_intermediate()
             print("Data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_TEMPORARY_DATA}")
             quit()
 
-    def measure_imbalance(self):
+    def measure_imbalance(self, class_counts: Union[None, Dict] = None):
         """
         This function displays the fractions of majority and minority classes.
+        :param class_counts: Class to number of rows, counted from the data if None
         :return: This function returns nothing
         """
 
-        defaulter_frac = self.data["DEFAULT"].mean()
+        if class_counts is None:
+            defaulter_frac = self.data["DEFAULT"].mean()
+        else:
+            defaulter_frac = class_counts.get(1, 0) / max(sum(class_counts.values()), 1)
 
         print(f"Imbalance: {defaulter_frac} / {1 - defaulter_frac}")
 
+    @traced
     def random_undersample_majorities(self):
         """
         This function randomlv undersamples the majority class.
         :return: This function returns nothing
         """
 
+        from sklearn.utils import resample
+
         print("Balancing data using random undersampling of majority class...")
 
-        majority_class = self.data[self.data["DEFAULT"] == self.data["DEFAULT"].value_counts().idxmax()]
-        minority_class = self.data[self.data["DEFAULT"] != self.data["DEFAULT"].value_counts().idxmax()]
+        is_majority = (self.data["DEFAULT"] == self.data["DEFAULT"].value_counts().idxmax()).to_numpy()
+
+        majority_class = self.data[is_majority]
+        minority_class = self.data[~is_majority]
 
         if RANDOM_SEED:
             undersampled_majority = resample(majority_class, replace=False, n_samples=len(minority_class),
@@ -64,18 +92,93 @@ class DataBalancingStage:
 
         print("Balancing complete.")
 
+    @traced
+    def undersample_in_stream(self, data: Union[None, pd.DataFrame] = None):
+        """
+        This function randomly undersamples every class to the size of the smallest one, in two passes over chunks
+        of rows. Data on disk is never loaded as a whole. With checkpoint the kept rows are written as they come
+        and stay on disk, the next stage reads them from there.
+        :param data: Output of the previous stage, it is streamed from disk if None
+        :return: This function returns nothing.
+        """
+
+        print(f"Balancing data using streaming random undersampling in chunks of {self.chunk_size} rows...")
+
+        if data is None:
+            if not os.path.exists(PATH_TO_TEMPORARY_DATA):
+                print(f"No such file {PATH_TO_TEMPORARY_DATA}")
+                quit()
+
+            def chunk_source(columns):
+                return iter_intermediate_chunks(self.chunk_size, columns)
+        else:
+            def chunk_source(columns):
+                # Data without rows is a single empty chunk, just like on disk, so the output keeps its columns
+                selected = data if columns is None else data[columns]
+                return (selected.iloc[start:start + self.chunk_size]
+                        for start in range(0, max(len(data), 1), self.chunk_size))
+
+        undersampler = StreamingUndersampler(target_variable="DEFAULT")
+        undersampled_chunks = undersampler.fit_transform(chunk_source)
+
+        # Classes are counted by the first pass, like the other methods the imbalance of the input is reported
+        self.measure_imbalance(undersampler.class_counts)
+
+        # Chunks are cast one at a time, just like the output of the other methods as a whole
+        undersampled_chunks = (apply_schema(chunk) for chunk in undersampled_chunks)
+
+        if self.checkpoint:
+            print("Dumping...")
+            num_rows = write_intermediate_chunks(undersampled_chunks)
+            print(f"Dumped {num_rows} rows.")
+
+            self.data = None
+        else:
+            # Chunks read from disk each start their index at 0
+            self.data = pd.concat(undersampled_chunks, ignore_index=data is None)
+
+        print("Balancing complete.")
+
+    def neighbor_graph(self, X: np.ndarray, y: np.ndarray) -> "NeighborGraph":
+        """
+        This function gives the neighbor graph of the stage, every class is a subset of it. The graph is keyed by
+        the data, so SMOTE and ADASYN, in chunks or not, share the cached graph of the same input.
+        :param X: Input features
+        :param y: Target variable
+        :return: The neighbor graph.
+        """
+
+        from neighbors import NeighborGraph
+
+        return NeighborGraph(X, subsets={label: np.flatnonzero(y == label) for label in np.unique(y)},
+                             n_jobs=self.n_jobs)
+
+    def neighbors_of_classes(self, X: pd.DataFrame, y: pd.Series) -> "GraphNeighbors":
+        """
+        This function gives the neighbor search of the oversamplers, neighbors of every class are taken from
+        the neighbor graph of the stage.
+        :param X: Input features
+        :param y: Target variable
+        :return: Neighbor search to be passed as k_neighbors / n_neighbors.
+        """
+
+        from neighbors import GraphNeighbors
+
+        graph = self.neighbor_graph(X.to_numpy(), y.to_numpy())
+
+        # Samplers ask for one more neighbor, as every sample is its own nearest neighbor
+        return GraphNeighbors(SAMPLER_NEIGHBORS + 1, graph=graph)
+
+    @traced
     def oversample_minorities_using_smote(self):
         """
         This function oversamples the minorities using SMOTE.
         :return: This function returns nothing.
         """
 
-        print("Balancing data using SMOTE...")
+        from imblearn.over_sampling import SMOTE
 
-        if RANDOM_SEED:
-            smote = SMOTE(random_state=RANDOM_SEED)
-        else:
-            smote = SMOTE()
+        print("Balancing data using SMOTE...")
 
         target_variable = "DEFAULT"
         input_features = self.data.columns.tolist()
@@ -84,24 +187,27 @@ class DataBalancingStage:
         X = self.data[input_features]
         y = self.data[target_variable]
 
+        if RANDOM_SEED:
+            smote = SMOTE(k_neighbors=self.neighbors_of_classes(X, y), random_state=RANDOM_SEED)
+        else:
+            smote = SMOTE(k_neighbors=self.neighbors_of_classes(X, y))
+
         X_resampled, y_resampled = smote.fit_resample(X, y)
 
         self.data = pd.concat([X_resampled, y_resampled], axis=1)
 
         print("Balancing complete.")
 
+    @traced
     def oversample_minorities_using_adasyn(self):
         """
         This function oversamples the minorities using ADASYN.
         :return: This function returns nothing.
         """
 
-        print("Balancing data using ADASYN...")
+        from imblearn.over_sampling import ADASYN
 
-        if RANDOM_SEED:
-            adasyn = ADASYN(random_state=RANDOM_SEED)
-        else:
-            adasyn = ADASYN()
+        print("Balancing data using ADASYN...")
 
         target_variable = "DEFAULT"
         input_features = self.data.columns.tolist()
@@ -110,12 +216,36 @@ class DataBalancingStage:
         X = self.data[input_features]
         y = self.data[target_variable]
 
+        if RANDOM_SEED:
+            adasyn = ADASYN(n_neighbors=self.neighbors_of_classes(X, y), random_state=RANDOM_SEED)
+        else:
+            adasyn = ADASYN(n_neighbors=self.neighbors_of_classes(X, y))
+
         X_resampled, y_resampled = adasyn.fit_resample(X, y)
 
         self.data = pd.concat([X_resampled, y_resampled], axis=1)
 
         print("Balancing complete.")
 
+    @traced
+    def oversample_minorities_in_chunks(self):
+        """
+        This function oversamples the minorities using SMOTE or ADASYN, synthetic rows are generated in chunks.
+        :return: This function returns nothing.
+        """
+
+        from oversampling import ChunkedOversampler
+
+        print(f"Balancing data using {self.method.upper()} in chunks of {self.chunk_size} rows...")
+
+        oversampler = ChunkedOversampler(method=self.method, k_neighbors=SAMPLER_NEIGHBORS,
+                                         chunk_size=self.chunk_size, n_jobs=self.n_jobs)
+
+        self.data = oversampler.fit_resample(self.data, target_variable="DEFAULT", graph_factory=self.neighbor_graph)
+
+        print("Balancing complete.")
+
+    @traced
     def dump_csv(self):
         """
         This function dumps the data for oncoming stages
@@ -123,31 +253,71 @@ class DataBalancingStage:
         """
         print("Dumping...")
 
-        self.data.to_csv(PATH_TO_TEMPORARY_DATA, index=False)
+        write_intermediate(self.data)
 
         print("Dumped.")
 
-    def execute_stage(self):
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
+
+        # Chunk size and jobs do not change the output, every chunk has its own seed
+        return {"method": self.method, "chunked": self.chunked, "random_seed": RANDOM_SEED}
+
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> Union[None, pd.DataFrame]:
         """
         This function executes the current stage.
-        :return: This function returns nothing.
+        :param data: Output of the previous stage, it is loaded from disk if None
+        :return: Output of the current stage, None if it was only written to disk (streaming_undersample with
+        checkpoint).
         """
 
         print("Beginning stage: Data Balancing")
 
-        self.load_data()
+        if self.method == "streaming_undersample":
+            # The input is streamed rather than loaded, and the output is written while it is produced
+            print_peak_memory("before balancing")
 
-        self.measure_imbalance()
+            self.undersample_in_stream(data)
 
-        if self.method == "random_undersample":
-            self.random_undersample_majorities()
+            print_peak_memory("after balancing")
 
-        if self.method == "smote":
-            self.oversample_minorities_using_smote()
+            if self.data is None:
+                # Checkpointed output is left on disk rather than loaded again, the next stage streams or loads it
+                print("Stage finished: Data Balancing")
 
-        if self.method == "adasyn":
-            self.oversample_minorities_using_adasyn()
+                return None
+        else:
+            if data is None:
+                self.load_data()
+            else:
+                self.data = data
+
+            self.measure_imbalance()
+
+            print_peak_memory("before balancing")
+
+            if self.method == "random_undersample":
+                self.random_undersample_majorities()
+            elif self.chunked:
+                self.oversample_minorities_in_chunks()
+            elif self.method == "smote":
+                self.oversample_minorities_using_smote()
+            elif self.method == "adasyn":
+                self.oversample_minorities_using_adasyn()
 
-        self.dump_csv()
+            print_peak_memory("after balancing")
+
+            # Synthetic rows must not widen the columns
+            apply_schema(self.data)
+
+            if self.checkpoint:
+                self.dump_csv()
+
+        print_memory_usage(self.data)
 
         print("Stage finished: Data Balancing")
+
+        return self.data
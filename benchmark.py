@@ -0,0 +1,312 @@
+import argparse
+import contextlib
+import importlib
+import io
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import pandas as pd
+
+import config
+
+# Row counts benchmarked by default, from the size of the UCI data to a few hundred times of it
+DEFAULT_ROW_COUNTS = [10000, 100000, 1000000]
+
+# How often the resident memory is sampled while a step runs (seconds)
+MEMORY_SAMPLING_INTERVAL = 0.005
+
+# Fresh interpreters started per startup measurement, the fastest start is reported
+STARTUP_REPEATS = 5
+
+
+def redirect_data_paths(directory: str):
+    """
+    This function points every data path but the raw workbook into a scratch directory, so benchmarks neither reuse
+    nor overwrite caches and fitted artifacts of real runs. It must run before the stages are imported, as they
+    bind the paths when they are imported. The directory is passed on through the environment (see
+    DATA_DIRECTORY_VARIABLE in config.py), so evaluation workers started from a fresh interpreter use it too.
+    :param directory: Scratch directory
+    :return: This function returns nothing.
+    """
+
+    # Project modules imported already would keep writing traces, profiles and caches to the paths of real runs
+    project_directory = os.path.dirname(os.path.abspath(__file__))
+    # __mp_main__ is the alias multiprocessing gives the main module
+    imported_modules = [name for name, module in list(sys.modules.items())
+                        if name not in ["__main__", "__mp_main__", __name__, "config", "stages"]
+                        and getattr(module, "__file__", None)
+                        and os.path.dirname(os.path.abspath(module.__file__)) == project_directory]
+    if imported_modules:
+        raise RuntimeError(f"Data paths must be redirected before {imported_modules} are imported")
+
+    os.environ[config.DATA_DIRECTORY_VARIABLE] = directory
+    importlib.reload(config)
+
+
+def clear_caches(directory: str):
+    """
+    This function empties the scratch directory and the neighbor graphs kept in memory, so a run starts cold.
+    :param directory: Scratch directory
+    :return: This function returns nothing.
+    """
+
+    from neighbors import clear_loaded_graphs
+
+    clear_loaded_graphs()
+
+    for entry in os.listdir(directory):
+        path = os.path.join(directory, entry)
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+class MemorySampler:
+    """
+    Samples the resident memory of the process in a background thread, the peak of a single step is measured
+    even after earlier steps pushed the peak of the process higher.
+    """
+
+    def __init__(self, interval: float = MEMORY_SAMPLING_INTERVAL):
+
+        # Project modules bind the data paths when they are imported, so they are only imported once
+        # redirect_data_paths has run
+        from instrumentation import resident_memory
+
+        self.interval = interval
+        self.peak = 0
+
+        self._resident_memory = resident_memory
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.is_set():
+            self.peak = max(self.peak, self._resident_memory())
+            self._stop.wait(self.interval)
+
+    def __enter__(self) -> "MemorySampler":
+        self.peak = self._resident_memory()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exception):
+        self._stop.set()
+        self._thread.join()
+        self.peak = max(self.peak, self._resident_memory())
+
+
+def measure(step: Callable, num_rows: int) -> Tuple[object, Dict]:
+    """
+    This function runs a benchmark step with its output silenced.
+    :param step: Function to be measured
+    :param num_rows: Number of input rows of the step
+    :return: Result of the step and its measurements.
+    """
+
+    with MemorySampler() as memory_sampler, contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = step()
+        seconds = time.perf_counter() - start
+
+    return result, {
+        "seconds": seconds,
+        "rows_per_second": num_rows / seconds if seconds else None,
+        "peak_rss_mb": memory_sampler.peak / 1024 ** 2
+    }
+
+
+def current_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark_row_count(num_rows: int, balancing_method: str, evaluate: bool, scratch_directory: str) -> List[Dict]:
+    """
+    This function benchmarks the data generation, every stage on the output of the previous one, and then
+    the whole pipeline, on synthetic data of the given size. Caches start out empty for both runs.
+    :param num_rows: Number of synthetic rows
+    :param balancing_method: Method of the balancing stage
+    :param evaluate: Whether the model evaluation stage is benchmarked too
+    :param scratch_directory: Directory of the data paths, emptied before every run
+    :return: Measurements of every step.
+    """
+
+    from balancing import DataBalancingStage
+    from cleaning import DataCleaningStage
+    from feature_engineering import FeatureEngineeringStage
+    from gathering import COLUMN_RENAMES, DataGatheringStage
+    from pipeline import Pipeline
+    from preprocessing import PreprocessingStage
+    from synthetic import generate_credit_data
+
+    def create_stages() -> List:
+        stages = [DataCleaningStage(outlier_removal_method=0), DataBalancingStage(balancing_method),
+                  FeatureEngineeringStage(), PreprocessingStage()]
+
+        if evaluate:
+            from evaluate import EvaluationStage
+            stages.append(EvaluationStage())
+
+        return stages
+
+    results = []
+
+    def record(step: str, input_rows: int, output, measurements: Dict):
+        results.append({"rows": num_rows, "step": step, "input_rows": input_rows,
+                        "output_rows": len(output) if isinstance(output, pd.DataFrame) else None, **measurements})
+
+        print(f"{num_rows:>10} rows  {step:<26} {measurements['seconds']:>9.2f}s  "
+              f"{measurements['peak_rss_mb']:>9.1f} MB  {measurements['rows_per_second'] or 0:>12.0f} rows/s")
+
+    clear_caches(scratch_directory)
+
+    data, measurements = measure(lambda: generate_credit_data(num_rows), num_rows)
+    record("generate", num_rows, data, measurements)
+
+    # Gathering is benchmarked from the raw column names on, the workbook itself is not generated
+    gathering_stage = DataGatheringStage()
+    gathering_stage.data = data.rename(columns={refined: raw for raw, refined in COLUMN_RENAMES.items()})
+    gathering_stage.data.insert(0, "ID", range(1, num_rows + 1))
+    _, measurements = measure(gathering_stage.refine_columns, num_rows)
+    record("DataGatheringStage", num_rows, gathering_stage.data, measurements)
+    del gathering_stage
+
+    stage_input = data.copy()
+    for stage in create_stages():
+        input_rows = len(stage_input)
+        stage_input, measurements = measure(lambda: stage.execute_stage(stage_input), input_rows)
+        record(type(stage).__name__, input_rows, stage_input, measurements)
+    del stage_input
+
+    clear_caches(scratch_directory)
+
+    output, measurements = measure(lambda: Pipeline(create_stages()).run(data), num_rows)
+    record("pipeline", num_rows, output, measurements)
+
+    return results
+
+
+def benchmark_startup(repeats: int = STARTUP_REPEATS) -> List[Dict]:
+    """
+    This function measures the cold start of the command line and of every stage: the time a fresh interpreter
+    takes to import main.py, or to import the module of a stage through the stage registry.
+    :param repeats: Interpreters started per measurement
+    :return: Measurements of the command line and every stage.
+    """
+
+    from stages import STAGE_REGISTRY
+
+    commands = {"cli": "import main"}
+    for name in STAGE_REGISTRY:
+        commands[name] = f"from stages import stage_class; stage_class({name!r})"
+
+    results = []
+
+    for name, command in commands.items():
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            subprocess.run([sys.executable, "-c", command], check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+            timings.append(time.perf_counter() - start)
+
+        results.append({"step": name, "seconds": min(timings), "median_seconds": sorted(timings)[len(timings) // 2]})
+
+        print(f"{'startup':>15}  {name:<26} {min(timings):>9.2f}s")
+
+    return results
+
+
+def run_benchmarks(row_counts: List[int], balancing_method: str = "smote", evaluate: bool = False,
+                   startup: bool = False) -> Dict:
+    """
+    This function benchmarks the pipeline on synthetic data of every given size.
+    :param row_counts: Numbers of synthetic rows, may be empty
+    :param balancing_method: Method of the balancing stage
+    :param evaluate: Whether the model evaluation stage is benchmarked too
+    :param startup: Whether the cold start of the command line and the stages is benchmarked too
+    :return: Report with the environment and the measurements of every step.
+    """
+
+    startup_results = benchmark_startup() if startup else []
+
+    scratch_directory = tempfile.mkdtemp(prefix="benchmark-")
+    redirect_data_paths(scratch_directory)
+
+    # Stages write plots and artifacts next to the working directory
+    working_directory = os.getcwd()
+    os.chdir(scratch_directory)
+
+    try:
+        results = []
+        for num_rows in row_counts:
+            results.extend(benchmark_row_count(num_rows, balancing_method, evaluate, scratch_directory))
+    finally:
+        os.chdir(working_directory)
+        shutil.rmtree(scratch_directory, ignore_errors=True)
+
+    return {
+        "commit": current_commit(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "balancing_method": balancing_method,
+        "evaluate": evaluate,
+        "random_seed": config.RANDOM_SEED,
+        "startup": startup_results,
+        "results": results
+    }
+
+
+def save_report(report: Dict, path: str):
+    """
+    This function writes the benchmark report as JSON.
+    :param report: Report from run_benchmarks
+    :param path: Path to the report
+    :return: This function returns nothing.
+    """
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as report_file:
+        json.dump(report, report_file, indent=4)
+
+    os.replace(temporary_path, path)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Benchmark the pipeline on synthetic credit default data.")
+    parser.add_argument("--rows", type=int, nargs="*", default=DEFAULT_ROW_COUNTS,
+                        help="Numbers of synthetic rows, e.g. --rows 10000 100000 1000000 10000000, "
+                             "none (--rows) benchmarks no data")
+    parser.add_argument("--balancing", default="smote",
+                        help="Balancing method: random_undersample, smote, adasyn or streaming_undersample")
+    parser.add_argument("--evaluate", action="store_true", help="Benchmark the model evaluation stage too")
+    parser.add_argument("--startup", action="store_true",
+                        help="Benchmark the cold start of the command line and of every stage too")
+    parser.add_argument("--output", default=None,
+                        help="Path to the JSON report, <PATH_TO_BENCHMARK_REPORTS>/<commit>.json by default")
+    arguments = parser.parse_args()
+
+    benchmark_report = run_benchmarks(arguments.rows, arguments.balancing, arguments.evaluate, arguments.startup)
+
+    report_path = arguments.output or os.path.join(config.PATH_TO_BENCHMARK_REPORTS,
+                                                   f"{benchmark_report['commit']}.json")
+    save_report(benchmark_report, report_path)
+
+    print(f"Benchmark report saved to {report_path}")
@@ -0,0 +1,236 @@
+import ast
+import hashlib
+import inspect
+import io
+import json
+import os
+import shutil
+import sys
+from contextlib import redirect_stdout
+from types import ModuleType
+from typing import Union, Dict, Tuple
+
+import pandas as pd
+
+from config import PATH_TO_CACHE_DIRECTORY, CACHE_SIZE_LIMIT
+from storage import read_intermediate, write_intermediate, iter_intermediate_chunks, write_intermediate_chunks
+
+# Stage outputs left in the intermediate store (stages returning None) are copied in and out in chunks of rows
+COPY_CHUNK_SIZE = 2 ** 16
+
+
+class _Tee(io.StringIO):
+    """
+    Collects everything printed by a stage while still showing it on the console.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+
+    def write(self, text):
+        self.stream.write(text)
+        return super().write(text)
+
+
+def fingerprint_data(data: pd.DataFrame) -> str:
+    """
+    This function hashes the content of a data frame. Index is ignored just like in the intermediate store.
+    :param data: Data to be hashed
+    :return: Hex digest of the data.
+    """
+
+    digest = hashlib.sha256()
+
+    digest.update(json.dumps([[str(column), str(dtype)] for column, dtype in data.dtypes.items()]).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+
+    return digest.hexdigest()
+
+
+def _project_modules(module_name: str, visited: Dict[str, str]):
+    """
+    This function collects a module and every project module it (transitively) imports. Imports are read from
+    the source, so modules a stage only imports inside a function, once it needs them, are collected too.
+    Config is left out, stages list the config values they depend on in cache_parameters.
+    :param module_name: Module to start from
+    :param visited: Module name to source path, filled in place
+    :return: This function returns nothing.
+    """
+
+    if module_name in visited or module_name == "config":
+        return
+
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), *module_name.split(".")) + ".py"
+
+    if not os.path.isfile(path):
+        return
+
+    visited[module_name] = path
+
+    with open(path, "rb") as source_file:
+        tree = ast.parse(source_file.read(), path)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            for alias in node.names:
+                _project_modules(alias.name, visited)
+        elif isinstance(node, ast.ImportFrom) and node.level == 0 and node.module:
+            _project_modules(node.module, visited)
+
+
+def source_fingerprint(module: ModuleType) -> str:
+    """
+    This function hashes the source code of a module along with the project modules it uses.
+    :param module: Module to be hashed
+    :return: Hex digest of the source code.
+    """
+
+    modules: Dict[str, str] = {}
+    _project_modules(os.path.splitext(os.path.basename(module.__file__))[0], modules)
+
+    digest = hashlib.sha256()
+
+    for module_name in sorted(modules):
+        with open(modules[module_name], "rb") as source_file:
+            digest.update(source_file.read())
+
+    return digest.hexdigest()
+
+
+def stage_key(stage, input_key: str) -> str:
+    """
+    This function derives the cache key of a stage from its input, its parameters and its source code.
+    :param stage: Stage to derive the key for
+    :param input_key: Fingerprint of the stage input (or the key of the previous stage)
+    :return: Hex digest of the stage output.
+    """
+
+    description = {
+        "stage": type(stage).__name__,
+        "source": source_fingerprint(inspect.getmodule(type(stage))),
+        "parameters": stage.cache_parameters(),
+        "input": input_key
+    }
+
+    return hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class StageCache:
+
+    def __init__(self, directory: str = PATH_TO_CACHE_DIRECTORY, size_limit: int = CACHE_SIZE_LIMIT):
+
+        self.directory = directory
+        self.size_limit = size_limit
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _entry_path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def contains(self, key: str) -> bool:
+        return os.path.isdir(self._entry_path(key))
+
+    def get(self, key: str) -> Tuple[Union[None, pd.DataFrame], str]:
+        """
+        This function restores a cached stage output and marks it as recently used.
+        :param key: Cache key of the stage
+        :return: Output data and console log of the stage. Outputs the stage left on disk are restored into
+        the intermediate store chunk by chunk, their data is None just like it was when the stage ran.
+        """
+
+        entry_path = self._entry_path(key)
+        data_path = os.path.join(entry_path, "data.feather")
+
+        with open(os.path.join(entry_path, "log.txt")) as log_file:
+            log = log_file.read()
+
+        if os.path.exists(os.path.join(entry_path, "on_disk")):
+            write_intermediate_chunks(iter_intermediate_chunks(COPY_CHUNK_SIZE, path=data_path, data_format="feather"))
+            data = None
+        else:
+            data = read_intermediate(path=data_path, data_format="feather")
+
+        os.utime(entry_path)
+
+        return data, log
+
+    def put(self, key: str, data: Union[None, pd.DataFrame], log: str):
+        """
+        This function stores a stage output and evicts least recently used entries if the cache is too big.
+        :param key: Cache key of the stage
+        :param data: Output data of the stage, None if the stage left its output in the intermediate store
+        :param log: Console log of the stage
+        :return: This function returns nothing.
+        """
+
+        entry_path = self._entry_path(key)
+        temporary_path = f"{entry_path}.tmp"
+
+        shutil.rmtree(temporary_path, ignore_errors=True)
+        os.makedirs(temporary_path)
+
+        if data is None:
+            # Output on disk is copied chunk by chunk, it is never loaded as a whole
+            write_intermediate_chunks(iter_intermediate_chunks(COPY_CHUNK_SIZE),
+                                      path=os.path.join(temporary_path, "data.feather"), data_format="feather")
+            open(os.path.join(temporary_path, "on_disk"), "w").close()
+        else:
+            write_intermediate(data, path=os.path.join(temporary_path, "data.feather"), data_format="feather")
+
+        with open(os.path.join(temporary_path, "log.txt"), "w") as log_file:
+            log_file.write(log)
+
+        shutil.rmtree(entry_path, ignore_errors=True)
+        os.replace(temporary_path, entry_path)
+
+        self.evict(keep=key)
+
+    def evict(self, keep: Union[None, str] = None):
+        """
+        This function removes least recently used entries until the cache fits into its size limit.
+        :param keep: Key that is never evicted
+        :return: This function returns nothing.
+        """
+
+        entries: Dict[str, Tuple[float, int]] = {}
+
+        for key in os.listdir(self.directory):
+            entry_path = self._entry_path(key)
+
+            if key.endswith(".tmp") or not os.path.isdir(entry_path):
+                continue
+
+            size = sum(os.path.getsize(os.path.join(entry_path, file_name)) for file_name in os.listdir(entry_path))
+            entries[key] = (os.path.getmtime(entry_path), size)
+
+        total_size = sum(size for _, size in entries.values())
+
+        for key, (_, size) in sorted(entries.items(), key=lambda entry: entry[1][0]):
+            if total_size <= self.size_limit:
+                break
+
+            if key == keep:
+                continue
+
+            print(f"Evicting cached stage output {key}")
+            shutil.rmtree(self._entry_path(key), ignore_errors=True)
+            total_size -= size
+
+    def execute_stage(self, stage, key: str, data: Union[None, pd.DataFrame]) -> pd.DataFrame:
+        """
+        This function executes a stage and caches its output along with its console log.
+        :param stage: Stage to be executed
+        :param key: Cache key of the stage
+        :param data: Input of the stage
+        :return: Output of the stage.
+        """
+
+        log = _Tee(sys.stdout)
+
+        with redirect_stdout(log):
+            data = stage.execute_stage(data)
+
+        self.put(key, data, log.getvalue())
+
+        return data
@@ -1,23 +1,32 @@
-from typing import Union
+from typing import Union, Dict, List
 
 import pandas as pd
-from sklearn.ensemble import IsolationForest
-from sklearn.neighbors import LocalOutlierFactor
 
-from config import PATH_TO_TEMPORARY_DATA, RANDOM_SEED
+from config import PATH_TO_TEMPORARY_DATA, RANDOM_SEED, OUTLIER_FEATURES, OUTLIER_N_JOBS, OUTLIER_SAMPLE_SIZE
+from instrumentation import traced
+from schema import print_memory_usage
+from storage import read_intermediate, write_intermediate
 
 
 class DataCleaningStage:
 
-    def __init__(self, outlier_removal_method: int = 0):
+    def __init__(self, outlier_removal_method: int = 0, checkpoint: bool = False,
+                 outlier_features: Union[None, List[str]] = OUTLIER_FEATURES, n_jobs: int = OUTLIER_N_JOBS):
 
         self.data: Union[None, pd.DataFrame] = None
 
+        self.checkpoint = checkpoint
+
+        # Target variable is never used for outlier detection, so the detector can filter unlabeled batches
+        self.outlier_features = outlier_features
+        self.n_jobs = n_jobs
+
         if outlier_removal_method == 0:
             self.outlier_removal_method = "lof"
         else:
             self.outlier_removal_method = "isolation_forest"
 
+    @traced
     def load_data(self):
         """
         This function reads the data produced by previous stage.
@@ -26,7 +35,7 @@ class DataCleaningStage:
 
         try:
             print("Loading data...")
-            self.data = pd.read_csv(PATH_TO_TEMPORARY_DATA)
+            self.data = read_intermediate()
             print("Data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_TEMPORARY_DATA}")
@@ -42,30 +51,31 @@ class DataCleaningStage:
 
         print(f"Imbalance: {defaulter_frac} / {1 - defaulter_frac}")
 
+    @traced
     def remove_outliers(self):
         """
         This function removes local outliers from data.
         :return: This function returns nothing.
         """
 
-        print("Removing outliers...")
+        # Outlier detectors pull in scikit-learn, which is only imported once outliers are removed
+        from outliers import OutlierDetector
 
-        outlier_detector = None
+        print("Removing outliers...")
 
-        # Default
         if self.outlier_removal_method == "lof":
             print("Method: Local Outlier Factor")
-            outlier_detector = LocalOutlierFactor()
 
         if self.outlier_removal_method == "isolation_forest":
             print("Method: Isolation forest")
-            if RANDOM_SEED:
-                outlier_detector = IsolationForest(random_state=RANDOM_SEED)
-            else:
-                outlier_detector = IsolationForest
 
+        outlier_detector = OutlierDetector(self.outlier_removal_method, features=self.outlier_features,
+                                           n_jobs=self.n_jobs)
 
-        outlier_scores = outlier_detector.fit_predict(self.data)
+        outlier_scores = outlier_detector.fit(self.data)
+
+        # New batches are filtered with the same detector, see OutlierDetector.load
+        outlier_detector.save()
 
         outlier_indices = self.data.index[outlier_scores == -1]
 
@@ -79,6 +89,7 @@ class DataCleaningStage:
 
         print("Removed outliers.")
 
+    @traced
     def impute_missing_values(self):
         """
         This function is used for imputing missing values (If we had any)
@@ -86,6 +97,7 @@ class DataCleaningStage:
         """
         pass
 
+    @traced
     def dump_csv(self):
         """
         This function dumps the data for oncoming stages
@@ -93,19 +105,32 @@ class DataCleaningStage:
         """
         print("Dumping...")
 
-        self.data.to_csv(PATH_TO_TEMPORARY_DATA, index=False)
+        write_intermediate(self.data)
 
         print("Dumped.")
 
-    def execute_stage(self):
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
+
+        return {"outlier_removal_method": self.outlier_removal_method, "random_seed": RANDOM_SEED,
+                "outlier_features": self.outlier_features, "outlier_sample_size": OUTLIER_SAMPLE_SIZE}
+
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
         """
         This function executes the current stage.
-        :return: This function returns nothing.
+        :param data: Output of the previous stage, it is loaded from disk if None
+        :return: Output of the current stage.
         """
 
         print("Beginning stage: Data Cleaning")
 
-        self.load_data()
+        if data is None:
+            self.load_data()
+        else:
+            self.data = data
 
         self.measure_imbalance()
 
@@ -115,6 +140,11 @@ class DataCleaningStage:
 
         self.impute_missing_values()
 
-        self.dump_csv()
+        if self.checkpoint:
+            self.dump_csv()
+
+        print_memory_usage(self.data)
 
         print("Stage finished: Data Cleaning")
+
+        return self.data
@@ -1,5 +1,104 @@
+import os
+
 PATH_TO_RAW_DATA = "/home/tugberkozdemir/Workspace/tarf/data/raw.xls"
-PATH_TO_TEMPORARY_DATA = "/home/tugberkozdemir/Workspace/tarf/data/temp.csv"
+PATH_TO_TEMPORARY_DATA = "/home/tugberkozdemir/Workspace/tarf/data/temp.feather"
+
+# Raw workbook is converted once into a columnar cache, streamed in chunks of rows
+PATH_TO_RAW_CACHE = "/home/tugberkozdemir/Workspace/tarf/data/raw_cache"
+RAW_DATA_CHUNK_SIZE = 100000
+
+# Intermediate data format, one of "feather" (Arrow IPC), "parquet" or "csv"
+INTERMEDIATE_FORMAT = "feather"
+INTERMEDIATE_COMPRESSION = "zstd"
+
+# Stage outputs are cached here, least recently used entries are evicted above the size limit (bytes)
+PATH_TO_CACHE_DIRECTORY = "/home/tugberkozdemir/Workspace/tarf/data/cache"
+CACHE_SIZE_LIMIT = 4 * 1024 ** 3
+
+# Rows processed at once by the feature engine
+FEATURE_CHUNK_SIZE = 2 ** 16
+# Payment status pattern to feature values, shared across runs
+PATH_TO_PATTERN_CACHE = "/home/tugberkozdemir/Workspace/tarf/data/patterns"
+
+# Workers used by model evaluation, 1 evaluates models one after another
+EVALUATION_N_JOBS = 1
+# Evaluation time of each model, used to start the longest running models first
+PATH_TO_MODEL_TIMINGS = "/home/tugberkozdemir/Workspace/tarf/data/model_timings.json"
+# Train and test matrices are memory mapped from here, shared by every evaluation worker
+PATH_TO_SHARED_ARRAYS = "/home/tugberkozdemir/Workspace/tarf/data/arrays"
+# Feature selection strategy: rfe, geometric, importance or permutation (see feature_selection.py)
+FEATURE_SELECTION_STRATEGY = "rfe"
+# For classifiers without importances (KNN, QDA, Naive Bayes): all (keep every feature) or permutation
+FEATURE_SELECTION_FALLBACK = "all"
+PATH_TO_FEATURE_RANKINGS = "/home/tugberkozdemir/Workspace/tarf/data/feature_rankings"
+# Hyperparameter search strategy: grid, halving or bayesian (needs optuna), see hyperparameter_search.py
+HYPERPARAMETER_SEARCH_STRATEGY = "grid"
+# Candidates raced by halving and trials proposed by bayesian search, bayesian search also stops after the timeout
+HYPERPARAMETER_SEARCH_TRIALS = 30
+HYPERPARAMETER_SEARCH_TIMEOUT = 600
+# Models evaluated by the evaluation stage (see AVAILABLE_MODELS in evaluate.py), only their libraries are imported
+EVALUATED_MODELS = ["Decision Tree", "Random Forest", "AdaBoost", "KNN", "Quadratic Discriminant Analysis",
+                    "Gaussian Naive Bayes"]
+# F-beta optimal decision threshold of every evaluated model, tuned on out-of-fold predictions of the training data
+PATH_TO_DECISION_THRESHOLDS = "/home/tugberkozdemir/Workspace/tarf/data/decision_thresholds"
+# ROC, precision-recall and confusion matrix numbers (.npz) and plots of every evaluated model, plots are rendered
+# by ARTIFACT_WORKERS background threads, RENDER_PLOTS = False only stores the numbers (headless runs)
+PATH_TO_EVALUATION_ARTIFACTS = "/home/tugberkozdemir/Workspace/tarf/data/evaluation"
+RENDER_PLOTS = True
+ARTIFACT_WORKERS = 1
+
+# Outlier detection features, None uses every column but the target variable
+OUTLIER_FEATURES = None
+OUTLIER_N_JOBS = 1
+# Isolation forest is fitted on a sample of at most this many rows, every row is scored in chunks
+OUTLIER_SAMPLE_SIZE = 100000
+OUTLIER_CHUNK_SIZE = 2 ** 16
+PATH_TO_OUTLIER_DETECTOR = "/home/tugberkozdemir/Workspace/tarf/data/outlier_detector.joblib"
+
+# k nearest neighbor graphs of the outlier detection and oversampling stages, cached per dataset version and shared
+# by every consumer within a stage. Least recently used graphs are evicted above NEIGHBOR_GRAPHS_SIZE_LIMIT bytes
+PATH_TO_NEIGHBOR_GRAPHS = "/home/tugberkozdemir/Workspace/tarf/data/neighbor_graphs"
+NEIGHBOR_GRAPHS_SIZE_LIMIT = 1024 ** 3
+NEIGHBOR_ALGORITHM = "auto"
+NEIGHBOR_N_JOBS = 1
+
+# SMOTE / ADASYN generate synthetic rows in chunks straight into the output instead of running imblearn's
+# fit_resample on the whole data, chunks are generated by BALANCING_N_JOBS threads
+BALANCING_CHUNKED = False
+# Synthetic rows generated at once, and rows read at once by the streaming_undersample method
+BALANCING_CHUNK_SIZE = 2 ** 16
+BALANCING_N_JOBS = 1
+
+# One hot encoded columns are "dense" (uint8 columns) or "sparse" (sparse columns, models are fed CSR matrices).
+# Keep "dense": trees, KNN and Naive Bayes run about 2.5x slower on CSR matrices, "sparse" only pays off for linear
+# models or one hot encodings of very many categories
+ONE_HOT_FORMAT = "dense"
+
+# Preprocessing applied to new records when scoring. It is fitted on every row before the train test split, like
+# the preprocessing of the pipeline always was, so its scaling statistics include the test rows
+PATH_TO_SCORING_TRANSFORM = "/home/tugberkozdemir/Workspace/tarf/data/scoring_transform.json"
+
+# Benchmark reports (see benchmark.py), one JSON file per commit
+PATH_TO_BENCHMARK_REPORTS = "/home/tugberkozdemir/Workspace/tarf/data/benchmarks"
+
+# Stages and their steps are recorded as spans of a JSON lines trace (see instrumentation.py), summarized after a run
+TRACING = True
+PATH_TO_TRACE = "/home/tugberkozdemir/Workspace/tarf/data/trace.jsonl"
+# Steps profiled on demand, span names (see the trace summary) to the attributes their span must have, e.g.
+# {"FeatureEngineeringStage": {}, "EvaluationStage.evaluate_model": {"model": "Random Forest"}}
+PROFILED_STEPS = {}
+# Profiler of those steps: cprofile (every call, slows call heavy code down) or sampling (every PROFILING_INTERVAL s)
+PROFILER = "sampling"
+PROFILING_INTERVAL = 0.005
+# Top allocation sites of profiled steps (tracemalloc), slows them down considerably
+PROFILE_ALLOCATIONS = True
+# Collapsed stack (flamegraph) files of every profiled step, one directory per run
+PATH_TO_PROFILES = "/home/tugberkozdemir/Workspace/tarf/data/profiles"
+
+# Exploratory analysis (see eda.py): every breakdown is computed in a single pass over the raw data, the report is
+# cached per raw workbook and EDA code, plots of the report are rendered headless into PATH_TO_EDA_PLOTS
+PATH_TO_EDA_CACHE = "/home/tugberkozdemir/Workspace/tarf/data/eda"
+PATH_TO_EDA_PLOTS = "/home/tugberkozdemir/Workspace/tarf/data/eda/plots"
 
 TRAIN_TEST_SPLIT_RATIO = 0.2
 
@@ -7,4 +106,13 @@ RANDOM_SEED = 444
 
 BETA = 10
 
-NUM_FEATURES = 20
\ No newline at end of file
+NUM_FEATURES = 20
+
+# Every data path but the raw workbook and the benchmark reports is moved into the directory named by this environment
+# variable if it is set, e.g. the scratch directory of benchmark.py. Worker processes import config anew, the
+# environment they inherit keeps them on the same paths
+DATA_DIRECTORY_VARIABLE = "TARF_DATA_DIRECTORY"
+if os.environ.get(DATA_DIRECTORY_VARIABLE):
+    for _name in [name for name in globals() if name.startswith("PATH_TO_")]:
+        if _name not in ["PATH_TO_RAW_DATA", "PATH_TO_BENCHMARK_REPORTS"]:
+            globals()[_name] = os.path.join(os.environ[DATA_DIRECTORY_VARIABLE], os.path.basename(globals()[_name]))
@@ -0,0 +1,436 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from cache import source_fingerprint
+from config import PATH_TO_RAW_DATA, PATH_TO_EDA_CACHE, PATH_TO_EDA_PLOTS
+from feature_engine import FEATURE_REGISTRY, compute_features
+from gathering import COLUMN_RENAMES, IRRELEVANT_COLUMNS
+from ingestion import read_raw_data, raw_data_key
+from instrumentation import span
+from schema import apply_schema
+
+TARGET_COLUMN = "DEFAULT"
+
+PAYMENT_STATUS_COLUMNS = [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
+BILL_STATEMENT_COLUMNS = [f"BILL_AMT{i}" for i in [1, 2, 3, 4, 5, 6]]
+
+# Names of the demographic codes, codes without a documented meaning are folded into "other" / "divorced"
+SEX_NAMES = {1: "M", 2: "F"}
+EDUCATION_NAMES = {1: "grad", 2: "uni", 3: "hs", 4: "other"}
+EDUCATION_MERGES = {0: 4, 5: 4, 6: 4}
+MARRIAGE_NAMES = {1: "married", 2: "single", 3: "divorced"}
+MARRIAGE_MERGES = {0: 3}
+
+LIMIT_BAL_BINS = list(range(0, 1000000, 50000))
+
+# Every breakdown counts the rows of each group per target class, groups are given as (column, grouping) pairs:
+# "bins" cuts a numeric column into that many equal width bins or at the given edges, "merges" folds codes into
+# another one and "names" labels the codes. Ratios, histograms and shares are all derived from these counts.
+# plot is how the breakdown is drawn: "ratio" (defaulting ratio per group), "histogram" (rows per group) or "pie"
+EDA_BREAKDOWNS: List[Dict] = [
+    {"name": "target_variable_balance", "groups": [], "plot": "pie", "title": "Target Variable Distribution"},
+    {"name": "age_distribution", "groups": [("AGE", {"bins": 20})], "plot": "histogram",
+     "title": "Age Distribution - Default vs. Non-Default", "xlabel": "Age"},
+    {"name": "age", "groups": [("AGE", {"bins": 10})], "plot": "ratio",
+     "title": "Defaulting Ratio vs. Age Group", "xlabel": "Age Group"},
+    {"name": "limit_bal_distribution", "groups": [("LIMIT_BAL", {"bins": LIMIT_BAL_BINS})], "plot": "histogram",
+     "title": "Limit/Balance Distribution - Default vs. Non-Default", "xlabel": "Limit/Balance"},
+    {"name": "limit_bal", "groups": [("LIMIT_BAL", {"bins": LIMIT_BAL_BINS})], "plot": "ratio",
+     "title": "Defaulting Ratio vs. Limit/Balance Group", "xlabel": "Limit/Balance Group"},
+    {"name": "sex", "groups": [("SEX", {})], "plot": "ratio", "title": "Defaulting Ratio vs. Sex", "xlabel": "Sex"},
+    {"name": "education", "groups": [("EDUCATION", {})], "plot": "ratio",
+     "title": "Defaulting Ratio vs. Education", "xlabel": "Education"},
+    {"name": "marriage", "groups": [("MARRIAGE", {})], "plot": "ratio",
+     "title": "Defaulting Ratio vs. Marital Status", "xlabel": "Marital Status"},
+    {"name": "demographics",
+     "groups": [("SEX", {"names": SEX_NAMES}),
+                ("MARRIAGE", {"merges": MARRIAGE_MERGES, "names": MARRIAGE_NAMES}),
+                ("EDUCATION", {"merges": EDUCATION_MERGES, "names": EDUCATION_NAMES})],
+     "plot": "ratio", "title": "Distribution of Target Variable by Demographic Info",
+     "xlabel": "Sex, Marital Status, Education"},
+    # Engineered features, see feature_engine.py
+    *[{"name": definition["name"].lower(), "groups": [(definition["name"], {})], "plot": "ratio",
+       "title": f"Defaulting Ratio vs. {definition['name']}", "xlabel": definition["name"]}
+      for definition in FEATURE_REGISTRY]
+]
+
+
+def breakdown_definition(name: str) -> Dict:
+    """
+    This function looks up a breakdown.
+    :param name: Name of the breakdown in EDA_BREAKDOWNS
+    :return: Definition of the breakdown.
+    """
+
+    for definition in EDA_BREAKDOWNS:
+        if definition["name"] == name:
+            return definition
+
+    raise ValueError(f"Unknown breakdown {name}, expected one of {[item['name'] for item in EDA_BREAKDOWNS]}")
+
+
+def load_eda_data(path: str = PATH_TO_RAW_DATA) -> pd.DataFrame:
+    """
+    This function reads the raw data with the refined column names of the gathering stage and adds every
+    engineered feature, so raw variables and features are explored on the same rows.
+    :param path: Path to the raw workbook
+    :return: Data to be explored.
+    """
+
+    data = read_raw_data(path).rename(columns=COLUMN_RENAMES).drop(columns=IRRELEVANT_COLUMNS)
+
+    features = compute_features(data[PAYMENT_STATUS_COLUMNS].to_numpy(), data[BILL_STATEMENT_COLUMNS].to_numpy())
+
+    for name, values in features.items():
+        data[name] = values
+
+    return apply_schema(data)
+
+
+def group_codes(values: pd.Series, bins: Union[None, int, List] = None, merges: Union[None, Dict] = None,
+                names: Union[None, Dict] = None) -> Tuple[np.ndarray, List[str]]:
+    """
+    This function numbers the groups of a column.
+    :param values: Values of the column
+    :param bins: Number of equal width bins or bin edges, None groups by value
+    :param merges: Code to the code it is folded into
+    :param names: Code to its label
+    :return: Group number of every row (-1 if the row is outside of every bin) and the labels of the groups.
+    """
+
+    if merges:
+        values = values.replace(merges)
+
+    if bins is not None:
+        categories = pd.cut(values, bins, precision=0, include_lowest=True)
+        return categories.cat.codes.to_numpy(), [str(category) for category in categories.cat.categories]
+
+    codes, uniques = pd.factorize(values, sort=True)
+
+    return codes, [str((names or {}).get(value, format(value, "g"))) for value in uniques]
+
+
+def count_groups(codes: List[np.ndarray], num_groups: List[int], target_codes: np.ndarray,
+                 num_classes: int) -> np.ndarray:
+    """
+    This function counts the rows of every combination of groups per target class in a single pass.
+    Group numbers are combined into a single number per row, so a bincount replaces sorting the rows by group.
+    :param codes: Group number of every row, per grouped column
+    :param num_groups: Number of groups, per grouped column
+    :param target_codes: Class number of every row
+    :param num_classes: Number of target classes
+    :return: Counts of every combination (first column slowest) x target class.
+    """
+
+    combined = np.zeros(len(target_codes), dtype=np.int64)
+    is_grouped = np.ones(len(target_codes), dtype=bool)
+
+    for column_codes, column_groups in zip(codes, num_groups):
+        combined = combined * column_groups + column_codes
+        is_grouped &= column_codes >= 0
+
+    combined = combined * num_classes + target_codes
+
+    num_combinations = int(np.prod(num_groups, dtype=np.int64))
+
+    return np.bincount(combined[is_grouped], minlength=num_combinations * num_classes).reshape(-1, num_classes)
+
+
+class EDAReport:
+    """
+    Count tables of every breakdown (groups x target classes), summary statistics and correlations of the explored
+    variables. Defaulting ratios and histograms are derived from the count tables, nothing goes back to the data.
+    """
+
+    def __init__(self, count_tables: Dict[str, pd.DataFrame], summaries: pd.DataFrame, correlations: pd.DataFrame):
+
+        self.count_tables = count_tables
+        self.summaries = summaries
+        self.correlations = correlations
+
+    def counts(self, name: str) -> pd.DataFrame:
+        """
+        This function gives the number of rows of every group per target class.
+        :param name: Name of the breakdown
+        :return: Groups x target classes, like groupby(...)[DEFAULT].value_counts().unstack().
+        """
+
+        if name not in self.count_tables:
+            breakdown_definition(name)
+            raise ValueError(f"Breakdown {name} is not part of the report")
+
+        return self.count_tables[name]
+
+    def ratios(self, name: str) -> pd.DataFrame:
+        """
+        This function gives the share of every target class within every group.
+        :param name: Name of the breakdown
+        :return: Groups x target classes, like groupby(...)[DEFAULT].value_counts(normalize=True).unstack().
+        """
+
+        counts = self.counts(name)
+
+        return counts.div(counts.sum(axis=1), axis=0)
+
+    def to_dict(self) -> Dict:
+        return {"count_tables": {name: table.to_dict(orient="split") for name, table in self.count_tables.items()},
+                "summaries": self.summaries.to_dict(orient="split"),
+                "correlations": self.correlations.to_dict(orient="split")}
+
+    @classmethod
+    def from_dict(cls, report: Dict) -> "EDAReport":
+        count_tables = {}
+        for name, table in report["count_tables"].items():
+            # Group labels of several columns are stored as lists
+            index = table["index"]
+            if index and isinstance(index[0], list):
+                index = pd.MultiIndex.from_tuples([tuple(labels) for labels in index])
+            count_tables[name] = pd.DataFrame(table["data"], index=index, columns=table["columns"])
+
+        return cls(count_tables, pd.DataFrame(**report["summaries"]), pd.DataFrame(**report["correlations"]))
+
+
+def compute_eda_report(data: pd.DataFrame, breakdowns: Union[None, List[Dict]] = None) -> EDAReport:
+    """
+    This function computes every breakdown, summary and correlation of the data. Group numbers of a column are
+    computed once and shared by the breakdowns grouping by it.
+    :param data: Data to be explored, see load_eda_data
+    :param breakdowns: Breakdown definitions, EDA_BREAKDOWNS if None
+    :return: The report.
+    """
+
+    target_codes, target_classes = pd.factorize(data[TARGET_COLUMN], sort=True)
+
+    known_groups: Dict[str, Tuple[np.ndarray, List[str]]] = {}
+    count_tables = {}
+
+    for definition in breakdowns or EDA_BREAKDOWNS:
+        codes, labels = [], []
+
+        for column, grouping in definition["groups"]:
+            grouping_key = f"{column}-{json.dumps(grouping, sort_keys=True)}"
+            if grouping_key not in known_groups:
+                known_groups[grouping_key] = group_codes(data[column], **grouping)
+
+            codes.append(known_groups[grouping_key][0])
+            labels.append(known_groups[grouping_key][1])
+
+        counts = count_groups(codes, [len(column_labels) for column_labels in labels], target_codes,
+                              len(target_classes))
+
+        if len(labels) > 1:
+            # Like groupby, combinations without any row are left out
+            index = pd.MultiIndex.from_product(labels)
+            is_observed = counts.sum(axis=1) > 0
+            counts, index = counts[is_observed], index[is_observed]
+        elif labels:
+            index = pd.Index(labels[0])
+        else:
+            index = pd.Index(["all"])
+
+        count_tables[definition["name"]] = pd.DataFrame(counts, index=index, columns=target_classes.tolist())
+
+    return EDAReport(count_tables, data.describe(), data.corr())
+
+
+def eda_report_key(path: str = PATH_TO_RAW_DATA) -> str:
+    """
+    This function derives the cache key of the report from the raw workbook and the EDA code.
+    :param path: Path to the raw workbook
+    :return: Hex digest of the report.
+    """
+
+    return hashlib.sha256(f"{raw_data_key(path)}-{source_fingerprint(sys.modules[__name__])}".encode()).hexdigest()
+
+
+def load_eda_report(path: str = PATH_TO_RAW_DATA, directory: str = PATH_TO_EDA_CACHE,
+                    use_cache: bool = True) -> EDAReport:
+    """
+    This function reads the report of the raw workbook, it is only computed when the workbook or the EDA code
+    changes.
+    :param path: Path to the raw workbook
+    :param directory: Directory of the cached reports
+    :param use_cache: False recomputes the report
+    :return: The report.
+    """
+
+    report_path = os.path.join(directory, f"{eda_report_key(path)}.json")
+
+    if use_cache:
+        try:
+            with open(report_path) as report_file:
+                return EDAReport.from_dict(json.load(report_file))
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+    with span("EDA.load_data"):
+        data = load_eda_data(path)
+
+    with span("EDA.compute_report", data):
+        report = compute_eda_report(data)
+
+    os.makedirs(directory, exist_ok=True)
+
+    temporary_path = f"{report_path}.tmp"
+    with open(temporary_path, "w") as report_file:
+        json.dump(report.to_dict(), report_file, default=str)
+    os.replace(temporary_path, report_path)
+
+    return report
+
+
+def _figure(figsize: Tuple[float, float] = (6.4, 4.8)):
+    # Figures are created without pyplot, nothing is shown and no display is needed
+    from matplotlib.figure import Figure
+
+    figure = Figure(figsize=figsize)
+    return figure, figure.subplots()
+
+
+def _group_labels(table: pd.DataFrame) -> List[str]:
+    return [", ".join(label) if isinstance(label, tuple) else label for label in table.index]
+
+
+def render_stacked_bars(table: pd.DataFrame, title: str, xlabel: str, ylabel: str, path: str):
+    """
+    This function draws a bar per group, stacked by target class.
+    :param table: Groups x target classes
+    :param title: Title of the plot
+    :param xlabel: Label of the groups
+    :param ylabel: Label of the values
+    :param path: Path to the image
+    :return: This function returns nothing.
+    """
+
+    figure, axes = _figure()
+
+    positions = np.arange(len(table))
+    bottom = np.zeros(len(table))
+
+    for target_class in table.columns:
+        values = table[target_class].fillna(0).to_numpy()
+        axes.bar(positions, values, bottom=bottom, label=str(target_class), edgecolor="black", linewidth=0.5)
+        bottom += values
+
+    labels = _group_labels(table)
+    axes.set_xticks(positions)
+    axes.set_xticklabels(labels, rotation=90 if len(labels) > 6 or max(map(len, labels)) > 8 else 0)
+
+    axes.set(xlabel=xlabel, ylabel=ylabel, title=title)
+    axes.grid(axis="y")
+    axes.set_axisbelow(True)
+    axes.legend(title="Default", loc="upper right")
+
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def render_pie(table: pd.DataFrame, title: str, path: str):
+    figure, axes = _figure()
+
+    counts = table.sum(axis=0)
+    axes.pie(counts, labels=[str(target_class) for target_class in counts.index], autopct="%1.1f%%")
+
+    axes.set_title(title)
+    axes.legend(title="Default", loc="upper right")
+
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def render_correlations(correlations: pd.DataFrame, path: str):
+    """
+    This function draws the lower triangle of the correlation matrix, the rest repeats it or is 1.
+    :param correlations: Correlation matrix
+    :param path: Path to the image
+    :return: This function returns nothing.
+    """
+
+    figure, axes = _figure((14, 14))
+
+    values = correlations.to_numpy()
+    lower_triangle = np.tril(np.ones_like(values, dtype=bool), k=-1)
+
+    image = axes.imshow(np.where(lower_triangle, values, np.nan), cmap="viridis", vmin=-1, vmax=1)
+    figure.colorbar(image, ax=axes, shrink=0.8)
+
+    for row, column in zip(*np.nonzero(lower_triangle)):
+        axes.text(column, row, f"{values[row, column]:.2f}", ha="center", va="center", fontsize=5,
+                  color="black" if values[row, column] > 0 else "white")
+
+    axes.set_xticks(range(len(correlations)))
+    axes.set_xticklabels(correlations.columns, rotation=90)
+    axes.set_yticks(range(len(correlations)))
+    axes.set_yticklabels(correlations.index)
+    axes.set_title("Correlation Matrix")
+
+    figure.tight_layout()
+    figure.savefig(path)
+
+
+def render_eda_plots(report: EDAReport, directory: str = PATH_TO_EDA_PLOTS,
+                     names: Union[None, List[str]] = None) -> List[str]:
+    """
+    This function renders the plots of a report in one batch, without a display.
+    :param report: Report to be plotted
+    :param directory: Directory of the images
+    :param names: Names of the breakdowns to plot, every breakdown of the report and the correlations if None
+    :return: Paths to the written images.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    paths = []
+
+    for name in names or list(report.count_tables):
+        definition = breakdown_definition(name)
+        path = os.path.join(directory, f"{name}.png")
+
+        if definition["plot"] == "pie":
+            render_pie(report.counts(name), definition["title"], path)
+        elif definition["plot"] == "histogram":
+            render_stacked_bars(report.counts(name), definition["title"], definition["xlabel"], "Count", path)
+        else:
+            render_stacked_bars(report.ratios(name), definition["title"], definition["xlabel"], "Defaulting Ratio",
+                                path)
+
+        paths.append(path)
+
+    if names is None:
+        paths.append(os.path.join(directory, "correlations.png"))
+        render_correlations(report.correlations, paths[-1])
+
+    return paths
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Compute every EDA breakdown in a single pass over the raw data and "
+                                                 "render their plots.")
+    parser.add_argument("breakdowns", nargs="*",
+                        help=f"Breakdowns to print, some of: {' '.join(item['name'] for item in EDA_BREAKDOWNS)}")
+    parser.add_argument("--no-cache", action="store_true", help="Recompute the report instead of reading it")
+    parser.add_argument("--no-plots", action="store_true", help="Do not render the plots")
+    arguments = parser.parse_args()
+
+    for breakdown_name in arguments.breakdowns:
+        breakdown_definition(breakdown_name)
+
+    eda_report = load_eda_report(use_cache=not arguments.no_cache)
+
+    for breakdown_name in arguments.breakdowns:
+        print(f"{breakdown_name}:")
+        print(pd.concat([eda_report.counts(breakdown_name), eda_report.ratios(breakdown_name)], axis=1,
+                        keys=["rows", "ratio"]))
+        print()
+
+    if not arguments.no_plots:
+        with span("EDA.render_plots"):
+            plot_paths = render_eda_plots(eda_report)
+        print(f"{len(plot_paths)} plots rendered to {PATH_TO_EDA_PLOTS}")
@@ -1,24 +1,97 @@
-from typing import Union, List, Dict
-
-import matplotlib.pyplot as plt
+import io
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
+from typing import Union, List, Dict, Tuple
+
+import numpy as np
 import pandas as pd
-import xgboost
-from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
-from sklearn.ensemble import RandomForestClassifier, AdaBoostClassifier
-from sklearn.feature_selection import RFE
-from sklearn.metrics import accuracy_score, fbeta_score, make_scorer, ConfusionMatrixDisplay, RocCurveDisplay
-from sklearn.metrics import confusion_matrix
-from sklearn.model_selection import train_test_split, GridSearchCV, RepeatedStratifiedKFold
-from sklearn.naive_bayes import GaussianNB
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.tree import DecisionTreeClassifier
+from scipy.sparse import csc_matrix, csr_matrix, issparse
+from sklearn.base import clone
+from sklearn.metrics import fbeta_score, make_scorer
+from sklearn.model_selection import train_test_split, RepeatedStratifiedKFold
+
+from config import PATH_TO_TEMPORARY_DATA, TRAIN_TEST_SPLIT_RATIO, BETA, RANDOM_SEED, EVALUATION_N_JOBS, \
+    ONE_HOT_FORMAT, FEATURE_SELECTION_STRATEGY, FEATURE_SELECTION_FALLBACK, HYPERPARAMETER_SEARCH_STRATEGY, \
+    HYPERPARAMETER_SEARCH_TRIALS, EVALUATED_MODELS, PATH_TO_EVALUATION_ARTIFACTS
+from artifacts import ArtifactWriter
+from instrumentation import span, traced, trace_settings, join_trace
+from profiling import configure_profiling, profiling_settings
+from shared_arrays import materialize_array, open_array
+from feature_selection import FeatureSelector, training_data_key
+from hyperparameter_search import HyperparameterSearch
+from scored_predictions import ScoredPredictions, save_decision_threshold
+from scheduling import load_timings, save_timings, longest_first, split_worker_budget
+from storage import read_intermediate
+
+# Cross validation folds, the first CV_SPLITS folds cover every training row once
+CV_SPLITS = 3
+CV_REPEATS = 2
+
+# Largest number of neighbors tried by the KNN search, also the size of its cached neighbor graphs
+KNN_MAX_NEIGHBORS = 50
+
+# Models initalize_models knows, their libraries are imported only if they are evaluated (see EVALUATED_MODELS)
+AVAILABLE_MODELS = ["XGBoost", "Decision Tree", "Random Forest", "AdaBoost", "KNN", "Quadratic Discriminant Analysis",
+                    "Gaussian Naive Bayes"]
+
+# Evaluation stage of a worker process, installed once per worker by _initialize_worker
+_worker_stage = None
+
+# Workers are started from a fresh interpreter rather than forked, the parent runs threads (memory sampling of the
+# trace, artifact writers) whose locks and state must not be copied into the workers
+WORKER_START_METHOD = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+
+
+def _initialize_worker(stage, inner_n_jobs: int, trace: Union[None, Tuple], profiling: Tuple):
+    global _worker_stage
+
+    # Spans of the worker are appended to the trace of the stage, under the span that started the pool
+    join_trace(trace)
+
+    # Profiling settings of the command line are not in the config the worker imports
+    configure_profiling(*profiling)
+
+    _worker_stage = stage
+    _worker_stage.inner_n_jobs = inner_n_jobs
+
+    # Artifacts go back to the writer of the parent process
+    _worker_stage.artifact_writer = None
+
 
-from config import PATH_TO_TEMPORARY_DATA, TRAIN_TEST_SPLIT_RATIO, BETA
+def _evaluate_model_in_worker(model_index: int) -> Tuple[str, float, List[Dict]]:
+    """
+    This function evaluates a model in a worker process.
+    :param model_index: Index of the model within the models of the stage
+    :return: Console output of the evaluation, the time it took and its artifacts, written by the parent process.
+    """
+
+    log = io.StringIO()
+
+    with redirect_stdout(log):
+        duration = _worker_stage.timed_evaluate_model(_worker_stage.models[model_index])
+
+    artifacts = _worker_stage.pending_artifacts
+    _worker_stage.pending_artifacts = []
+
+    return log.getvalue(), duration, artifacts
 
 
 class EvaluationStage:
 
-    def __init__(self):
+    def __init__(self, n_jobs: int = EVALUATION_N_JOBS, one_hot_format: str = ONE_HOT_FORMAT,
+                 evaluated_models: List[str] = EVALUATED_MODELS):
+
+        unknown_models = [name for name in evaluated_models if name not in AVAILABLE_MODELS]
+        if unknown_models:
+            raise ValueError(f"Unknown models {unknown_models}, expected some of {AVAILABLE_MODELS}")
+
+        self.evaluated_models = list(evaluated_models)
+
+        self.n_jobs = n_jobs
+        self.one_hot_format = one_hot_format
+        self.inner_n_jobs = n_jobs
 
         self.input_features: Union[None, List] = None
         self.y_test = None
@@ -26,12 +99,41 @@ class EvaluationStage:
         self.X_test = None
         self.X_train = None
 
+        self.cv_folds: List = []
+        self.training_data_key: Union[None, str] = None
+
         self.data: Union[None, pd.DataFrame] = None
 
         self.target_variable: str = "DEFAULT"
 
         self.models: List = []
 
+        # Plots and curves are written by the artifact writer in the background, worker processes have no writer
+        # and hand their artifacts back to the parent process instead
+        self.artifact_writer: Union[None, ArtifactWriter] = None
+        self.pending_artifacts: List[Dict] = []
+
+    def __getstate__(self) -> Dict:
+        # Workers reopen the memory mapped matrices instead of receiving pickled copies,
+        # and they never need the full data frame
+        state = self.__dict__.copy()
+        state["data"] = None
+        state["artifact_writer"] = None
+
+        for name in ["X_train", "X_test", "y_train", "y_test"]:
+            if isinstance(state[name], np.memmap):
+                state[name] = state[name].filename
+
+        return state
+
+    def __setstate__(self, state: Dict):
+        for name in ["X_train", "X_test", "y_train", "y_test"]:
+            if isinstance(state[name], str):
+                state[name] = open_array(state[name])
+
+        self.__dict__.update(state)
+
+    @traced
     def load_data(self):
         """
         This function reads the data produced by previous stage.
@@ -40,12 +142,13 @@ class EvaluationStage:
 
         try:
             print("Loading data...")
-            self.data = pd.read_csv(PATH_TO_TEMPORARY_DATA)
+            self.data = read_intermediate()
             print("Data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_TEMPORARY_DATA}")
             quit()
 
+    @traced
     def prepare_input_features(self):
         """
         This function initializes the input features.
@@ -63,98 +166,259 @@ class EvaluationStage:
 
         print("Input features ready.")
 
+    @traced
     def split_data(self):
         """
-        This function splits the train and test data.
+        This function splits the train and test data into contiguous float32 matrices in memory mapped files.
+        Every cross validation fold, feature selection and refit of every model reads from this one copy.
+        With sparse one hot columns the matrices are float32 CSR matrices instead.
+        Fold indices are computed once here as well.
         :return: This function returns nothing.
         """
 
         print("Splitting data...")
 
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+
+        train_rows, test_rows = train_test_split(np.arange(len(self.data)), test_size=TRAIN_TEST_SPLIT_RATIO,
+                                                 random_state=random_state)
+
         X = self.data[self.input_features]
-        y = self.data[self.target_variable]
+        y = self.data[self.target_variable].to_numpy()
+
+        if self.one_hot_format == "sparse":
+            X_sparse = self.sparse_feature_matrix(X)
+
+        for split_name, rows in [("train", train_rows), ("test", test_rows)]:
+            if self.one_hot_format == "sparse":
+                X_split = X_sparse[rows]
+            else:
+                X_split = materialize_array(f"X_{split_name}", (len(rows), len(self.input_features)),
+                                            np.dtype(np.float32),
+                                            lambda start, end: X.iloc[rows[start:end]].to_numpy(dtype=np.float32))
+            y_split = materialize_array(f"y_{split_name}", (len(rows),), y.dtype,
+                                        lambda start, end: y[rows[start:end]])
+
+            setattr(self, f"X_{split_name}", X_split)
+            setattr(self, f"y_{split_name}", y_split)
+
+        cv = RepeatedStratifiedKFold(n_splits=CV_SPLITS, n_repeats=CV_REPEATS, random_state=random_state)
+        self.cv_folds = list(cv.split(self.X_train, self.y_train))
 
-        self.X_train, self.X_test, self.y_train, self.y_test = train_test_split(X, y, test_size=TRAIN_TEST_SPLIT_RATIO)
+        self.training_data_key = training_data_key(self.X_train, self.y_train, self.input_features)
 
         print("Data split.")
 
+    def sparse_feature_matrix(self, X: pd.DataFrame) -> csr_matrix:
+        """
+        This function builds a float32 CSR matrix column by column, sparse columns are used without densifying.
+        :param X: Input features
+        :return: CSR matrix of the input features.
+        """
+
+        data, indices, indptr = [], [], [0]
+
+        for current_column in X.columns:
+            values = X[current_column]
+
+            if isinstance(values.dtype, pd.SparseDtype) and values.dtype.fill_value == 0:
+                rows = values.array.sp_index.indices
+                column_values = values.array.sp_values.astype(np.float32)
+            else:
+                column_values = values.to_numpy(dtype=np.float32)
+                rows = np.flatnonzero(column_values)
+                column_values = column_values[rows]
+
+            data.append(column_values)
+            indices.append(rows)
+            indptr.append(indptr[-1] + len(rows))
+
+        X_sparse = csc_matrix((np.concatenate(data), np.concatenate(indices), indptr), shape=X.shape)
+
+        ratio = X_sparse.nnz / max(1, X.shape[0] * X.shape[1])
+        print(f"Sparse input matrix: {X_sparse.nnz} stored values ({ratio * 100:.1f}% of a dense matrix).")
+
+        return X_sparse.tocsr()
+
+    def feature_columns(self, X: Union[np.ndarray, csr_matrix], features: List[str]) -> Union[np.ndarray, csr_matrix]:
+        """
+        This function picks the columns of the given features from a train or test matrix.
+        :param X: Train or test matrix, dense or sparse
+        :param features: Names of the features
+        :return: The matrix itself if all features are picked, a copy of the picked columns otherwise.
+        """
+
+        if list(features) == self.input_features:
+            return X
+
+        columns = [self.input_features.index(feature) for feature in features]
+
+        if issparse(X):
+            return X[:, columns]
+
+        return np.take(X, columns, axis=1)
+
+    def model_matrices(self, model: Dict) -> Tuple:
+        """
+        This function gives the train and test matrices in a form the model accepts.
+        Models that do not take sparse input (sparse is False in their definition) get dense copies.
+        :param model: Model to be evaluated
+        :return: Train and test matrices.
+        """
+
+        if issparse(self.X_train) and not model.get("sparse", True):
+            return self.X_train.toarray(), self.X_test.toarray()
+
+        return self.X_train, self.X_test
+
+    @traced
     def initalize_models(self):
         """
-        This function initializes the models we want to evaluate
+        This function initializes the models we want to evaluate, see EVALUATED_MODELS
+        param_grid is searched exhaustively, search_space is explored by the halving and bayesian searches,
+        resource is what successive halving grows for the model (n_samples by default),
+        sparse is False for models that need dense input.
         :return: This function returns nothing.
         """
 
         print("Initializing models...")
 
-        xgb_clf = xgboost.XGBClassifier()
-        xgb = {
-            "name": "XGBoost",
-            "classifier": xgb_clf,
-            "param_grid": {
-                "eta": [1]
+        if "XGBoost" in self.evaluated_models:
+            import xgboost
+
+            xgb_clf = xgboost.XGBClassifier()
+            xgb = {
+                "name": "XGBoost",
+                "classifier": xgb_clf,
+                "param_grid": {
+                    "eta": [1]
+                },
+                "search_space": {
+                    "eta": ("log", 0.01, 1.0),
+                    "max_depth": ("int", 2, 10),
+                    "subsample": ("float", 0.5, 1.0)
+                }
             }
-        }
-        # self.models.append(xgb)
-
-        dt_clf = DecisionTreeClassifier()
-        decision_tree = {
-            "name": "Decision Tree",
-            "classifier": dt_clf,
-            "param_grid": {
-                "criterion": ["entropy"]
+            self.models.append(xgb)
+
+        if "Decision Tree" in self.evaluated_models:
+            from sklearn.tree import DecisionTreeClassifier
+
+            dt_clf = DecisionTreeClassifier()
+            decision_tree = {
+                "name": "Decision Tree",
+                "classifier": dt_clf,
+                "param_grid": {
+                    "criterion": ["entropy"]
+                },
+                "search_space": {
+                    "criterion": ["gini", "entropy"],
+                    "max_depth": ("int", 2, 30),
+                    "min_samples_leaf": ("int", 1, 50)
+                }
             }
-        }
-        self.models.append(decision_tree)
-
-        rf_clf = RandomForestClassifier()
-        random_forest = {
-            "name": "Random Forest",
-            "classifier": rf_clf,
-            "param_grid": {
-                "criterion": ["entropy"]
+            self.models.append(decision_tree)
+
+        if "Random Forest" in self.evaluated_models:
+            from sklearn.ensemble import RandomForestClassifier
+
+            rf_clf = RandomForestClassifier()
+            random_forest = {
+                "name": "Random Forest",
+                "classifier": rf_clf,
+                "param_grid": {
+                    "criterion": ["entropy"]
+                },
+                "search_space": {
+                    "criterion": ["gini", "entropy"],
+                    "max_depth": ("int", 2, 30),
+                    "max_features": ["sqrt", "log2"]
+                },
+                "resource": "n_estimators"
             }
-        }
-        self.models.append(random_forest)
-
-        adaboost_clf = AdaBoostClassifier()
-        adaboost = {
-            "name": "AdaBoost",
-            "classifier": adaboost_clf,
-            "param_grid": {
-                "learning_rate": [1.0]
+            self.models.append(random_forest)
+
+        if "AdaBoost" in self.evaluated_models:
+            from sklearn.ensemble import AdaBoostClassifier
+
+            adaboost_clf = AdaBoostClassifier()
+            adaboost = {
+                "name": "AdaBoost",
+                "classifier": adaboost_clf,
+                "param_grid": {
+                    "learning_rate": [1.0]
+                },
+                "search_space": {
+                    "learning_rate": ("log", 0.01, 2.0)
+                },
+                "resource": "n_estimators"
             }
-        }
-        self.models.append(adaboost)
-
-        knn_clf = KNeighborsClassifier()
-        knn = {
-            "name": "KNN",
-            "classifier": knn_clf,
-            "param_grid": {
-                "n_neighbors": [5]
+            self.models.append(adaboost)
+
+        if "KNN" in self.evaluated_models:
+            from sklearn.neighbors import KNeighborsClassifier
+            from sklearn.pipeline import Pipeline
+            from neighbors import GraphTransformer
+
+            # Neighbors are searched once per fold up to the largest n_neighbors of the search space,
+            # every candidate then classifies from the cached distance graph
+            knn_clf = Pipeline([
+                ("neighbors", GraphTransformer(n_neighbors=KNN_MAX_NEIGHBORS)),
+                ("knn", KNeighborsClassifier(metric="precomputed"))
+            ])
+            knn = {
+                "name": "KNN",
+                "classifier": knn_clf,
+                "param_grid": {
+                    "knn__n_neighbors": [5]
+                },
+                "search_space": {
+                    "knn__n_neighbors": ("int", 1, KNN_MAX_NEIGHBORS),
+                    "knn__weights": ["uniform", "distance"]
+                },
+                "sparse": False
             }
-        }
-        self.models.append(knn)
-
-        qda_clf = QuadraticDiscriminantAnalysis()
-        qda = {
-            "name": "Quadratic Discriminant Analysis",
-            "classifier": qda_clf,
-            "param_grid": {
-                "reg_param": [0]
+            self.models.append(knn)
+
+        if "Quadratic Discriminant Analysis" in self.evaluated_models:
+            from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
+
+            qda_clf = QuadraticDiscriminantAnalysis()
+            qda = {
+                "name": "Quadratic Discriminant Analysis",
+                "classifier": qda_clf,
+                "param_grid": {
+                    "reg_param": [0]
+                },
+                "search_space": {
+                    "reg_param": ("float", 0.0, 1.0)
+                },
+                "sparse": False
             }
-        }
-        self.models.append(qda)
-
-        gnb_clf = GaussianNB()
-        gnb = {
-            "name": "Gaussian Naive Bayes",
-            "classifier": gnb_clf,
-            "param_grid": {
-                "var_smoothing": [1e-9]
+            self.models.append(qda)
+
+        if "Gaussian Naive Bayes" in self.evaluated_models:
+            from sklearn.naive_bayes import GaussianNB
+
+            gnb_clf = GaussianNB()
+            gnb = {
+                "name": "Gaussian Naive Bayes",
+                "classifier": gnb_clf,
+                "param_grid": {
+                    "var_smoothing": [1e-9]
+                },
+                "search_space": {
+                    "var_smoothing": ("log", 1e-12, 1e-3)
+                },
+                "sparse": False
             }
-        }
-        self.models.append(gnb)
+            self.models.append(gnb)
+
+        # Seeded models give the same results in sequential and parallel evaluation
+        if RANDOM_SEED:
+            for current_model in self.models:
+                if "random_state" in current_model["classifier"].get_params():
+                    current_model["classifier"].set_params(random_state=RANDOM_SEED)
 
         print(f"{len(self.models)} models has been initialized.")
 
@@ -162,13 +426,14 @@ class EvaluationStage:
     def fbeta_scoring(y_true, y_pred):
         return fbeta_score(y_true, y_pred, beta=BETA)  # Adjust the beta value as needed
 
-    def select_features(self, estimator, n):
+    @traced
+    def select_features(self, estimator, n, X_train):
         print("Selecting features...")
-        rfe = RFE(estimator, n_features_to_select=n, verbose=True)
+        feature_selector = FeatureSelector(scoring=make_scorer(self.fbeta_scoring), n_jobs=self.inner_n_jobs)
 
-        rfe.fit(self.X_train, self.y_train)
+        selected_features = feature_selector.select(estimator, X_train, self.y_train, self.input_features, n,
+                                                    self.training_data_key)
 
-        selected_features = self.X_train.columns[rfe.support_]
         print(f"Selected features: {selected_features}")
         return selected_features
 
@@ -186,20 +451,17 @@ class EvaluationStage:
 
         print(f"\nClassifier: {classifier_name}")
 
-        # Defining cross validation strategy
-        cv = RepeatedStratifiedKFold(n_splits=3, n_repeats=2)
+        X_train, X_test = self.model_matrices(model)
 
         # Defining custom f-beta scorer
         scorer = make_scorer(self.fbeta_scoring)
 
-        # Hyperparameter tuning with cross validated grid search
-        grid_search = GridSearchCV(estimator=classifier, param_grid=parameter_grid, cv=cv, scoring=scorer)
-        grid_search.fit(self.X_train, self.y_train)
-
-        # Get the best hyperparameter values and model performance
-        best_params = grid_search.best_params_
-        best_score = grid_search.best_score_
-        best_model = grid_search.best_estimator_
+        # Hyperparameter tuning with cross validated search, see HYPERPARAMETER_SEARCH_STRATEGY
+        hyperparameter_search = HyperparameterSearch(scoring=scorer, cv=self.cv_folds, n_jobs=self.inner_n_jobs)
+        with span("HyperparameterSearch.search", X_train, strategy=HYPERPARAMETER_SEARCH_STRATEGY):
+            best_model, best_params, best_score = hyperparameter_search.search(
+                classifier, X_train, self.y_train, parameter_grid, model.get("search_space"),
+                model.get("resource", "n_samples"))
 
         # Print some output
         print(f"[Validation] Best F{BETA}:\t{best_score}")
@@ -208,46 +470,192 @@ class EvaluationStage:
 
         # Feature selection
         try:
-            best_features = self.select_features(best_model, 25)
+            best_features = self.select_features(best_model, 25, X_train)
         except ValueError:
             print("Feature selection is not available for this classifier.")
             best_features = self.input_features
 
         # Test section
-        best_model.fit(self.X_train[best_features], self.y_train)
+        X_train = self.feature_columns(X_train, best_features)
+        X_test = self.feature_columns(X_test, best_features)
 
-        predictions = best_model.predict(self.X_test[best_features])
+        with span("tune_decision_threshold", X_train):
+            threshold, validation_threshold_score = self.tune_decision_threshold(best_model, X_train)
 
-        # Results
+        with span("fit", X_train):
+            best_model.fit(X_train, self.y_train)
 
-        # Save the ROC to the disk
-        RocCurveDisplay.from_estimator(best_model, self.X_test[best_features], self.y_test, name=classifier_name)
-        plt.savefig(f"ROC-{str(type(best_model))}.png")
-        plt.title(str(type(best_model)))
-        plt.clf()
+        # The test data is scored once, every metric and curve below comes from these scores
+        with span("predict", X_test):
+            test_predictions = ScoredPredictions.from_model(best_model, X_test, self.y_test)
 
-        test_score = self.fbeta_scoring(self.y_test, predictions)
+        # Results
+        test_score = test_predictions.fbeta()
         print(f"[Test] F{BETA}:\t{test_score}")
 
-        test_accuracy = accuracy_score(self.y_test, predictions)
+        test_accuracy = test_predictions.accuracy()
         print(f"[Test] Accuracy:\t{test_accuracy}")
 
-        cm = confusion_matrix(self.y_test, predictions)
-        print(f"Confusion matrix:\n{cm}\n\n")
+        cm = test_predictions.confusion_matrix()
+        print(f"Confusion matrix:\n{cm}\n")
+
+        false_positive_rates, true_positive_rates, roc_auc = test_predictions.roc_curve()
+        precisions, recalls, average_precision = test_predictions.precision_recall_curve()
+        print(f"[Test] ROC AUC:\t{roc_auc}")
+        print(f"[Test] Average precision:\t{average_precision}")
+
+        threshold_score = test_predictions.fbeta(threshold)
+        threshold_cm = test_predictions.confusion_matrix(threshold)
+        print(f"Decision threshold:\t{threshold} ([Validation] F{BETA}:\t{validation_threshold_score})")
+        print(f"[Test] F{BETA} at threshold:\t{threshold_score}")
+        print(f"[Test] Accuracy at threshold:\t{test_predictions.accuracy(threshold)}")
+        print(f"Confusion matrix at threshold:\n{threshold_cm}\n\n")
+
+        save_decision_threshold(classifier_name, {
+            "threshold": threshold,
+            "beta": BETA,
+            "positive_class": best_model.classes_[1].item(),
+            "validation_fbeta": validation_threshold_score,
+            "test_fbeta": threshold_score,
+            "test_fbeta_default_threshold": test_score,
+            "roc_auc": roc_auc,
+            "average_precision": average_precision,
+            "features": list(best_features),
+            "parameters": best_params
+        })
+
+        # ROC, precision-recall and confusion matrix plots are rendered off the evaluation, see artifacts.py
+        self.save_artifact({
+            "model": classifier_name,
+            "title": str(type(best_model)),
+            "classes": best_model.classes_,
+            "false_positive_rates": false_positive_rates,
+            "true_positive_rates": true_positive_rates,
+            "roc_auc": roc_auc,
+            "precisions": precisions,
+            "recalls": recalls,
+            "average_precision": average_precision,
+            "confusion_matrix": cm,
+            "threshold": threshold,
+            "confusion_matrix_at_threshold": threshold_cm
+        })
+
+    def save_artifact(self, artifact: Dict):
+        """
+        This function hands the curves and matrices of an evaluated model to the artifact writer.
+        :param artifact: Evaluation artifact
+        :return: This function returns nothing.
+        """
+
+        if self.artifact_writer is None:
+            self.pending_artifacts.append(artifact)
+        else:
+            self.artifact_writer.submit(artifact)
+
+    def tune_decision_threshold(self, estimator, X_train: Union[np.ndarray, csr_matrix]) -> Tuple[float, float]:
+        """
+        This function picks the F-beta optimal decision threshold of a model from out-of-fold scores of the training
+        data, every fold model scores the rows it was not fitted on. The test data is left for judging the threshold.
+        :param estimator: Model to be tuned, it is cloned for every fold
+        :param X_train: Training features of the model
+        :return: Threshold (lowest score predicted positive) and its out-of-fold F-beta score.
+        """
+
+        scores = np.empty(len(self.y_train))
+
+        for train_rows, validation_rows in self.cv_folds[:CV_SPLITS]:
+            fold_model = clone(estimator).fit(X_train[train_rows], self.y_train[train_rows])
+            scores[validation_rows] = ScoredPredictions.from_model(fold_model, X_train[validation_rows],
+                                                                   self.y_train[validation_rows]).scores
+
+        return ScoredPredictions(self.y_train, scores, np.unique(self.y_train)).best_threshold()
+
+    def timed_evaluate_model(self, model: Dict) -> float:
+        """
+        This function evaluates a model and measures how long it took.
+        :param model: Model to be evaluated
+        :return: Evaluation time in seconds.
+        """
+
+        start = time.perf_counter()
+
+        with span("EvaluationStage.evaluate_model", model=model["name"]):
+            self.evaluate_model(model)
+
+        return time.perf_counter() - start
+
+    def evaluate_models(self) -> Dict[str, float]:
+        """
+        This function evaluates the models one after another.
+        :return: Model name to evaluation time in seconds.
+        """
+
+        timings = {}
+
+        for current_model in self.models:
+            timings[current_model["name"]] = self.timed_evaluate_model(current_model)
+
+        return timings
+
+    def evaluate_models_in_parallel(self) -> Dict[str, float]:
+        """
+        This function evaluates the models in a process pool, longest running models (as of the previous runs) first.
+        Each model's output is printed in the original model order, just like in sequential evaluation.
+        :return: Model name to evaluation time in seconds.
+        """
+
+        model_names = [current_model["name"] for current_model in self.models]
+
+        outer_n_jobs, inner_n_jobs = split_worker_budget(self.n_jobs, len(self.models))
+
+        print(f"Evaluating {len(self.models)} models on {outer_n_jobs} workers, {inner_n_jobs} jobs each...")
+
+        start_order = longest_first(model_names, load_timings())
+
+        timings = {}
+
+        with ProcessPoolExecutor(max_workers=outer_n_jobs, mp_context=multiprocessing.get_context(WORKER_START_METHOD),
+                                 initializer=_initialize_worker,
+                                 initargs=(self, inner_n_jobs, trace_settings(), profiling_settings())) as executor:
+            futures = {model_index: executor.submit(_evaluate_model_in_worker, model_index)
+                       for model_index in start_order}
 
-        # Save confusion matrix to disk
-        disp = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=best_model.classes_)
-        disp.plot()
+            for model_index, model_name in enumerate(model_names):
+                log, timings[model_name], artifacts = futures[model_index].result()
+                print(log, end="")
 
-        plt.title(str(type(best_model)))
-        plt.savefig(f"CM-{str(type(best_model))}.png")
-        plt.clf()
+                for artifact in artifacts:
+                    self.save_artifact(artifact)
 
-    def execute_stage(self):
+        return timings
+
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
+
+        return {"train_test_split_ratio": TRAIN_TEST_SPLIT_RATIO, "beta": BETA, "random_seed": RANDOM_SEED,
+                "one_hot_format": self.one_hot_format,
+                "feature_selection_strategy": FEATURE_SELECTION_STRATEGY,
+                "feature_selection_fallback": FEATURE_SELECTION_FALLBACK,
+                "hyperparameter_search_strategy": HYPERPARAMETER_SEARCH_STRATEGY,
+                "hyperparameter_search_trials": HYPERPARAMETER_SEARCH_TRIALS,
+                "evaluated_models": self.evaluated_models}
+
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        This function executes the current stage.
+        :param data: Output of the previous stage, it is loaded from disk if None
+        :return: Output of the current stage.
+        """
 
         print("Beginning stage: Model Evaluation")
 
-        self.load_data()
+        if data is None:
+            self.load_data()
+        else:
+            self.data = data
 
         self.prepare_input_features()
 
@@ -255,7 +663,22 @@ class EvaluationStage:
 
         self.initalize_models()
 
-        for current_model in self.models:
-            self.evaluate_model(current_model)
+        self.artifact_writer = ArtifactWriter()
+
+        try:
+            if self.n_jobs > 1 and len(self.models) > 1:
+                timings = self.evaluate_models_in_parallel()
+            else:
+                timings = self.evaluate_models()
+        finally:
+            with span("ArtifactWriter.close"):
+                artifact_paths = self.artifact_writer.close()
+            self.artifact_writer = None
+
+        print(f"{len(artifact_paths)} evaluation artifacts written to {PATH_TO_EVALUATION_ARTIFACTS}.")
+
+        save_timings(timings)
 
         print("Stage finished: Model Evaluation")
+
+        return self.data
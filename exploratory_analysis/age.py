@@ -1,18 +1,13 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 
-from config import PATH_TO_RAW_DATA
+from eda import load_eda_report
 
-DEFAULT_COLUMN = "default payment next month"
-
-df = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
+# Breakdowns come from the cached EDA report (see eda.py), the data is only read when it changes
+report = load_eda_report()
 
 # AGE DISTRIBUTION
 
-default_data = df[df[DEFAULT_COLUMN] == 1]['AGE']
-non_default_data = df[df[DEFAULT_COLUMN] == 0]['AGE']
-
-plt.hist([default_data, non_default_data], bins=20, edgecolor='black', stacked=True, label=['Default', 'Non-Default'])
+report.counts("age_distribution").plot(kind="bar", stacked=True, width=1, edgecolor='black')
 plt.xlabel('Age')
 plt.ylabel('Count')
 plt.title('Age Distribution - Default vs. Non-Default')
@@ -21,13 +16,9 @@ plt.legend(title='Defaulting Status', loc='upper right')
 plt.tight_layout()
 plt.show()
 
-# DEFAULTING RATIOS2
-
-df['AGE'] = pd.cut(df['AGE'], bins=10, precision=0)
-
-age_counts = df.groupby('AGE')[DEFAULT_COLUMN].value_counts(normalize=True).unstack()
+# DEFAULTING RATIOS
 
-print(df.columns)
+age_counts = report.ratios("age")
 
 age_counts.plot(kind="bar", stacked=True)
 plt.xlabel("Age Group")
@@ -1,18 +1,11 @@
 import matplotlib.pyplot as plt
 import numpy as np
-import pandas as pd
 import seaborn as sns
 
-from config import PATH_TO_RAW_DATA
+from eda import load_eda_report
 
-DEFAULT_COLUMN = "default payment next month"
-
-df = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
-# Get rid of irrelevant data
-df.drop(columns=["ID"], inplace=True)
-
-# Calculation of the correlation matrix
-correlation_matrix = df.corr()
+# Correlations of the raw variables and engineered features, computed once by the EDA report (see eda.py)
+correlation_matrix = load_eda_report().correlations
 
 # No need to display same information twice and we know self correlations are 1
 # so, get rid of upper triangular part.
@@ -1,11 +1,8 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 
-from config import PATH_TO_RAW_DATA
+from eda import load_eda_report
 
-df = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
-
-edu_counts = df.groupby('EDUCATION')["default payment next month"].value_counts(normalize=True).unstack()
+edu_counts = load_eda_report().ratios("education")
 
 edu_counts.plot(kind="bar", stacked=True)
 plt.ylabel("Defaulting Ratio")
@@ -1,16 +1,11 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 
-from config import PATH_TO_RAW_DATA
+from eda import load_eda_report
 
-df = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
-
-sex_counts = df.groupby('SEX')["default payment next month"].value_counts(normalize=False).unstack()
+sex_counts = load_eda_report().counts("sex")
 
 print(sex_counts)
 
-print(df.columns)
-
 sex_counts.plot(kind="bar", stacked=True)
 plt.ylabel("Defaulting Ratio")
 plt.xlabel("Sex")
@@ -1,11 +1,8 @@
 import matplotlib.pyplot as plt
-import pandas as pd
 
-from config import PATH_TO_RAW_DATA
+from eda import load_eda_report
 
-df = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
-
-counts = df["default payment next month"].value_counts()
+counts = load_eda_report().counts("target_variable_balance").sum(axis=0)
 
 plt.pie(counts, labels=counts.index, autopct='%1.1f%%')
 
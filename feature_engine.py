@@ -0,0 +1,325 @@
+import hashlib
+import os
+import sys
+from typing import Dict, List, Callable, Union
+
+import numpy as np
+import pandas as pd
+
+from cache import source_fingerprint
+from config import FEATURE_CHUNK_SIZE, PATH_TO_PATTERN_CACHE
+from instrumentation import span
+from run_length import longest_run, leading_run, count_runs
+from storage import read_intermediate, write_intermediate
+
+# Every registered feature is computed from the same chunk of rows while it is still in cache,
+# so adding a feature does not add another scan over the PAY_* / BILL_AMT* blocks.
+FEATURE_REGISTRY: List[Dict] = []
+
+
+def register_feature(name: str, block: str) -> Callable:
+    """
+    This decorator adds a feature definition to the registry, features are computed in registration order.
+    :param name: Name of the output column
+    :param block: "PAY" if the feature only reads payment statuses, "BILL" if it reads bill statements
+    :return: The decorator.
+    """
+
+    def decorator(function: Callable) -> Callable:
+        FEATURE_REGISTRY.append({
+            "name": name,
+            "block": block,
+            "function": function
+        })
+        return function
+
+    return decorator
+
+
+class PaymentBlocks:
+    """
+    Payment status and bill statement blocks of a chunk of rows. Masks are computed once and shared by features.
+    """
+
+    def __init__(self, payment_statuses: np.ndarray, bill_statements: Union[None, np.ndarray]):
+
+        self.payment_statuses = payment_statuses
+        self.bill_statements = bill_statements
+
+        self._masks: Dict[str, np.ndarray] = {}
+
+    def _mask(self, name: str, function: Callable) -> np.ndarray:
+        if name not in self._masks:
+            self._masks[name] = function()
+        return self._masks[name]
+
+    @property
+    def inactive(self) -> np.ndarray:
+        return self._mask("inactive", lambda: self.payment_statuses == -2)
+
+    @property
+    def on_time(self) -> np.ndarray:
+        return self._mask("on_time", lambda: self.payment_statuses <= 0)
+
+    @property
+    def delayed(self) -> np.ndarray:
+        return self._mask("delayed", lambda: self.payment_statuses > 0)
+
+    @property
+    def overpaid(self) -> np.ndarray:
+        return self._mask("overpaid", lambda: self.bill_statements < 0)
+
+    @property
+    def overdraft(self) -> np.ndarray:
+        return self._mask("overdraft", lambda: self.bill_statements > 0)
+
+
+@register_feature("ACTIVITY", "PAY")
+def measure_activity(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function measures the individuals activity by counting months with a payment status other than -2.
+    :return: ACTIVITY of every row.
+    """
+    return 1 - blocks.inactive.sum(axis=1) / blocks.payment_statuses.shape[1]
+
+
+@register_feature("OVERPAID", "BILL")
+def check_if_ever_overpaid(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function checks if an individual has ever overpaid (negative bill amount)
+    :return: OVERPAID of every row.
+    """
+    return blocks.overpaid.any(axis=1).astype(int)
+
+
+@register_feature("DELAYED", "PAY")
+def check_if_ever_delayed(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function checks if an individual has ever delayed paying.
+    :return: DELAYED of every row.
+    """
+    return blocks.delayed.any(axis=1).astype(int)
+
+
+@register_feature("OVERDRAFT", "BILL")
+def check_if_ever_overdraft(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function checks if an individual has ever overdraft
+    :return: OVERDRAFT of every row.
+    """
+    return blocks.overdraft.any(axis=1).astype(int)
+
+
+@register_feature("MAX_DELAY", "PAY")
+def measure_maximum_delay(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function measures the highest delay individual achieved. Missing statuses are skipped.
+    :return: MAX_DELAY of every row.
+    """
+    # fmax skips NaN like pandas does, while maximum keeps the NaN of an all missing row
+    return np.maximum(np.fmax.reduce(blocks.payment_statuses, axis=1), 0)
+
+
+@register_feature("LONGEST_STREAK", "PAY")
+def measure_longest_streak(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function measures the length of the widest time window where individual never delayed.
+    :return: LONGEST_STREAK of every row.
+    """
+    return longest_run(blocks.on_time)
+
+
+@register_feature("CURRENT_STREAK", "PAY")
+def measure_current_streak(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function measures the months without delay up to the most recent month (PAY_1).
+    :return: CURRENT_STREAK of every row.
+    """
+    return leading_run(blocks.on_time)
+
+
+@register_feature("DELAY_EPISODES", "PAY")
+def count_delay_episodes(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function counts the separate time windows where individual delayed.
+    :return: DELAY_EPISODES of every row.
+    """
+    return count_runs(blocks.delayed)
+
+
+@register_feature("LONGEST_DELAY_RUN", "PAY")
+def measure_longest_delay_run(blocks: PaymentBlocks) -> np.ndarray:
+    """
+    This function measures the length of the widest time window where individual delayed.
+    :return: LONGEST_DELAY_RUN of every row.
+    """
+    return longest_run(blocks.delayed)
+
+
+# Payment statuses range from -2 (no consumption) to 8 (payment delay for eight months)
+PAYMENT_STATUS_MIN = -2
+PAYMENT_STATUS_MAX = 8
+
+
+class PatternCache:
+    """
+    Persistent payment status pattern to PAY feature values table, reused across runs.
+    A separate table is kept per feature engine source and payment status dtype.
+    """
+
+    def __init__(self, directory: str = PATH_TO_PATTERN_CACHE):
+
+        self.directory = directory
+
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, dtype: np.dtype) -> str:
+        key = hashlib.sha256(f"{source_fingerprint(sys.modules[__name__])}-{dtype.str}".encode()).hexdigest()
+        return os.path.join(self.directory, f"{key}.feather")
+
+    def load(self, dtype: np.dtype) -> Union[None, pd.DataFrame]:
+        """
+        This function loads the known patterns.
+        :param dtype: Payment status dtype
+        :return: Pattern codes ("PATTERN" column) along with feature values, None if nothing is cached yet.
+        """
+
+        try:
+            return read_intermediate(path=self._path(dtype), data_format="feather")
+        except FileNotFoundError:
+            return None
+
+    def save(self, dtype: np.dtype, patterns: pd.DataFrame):
+        """
+        This function stores the known patterns.
+        :param dtype: Payment status dtype
+        :param patterns: Pattern codes ("PATTERN" column) along with feature values
+        :return: This function returns nothing.
+        """
+
+        write_intermediate(patterns, path=self._path(dtype), data_format="feather")
+
+
+def encode_payment_patterns(payment_statuses: np.ndarray) -> Union[None, np.ndarray]:
+    """
+    This function dictionary encodes the payment status history of every row into a single integer.
+    :param payment_statuses: PAY_1..PAY_6 block (rows x months)
+    :return: Pattern code per row, None if some status is not an integer between -2 and 8 (e.g. synthetic rows).
+    """
+
+    if not np.issubdtype(payment_statuses.dtype, np.integer):
+        with np.errstate(invalid="ignore"):
+            if not np.array_equal(payment_statuses, np.rint(payment_statuses)):
+                return None
+
+    if payment_statuses.size and (payment_statuses.min() < PAYMENT_STATUS_MIN
+                                  or payment_statuses.max() > PAYMENT_STATUS_MAX):
+        return None
+
+    base = PAYMENT_STATUS_MAX - PAYMENT_STATUS_MIN + 1
+    digits = payment_statuses.astype(np.int64) - PAYMENT_STATUS_MIN
+
+    return digits @ (base ** np.arange(payment_statuses.shape[1], dtype=np.int64))
+
+
+def _compute_chunked(definitions: List[Dict], payment_statuses: np.ndarray, bill_statements: np.ndarray,
+                     chunk_size: int, features: Dict[str, np.ndarray]):
+    """
+    This function computes the given features in a single pass over row chunks.
+    :return: This function returns nothing, features are written into the given dictionary.
+    """
+
+    num_rows = len(payment_statuses)
+
+    for start in range(0, max(num_rows, 1), chunk_size):
+        end = min(start + chunk_size, num_rows)
+
+        blocks = PaymentBlocks(payment_statuses[start:end], bill_statements[start:end])
+
+        for definition in definitions:
+            with span(definition["function"].__name__, blocks.payment_statuses, mode="chunked"):
+                values = definition["function"](blocks)
+
+            if definition["name"] not in features:
+                # Output dtype is only known once the first chunk is computed
+                features[definition["name"]] = np.empty(num_rows, dtype=values.dtype)
+
+            features[definition["name"]][start:end] = values
+
+
+def _compute_by_pattern(definitions: List[Dict], payment_statuses: np.ndarray, pattern_codes: np.ndarray,
+                        pattern_cache: Union[None, PatternCache], features: Dict[str, np.ndarray]):
+    """
+    This function computes the given PAY features once per unique payment status pattern and broadcasts them.
+    :return: This function returns nothing, features are written into the given dictionary.
+    """
+
+    unique_codes, first_rows, inverse = np.unique(pattern_codes, return_index=True, return_inverse=True)
+
+    known_patterns = None if pattern_cache is None else pattern_cache.load(payment_statuses.dtype)
+
+    if known_patterns is None:
+        is_new = np.ones(len(unique_codes), dtype=bool)
+    else:
+        is_new = ~np.isin(unique_codes, known_patterns["PATTERN"].to_numpy())
+
+    print(f"{len(unique_codes)} unique payment patterns among {len(pattern_codes)} rows, "
+          f"{is_new.sum()} of them computed.")
+
+    # Representative rows keep the original dtype, so results match the row by row computation exactly
+    new_patterns = pd.DataFrame({"PATTERN": unique_codes[is_new]})
+    blocks = PaymentBlocks(payment_statuses[first_rows[is_new]], None)
+    for definition in definitions:
+        with span(definition["function"].__name__, blocks.payment_statuses, mode="by_pattern"):
+            new_patterns[definition["name"]] = definition["function"](blocks)
+
+    if known_patterns is None:
+        patterns = new_patterns
+    else:
+        patterns = pd.concat([known_patterns, new_patterns], ignore_index=True)
+
+    if pattern_cache is not None and is_new.any():
+        pattern_cache.save(payment_statuses.dtype, patterns)
+
+    # Align the pattern table with unique_codes, then broadcast by each row's pattern
+    pattern_rows = pd.Index(patterns["PATTERN"]).get_indexer(unique_codes)
+
+    for definition in definitions:
+        pattern_values = patterns[definition["name"]].to_numpy()[pattern_rows]
+
+        features[definition["name"]] = np.empty(len(pattern_codes), dtype=pattern_values.dtype)
+        np.take(pattern_values, inverse, out=features[definition["name"]])
+
+
+def compute_features(payment_statuses: np.ndarray, bill_statements: np.ndarray,
+                     chunk_size: int = FEATURE_CHUNK_SIZE,
+                     pattern_cache: Union[None, PatternCache] = None,
+                     memoize_patterns: bool = True) -> Dict[str, np.ndarray]:
+    """
+    This function computes every registered feature. PAY features are computed once per unique payment status
+    pattern when statuses can be encoded, everything else is computed in a single pass over row chunks.
+    :param payment_statuses: PAY_1..PAY_6 block (rows x months)
+    :param bill_statements: BILL_AMT1..BILL_AMT6 block (rows x months)
+    :param chunk_size: Number of rows processed at once
+    :param pattern_cache: Persistent pattern table, patterns are only memoized within this call if None
+    :param memoize_patterns: False computes every row directly, cheaper for a handful of rows
+    :return: Feature name to feature values, in registration order.
+    """
+
+    payment_statuses = np.ascontiguousarray(payment_statuses)
+    bill_statements = np.ascontiguousarray(bill_statements)
+
+    features: Dict[str, np.ndarray] = {}
+
+    pattern_codes = encode_payment_patterns(payment_statuses) if memoize_patterns else None
+
+    if pattern_codes is None:
+        _compute_chunked(FEATURE_REGISTRY, payment_statuses, bill_statements, chunk_size, features)
+    else:
+        payment_definitions = [definition for definition in FEATURE_REGISTRY if definition["block"] == "PAY"]
+        bill_definitions = [definition for definition in FEATURE_REGISTRY if definition["block"] != "PAY"]
+
+        _compute_by_pattern(payment_definitions, payment_statuses, pattern_codes, pattern_cache, features)
+        _compute_chunked(bill_definitions, payment_statuses, bill_statements, chunk_size, features)
+
+    return {definition["name"]: features[definition["name"]] for definition in FEATURE_REGISTRY}
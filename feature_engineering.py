@@ -1,19 +1,29 @@
-from typing import List
+from typing import List, Union, Dict
 
 import pandas as pd
 
 from config import PATH_TO_TEMPORARY_DATA
+from instrumentation import traced
+from feature_engine import compute_features, PatternCache
+from schema import apply_schema, print_memory_usage
+from storage import read_intermediate_columns, read_intermediate, write_intermediate, append_intermediate_columns
 
 
 class FeatureEngineeringStage:
 
-    def __init__(self):
+    def __init__(self, checkpoint: bool = False, use_pattern_cache: bool = True):
         self.data = pd.DataFrame
 
+        self.checkpoint = checkpoint
+
+        self.use_pattern_cache = use_pattern_cache
+
         self.bill_statement_columns: List[str] = []
         self.payment_amount_columns: List[str] = []
         self.payment_status_columns: List[str] = []
 
+        self.loaded_columns: List[str] = []
+
     def prepare_column_lists(self):
         self.bill_statement_columns = [column for column in self.data.columns if column.startswith("BILL_AMT")]
 
@@ -21,6 +31,7 @@ class FeatureEngineeringStage:
 
         self.payment_status_columns = [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
 
+    @traced
     def load_data(self):
         """
         This function reads the data produced by previous stage.
@@ -29,99 +40,45 @@ class FeatureEngineeringStage:
 
         try:
             print("Loading data...")
-            self.data = pd.read_csv(PATH_TO_TEMPORARY_DATA)
+            if self.checkpoint:
+                # Only payment status and bill statement blocks are needed, the rest is passed through on dump
+                payment_status_columns = [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
+                self.loaded_columns = [column for column in read_intermediate_columns()
+                                       if column.startswith("BILL_AMT") or column in payment_status_columns]
+                self.data = read_intermediate(columns=self.loaded_columns)
+            else:
+                # Output is handed over in memory, so the whole table is needed
+                self.loaded_columns = []
+                self.data = read_intermediate()
             print("Data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_TEMPORARY_DATA}")
             quit()
 
-    def measure_activity(self):
-        """
-        This function measures the individuals activity by counting non zero bill statements
-        :return: This function returns nothing.
-        """
-
-        self.data["ACTIVITY"] = 1 - (self.data[self.payment_status_columns] == -2).sum(axis=1) / 6
-
-    def check_if_ever_overpaid(self):
-        """
-        This function checks if an individual has ever overpaid (negative bill amount)
-        :return: This function returns nothing
-        """
-
-        self.data["OVERPAID"] = (self.data[self.bill_statement_columns] < 0).any(axis=1).astype(int)
-
-    def check_if_ever_delayed(self):
-        """
-        This function checks if an individual has ever delayed paying.
-        :return: This function returns nothing.
-        """
-
-        self.data["DELAYED"] = (self.data[self.payment_status_columns] > 0).any(axis=1).astype(int)
-
-    def check_if_ever_overdraft(self):
-        """
-        This function checks if an individual has ever overdraft
-        :return: This function returns nothing.
-        """
-
-        self.data["OVERDRAFT"] = (self.data[self.bill_statement_columns] > 0).any(axis=1).astype(int)
-
-    def measure_maximum_delay(self):
+    @traced
+    def engineer_features(self):
         """
-        This function measures the highest delay individual achieved.
+        This function computes every feature registered in the feature engine.
+        PAY_* and BILL_AMT* blocks are pulled out once, PAY features are computed once per payment pattern.
         :return: This function returns nothing.
         """
 
-        self.data["MAX_DELAY"] = (self.data[self.payment_status_columns]).max(axis=1).clip(lower=0)
-
-    @staticmethod
-    def len_longest_nonpositive_subseq(lst):
-        """
-        This utility function finds the length of longest non positive subsequence within a list.
-        :param lst:
-        :return: Length of the longest non positive subsequence
-        """
-        subsequences = []
-        start_index = None
-
-        for i, num in enumerate(lst):
-            if num <= 0:
-                if start_index is None:
-                    start_index = i
-            elif start_index is not None:
-                end_index = i - 1
-                subsequence = lst[start_index:end_index + 1]
-                subsequences.append(subsequence)
-                start_index = None
-
-        if start_index is not None:
-            subsequence = lst[start_index:]
-            subsequences.append(subsequence)
+        print("Engineering features...")
 
-        maxlen = 0
+        pattern_cache = PatternCache() if self.use_pattern_cache else None
 
-        for current_seq in subsequences:
-            if len(current_seq) >= maxlen:
-                maxlen = len(current_seq)
-
-        return maxlen
-
-    def measure_longest_streak(self):
-        """
-        This function measures the length of the widest time window where individual never delayed.
-        :return: This function returns nothing.
-        """
+        features = compute_features(self.data[self.payment_status_columns].to_numpy(),
+                                    self.data[self.bill_statement_columns].to_numpy(),
+                                    pattern_cache=pattern_cache)
 
-        max_streaks = []
+        for feature_name, values in features.items():
+            self.data[feature_name] = values
 
-        for _, row in self.data[self.payment_status_columns].iterrows():
-            seq = row.values
-            max_streaks.append(self.len_longest_nonpositive_subseq(seq))
-
-        self.data["LONGEST_STREAK"] = max_streaks
+        apply_schema(self.data)
 
+        print(f"Engineered features: {list(features)}")
 
+    @traced
     def dump_csv(self):
         """
         This function dumps the data for oncoming stages
@@ -129,34 +86,52 @@ class FeatureEngineeringStage:
         """
         print("Dumping...")
 
-        self.data.to_csv(PATH_TO_TEMPORARY_DATA, index=False)
+        if self.loaded_columns:
+            # Data was projected on load, only the new columns have to be written
+            engineered_columns = [column for column in self.data.columns if column not in self.loaded_columns]
+            append_intermediate_columns(self.data[engineered_columns])
+        else:
+            write_intermediate(self.data)
 
         print("Dumped.")
 
-    def execute_stage(self):
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
+
+        return {}
+
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> Union[None, pd.DataFrame]:
         """
         This function executes the current stage.
-        :return: This function returns nothing.
+        :param data: Output of the previous stage, it is loaded from disk if None
+        :return: Output of the current stage, None if only some of its columns were loaded (checkpoint with the
+        input on disk), the next stage reads the whole output from the checkpoint then.
         """
 
         print("Beginning stage: Feature Engineering")
 
-        self.load_data()
+        if data is None:
+            self.load_data()
+        else:
+            self.data = data
+            self.loaded_columns = []
 
         self.prepare_column_lists()
 
-        self.measure_activity()
-
-        self.check_if_ever_overpaid()
-
-        self.check_if_ever_delayed()
+        self.engineer_features()
 
-        self.check_if_ever_overdraft()
+        if self.checkpoint:
+            self.dump_csv()
 
-        self.measure_maximum_delay()
+        print_memory_usage(self.data)
 
-        self.measure_longest_streak()
+        print("Stage finished: Feature Engineering")
 
-        self.dump_csv()
+        if self.loaded_columns:
+            # The projected frame lacks the columns passed through on disk, it must not reach the next stage
+            return None
 
-        print("Stage finished: Feature Engineering")
+        return self.data
@@ -1,44 +1,23 @@
 import matplotlib.pyplot as plt
-import pandas as pd
-
-DEFAULT_COLUMN = "DEFAULT"
-
-
-def measure_max_delay(dataframe: pd.DataFrame) -> pd.DataFrame:
-    """
-    This function checks if an individual has ever delayed
-    :return: This function returns nothing.
-    """
-
-    payment_status_columns = ["PAY_1", "PAY_2", "PAY_3", "PAY_4", "PAY_5", "PAY_6"]
-
-    dataframe["MAX_DELAY"] = (dataframe[payment_status_columns]).max(axis=1)
-
-    dataframe["MAX_DELAY"] = dataframe["MAX_DELAY"].clip(lower=0)
-
-    return dataframe
-
-
-df = pd.read_csv("/home/tugberkozdemir/Workspace/tarf/data/temp.csv")
-
-df = measure_max_delay(df)
 
+from eda import load_eda_report
 
+# MAX_DELAY is computed by feature_engine.py for the EDA report (see eda.py), the report is cached on disk
+report = load_eda_report()
 
 # Correlation
-print(df.corr()["DEFAULT"]["MAX_DELAY"])
+print(report.correlations["DEFAULT"]["MAX_DELAY"])
 
 # Descriptive stuff
-print(df["MAX_DELAY"].describe())
+print(report.summaries["MAX_DELAY"])
 
 # Defaulting ratios
-age_counts = df.groupby('MAX_DELAY')[DEFAULT_COLUMN].value_counts(normalize=True).unstack()
+feature_counts = report.ratios("max_delay")
 
-age_counts.plot(kind="bar", stacked=True)
+feature_counts.plot(kind="bar", stacked=True)
 plt.xlabel("Max. Delay (months)")
 plt.ylabel("Defaulting Ratio")
 plt.title("Defaulting Ratio vs. Max. Delay")
-plt.xticks(ticks=plt.gca().get_xticks(), labels=['{:.2f}'.format(x) for x in plt.gca().get_xticks()])
 plt.grid(axis="y")
 plt.legend(title='Defaulting Status', loc='upper right')
 plt.tight_layout()
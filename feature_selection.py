@@ -0,0 +1,216 @@
+import hashlib
+import json
+import math
+import os
+from typing import List, Union, Callable
+
+import numpy as np
+from scipy.sparse import issparse
+from sklearn.base import clone
+from sklearn.feature_selection import RFE
+from sklearn.inspection import permutation_importance
+
+from config import PATH_TO_FEATURE_RANKINGS, RANDOM_SEED, FEATURE_SELECTION_STRATEGY, FEATURE_SELECTION_FALLBACK
+
+# rfe:         Recursive feature elimination, one refit per eliminated feature
+# geometric:   Recursive feature elimination dropping a fraction of the remaining features per refit
+# importance:  Ranking by the importances of the already fitted model, no refit at all
+# permutation: Ranking by permutation importance, works with any estimator
+AVAILABLE_STRATEGIES = ["rfe", "geometric", "importance", "permutation"]
+
+# all: Keep every feature if the estimator has no importances, permutation: Rank by permutation importance
+AVAILABLE_FALLBACKS = ["all", "permutation"]
+
+
+def training_data_key(X: np.ndarray, y: np.ndarray, feature_names: List[str]) -> str:
+    """
+    This function hashes the training data, rankings are only reused on the very same data.
+    :param X: Training matrix, dense or sparse
+    :param y: Training labels
+    :param feature_names: Names of the columns of X
+    :return: Hex digest of the training data.
+    """
+
+    digest = hashlib.sha256(json.dumps([feature_names, str(X.dtype), X.shape, issparse(X)]).encode())
+
+    if issparse(X):
+        X = X.tocsr()
+        for buffer in [X.data, X.indices, X.indptr]:
+            digest.update(np.ascontiguousarray(buffer).data)
+    else:
+        digest.update(np.ascontiguousarray(X).data)
+
+    digest.update(np.ascontiguousarray(y).data)
+
+    return digest.hexdigest()
+
+
+def has_importances(estimator) -> bool:
+    """
+    This function checks if a fitted estimator can rank features by itself.
+    :param estimator: Fitted estimator
+    :return: True if the estimator has feature_importances_ or coef_.
+    """
+
+    return hasattr(estimator, "feature_importances_") or hasattr(estimator, "coef_")
+
+
+def _importances(estimator) -> np.ndarray:
+    if hasattr(estimator, "feature_importances_"):
+        return np.asarray(estimator.feature_importances_)
+
+    coefficients = np.asarray(estimator.coef_)
+    if coefficients.ndim > 1:
+        return np.abs(coefficients).sum(axis=0)
+
+    return np.abs(coefficients)
+
+
+class FeatureSelector:
+
+    def __init__(self, strategy: str = FEATURE_SELECTION_STRATEGY, fallback: str = FEATURE_SELECTION_FALLBACK,
+                 step_fraction: float = 0.2, scoring: Union[None, Callable] = None, n_jobs: int = 1,
+                 cache_directory: str = PATH_TO_FEATURE_RANKINGS):
+
+        if strategy not in AVAILABLE_STRATEGIES:
+            raise ValueError(f"Unknown feature selection strategy {strategy}, expected one of {AVAILABLE_STRATEGIES}")
+
+        if fallback not in AVAILABLE_FALLBACKS:
+            raise ValueError(f"Unknown feature selection fallback {fallback}, expected one of {AVAILABLE_FALLBACKS}")
+
+        self.strategy = strategy
+        self.fallback = fallback
+        self.step_fraction = step_fraction
+        self.scoring = scoring
+        self.n_jobs = n_jobs
+        self.cache_directory = cache_directory
+
+        os.makedirs(self.cache_directory, exist_ok=True)
+
+    def _cache_path(self, estimator, strategy: str, n: int, data_key: str) -> str:
+        description = {
+            "model": type(estimator).__name__,
+            "parameters": estimator.get_params(),
+            "strategy": strategy,
+            "step_fraction": self.step_fraction,
+            "n": n,
+            "data": data_key
+        }
+        key = hashlib.sha256(json.dumps(description, sort_keys=True, default=str).encode()).hexdigest()
+
+        return os.path.join(self.cache_directory, f"{key}.json")
+
+    def select_by_rfe(self, estimator, X: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+        """
+        This function eliminates one feature per refit.
+        :return: Boolean mask of the selected features.
+        """
+
+        rfe = RFE(clone(estimator), n_features_to_select=n, verbose=True)
+        rfe.fit(X, y)
+
+        return rfe.support_
+
+    def select_by_geometric_elimination(self, estimator, X: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+        """
+        This function eliminates step_fraction of the remaining features per refit, so it needs O(log) refits.
+        :return: Boolean mask of the selected features.
+        """
+
+        remaining = np.arange(X.shape[1])
+
+        while len(remaining) > n:
+            print(f"Fitting estimator with {len(remaining)} features.")
+
+            current_estimator = clone(estimator).fit(X[:, remaining], y)
+
+            num_eliminated = min(max(1, math.floor(len(remaining) * self.step_fraction)), len(remaining) - n)
+
+            # Stable sort keeps the elimination order deterministic on ties
+            order = np.argsort(_importances(current_estimator), kind="stable")
+            remaining = np.sort(remaining[order[num_eliminated:]])
+
+        support = np.zeros(X.shape[1], dtype=bool)
+        support[remaining] = True
+
+        return support
+
+    def select_by_importance(self, estimator, n: int) -> np.ndarray:
+        """
+        This function keeps the n most important features of the already fitted estimator.
+        :return: Boolean mask of the selected features.
+        """
+
+        return self._top(_importances(estimator), n)
+
+    def select_by_permutation(self, estimator, X: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+        """
+        This function keeps the n features whose permutation hurts the fitted estimator the most.
+        :return: Boolean mask of the selected features.
+        """
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+
+        result = permutation_importance(estimator, X, y, scoring=self.scoring, n_repeats=5, n_jobs=self.n_jobs,
+                                        random_state=random_state)
+
+        return self._top(result.importances_mean, n)
+
+    @staticmethod
+    def _top(importances: np.ndarray, n: int) -> np.ndarray:
+        support = np.zeros(len(importances), dtype=bool)
+        support[np.argsort(-importances, kind="stable")[:n]] = True
+
+        return support
+
+    def select(self, estimator, X: np.ndarray, y: np.ndarray, feature_names: List[str], n: int,
+               data_key: str) -> List[str]:
+        """
+        This function selects n features for a fitted estimator, selections are cached on disk.
+        :param estimator: Estimator already fitted on X and y
+        :param X: Training matrix
+        :param y: Training labels
+        :param feature_names: Names of the columns of X
+        :param n: Number of features to select
+        :param data_key: Hash of the training data, see training_data_key
+        :return: Names of the selected features, in their original order.
+        """
+
+        strategy = self.strategy
+
+        if strategy != "permutation" and not has_importances(estimator):
+            if self.fallback == "all":
+                print("Feature selection is not available for this classifier.")
+                return list(feature_names)
+
+            print("Classifier has no feature importances, falling back to permutation importance.")
+            strategy = "permutation"
+
+        cache_path = self._cache_path(estimator, strategy, n, data_key)
+
+        try:
+            with open(cache_path) as cache_file:
+                print(f"Reusing cached {strategy} feature selection.")
+                return json.load(cache_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            pass
+
+        print(f"Strategy: {strategy}")
+
+        if strategy == "rfe":
+            support = self.select_by_rfe(estimator, X, y, n)
+        elif strategy == "geometric":
+            support = self.select_by_geometric_elimination(estimator, X, y, n)
+        elif strategy == "importance":
+            support = self.select_by_importance(estimator, n)
+        else:
+            support = self.select_by_permutation(estimator, X, y, n)
+
+        selected_features = [feature for feature, selected in zip(feature_names, support) if selected]
+
+        temporary_path = f"{cache_path}.tmp"
+        with open(temporary_path, "w") as cache_file:
+            json.dump(selected_features, cache_file)
+        os.replace(temporary_path, cache_path)
+
+        return selected_features
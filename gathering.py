@@ -1,16 +1,28 @@
-from typing import Union
+import os
+from typing import Union, Dict
 
 import pandas as pd
 
-from config import PATH_TO_RAW_DATA, PATH_TO_TEMPORARY_DATA
+from config import PATH_TO_RAW_DATA
+from instrumentation import traced
+from ingestion import read_raw_data
+from schema import apply_schema, print_memory_usage
+from storage import write_intermediate
+
+# Raw column names that are fixed on gathering, and raw columns that are never used
+COLUMN_RENAMES = {"default payment next month": "DEFAULT", "PAY_0": "PAY_1"}
+IRRELEVANT_COLUMNS = ["ID"]
 
 
 class DataGatheringStage:
 
-    def __init__(self):
+    def __init__(self, checkpoint: bool = False):
 
         self.data: Union[None, pd.DataFrame] = None
 
+        self.checkpoint = checkpoint
+
+    @traced
     def read_raw_data(self):
         """
         This function reads raw data from disk.
@@ -19,12 +31,13 @@ class DataGatheringStage:
 
         try:
             print("Loading raw data...")
-            self.data = pd.read_excel(PATH_TO_RAW_DATA, header=[1])
+            self.data = read_raw_data()
             print("Raw data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_RAW_DATA}")
             quit()
 
+    @traced
     def refine_columns(self):
         """
         This function fixes few bad column names and drops irrelevant columns such as ID
@@ -32,15 +45,15 @@ class DataGatheringStage:
         """
         print("Refining columns...")
 
-        self.data.rename(columns={"default payment next month": "DEFAULT", "PAY_0": "PAY_1"},
-                         inplace=True)
+        self.data.rename(columns=COLUMN_RENAMES, inplace=True)
 
-        irrelevant_columns = ["ID"]
+        self.data.drop(columns=IRRELEVANT_COLUMNS, inplace=True)
 
-        self.data.drop(columns=irrelevant_columns, inplace=True)
+        apply_schema(self.data)
 
         print("Refined columns.")
 
+    @traced
     def dump_csv(self):
         """
         This function dumps the data for oncoming stages
@@ -48,20 +61,45 @@ class DataGatheringStage:
         """
         print("Dumping...")
 
-        self.data.to_csv(PATH_TO_TEMPORARY_DATA, index=False)
+        write_intermediate(self.data)
 
         print("Dumped.")
 
-    def execute_stage(self):
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
+
+        try:
+            raw_data_stat = os.stat(PATH_TO_RAW_DATA)
+        except FileNotFoundError:
+            return {"raw_data": PATH_TO_RAW_DATA}
+
+        return {"raw_data": PATH_TO_RAW_DATA, "raw_data_size": raw_data_stat.st_size,
+                "raw_data_mtime": raw_data_stat.st_mtime_ns}
+
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
         """
         This function executes the current stage.
-        :return: This function returns nothing.
+        :param data: Raw data, it is read from disk if None
+        :return: Output of the current stage.
         """
 
         print("Beginning stage: Data Gathering")
 
-        self.read_raw_data()
+        if data is None:
+            self.read_raw_data()
+        else:
+            self.data = data
+
         self.refine_columns()
-        self.dump_csv()
+
+        if self.checkpoint:
+            self.dump_csv()
+
+        print_memory_usage(self.data)
 
         print("Stage finished: Data Gathering")
+
+        return self.data
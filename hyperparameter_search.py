@@ -0,0 +1,250 @@
+import time
+from typing import Dict, List, Union, Callable, Tuple
+
+import numpy as np
+from scipy.stats import randint, uniform, loguniform
+from sklearn.base import clone
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401, enables the halving searches
+from sklearn.model_selection import GridSearchCV, HalvingRandomSearchCV
+
+from config import RANDOM_SEED, HYPERPARAMETER_SEARCH_STRATEGY, HYPERPARAMETER_SEARCH_TRIALS, \
+    HYPERPARAMETER_SEARCH_TIMEOUT, BETA
+
+try:
+    import optuna
+except ImportError:
+    optuna = None
+
+# grid:     Exhaustive grid search over param_grid
+# halving:  Successive halving over search_space, candidates are raced on a growing resource
+# bayesian: Tree-structured Parzen estimator proposals over search_space, hopeless trials are pruned after each fold
+AVAILABLE_STRATEGIES = ["grid", "halving", "bayesian"]
+
+# A search space maps a parameter to either a list of choices or a (kind, low, high) tuple,
+# where kind is "int", "float" or "log" (float sampled on a log scale)
+SEARCH_SPACE_KINDS = ["int", "float", "log"]
+
+
+def to_distributions(search_space: Dict) -> Dict:
+    """
+    This function turns a search space into scipy distributions, as expected by the randomized searches of sklearn.
+    :param search_space: Parameter to choices or (kind, low, high)
+    :return: Parameter to choices or distribution.
+    """
+
+    distributions = {}
+
+    for parameter, values in search_space.items():
+        if isinstance(values, list):
+            distributions[parameter] = values
+            continue
+
+        kind, low, high = values
+
+        if kind == "int":
+            distributions[parameter] = randint(low, high + 1)
+        elif kind == "float":
+            distributions[parameter] = uniform(low, high - low)
+        elif kind == "log":
+            distributions[parameter] = loguniform(low, high)
+        else:
+            raise ValueError(f"Unknown search space kind {kind}, expected one of {SEARCH_SPACE_KINDS}")
+
+    return distributions
+
+
+def suggest_parameters(trial, search_space: Dict) -> Dict:
+    """
+    This function asks an optuna trial for a point of the search space.
+    :param trial: Optuna trial
+    :param search_space: Parameter to choices or (kind, low, high)
+    :return: Parameter to value.
+    """
+
+    parameters = {}
+
+    for parameter, values in search_space.items():
+        if isinstance(values, list):
+            parameters[parameter] = trial.suggest_categorical(parameter, values)
+            continue
+
+        kind, low, high = values
+
+        if kind == "int":
+            parameters[parameter] = trial.suggest_int(parameter, low, high)
+        elif kind == "float":
+            parameters[parameter] = trial.suggest_float(parameter, low, high)
+        elif kind == "log":
+            parameters[parameter] = trial.suggest_float(parameter, low, high, log=True)
+        else:
+            raise ValueError(f"Unknown search space kind {kind}, expected one of {SEARCH_SPACE_KINDS}")
+
+    return parameters
+
+
+class HyperparameterSearch:
+
+    def __init__(self, scoring: Callable, cv: List, strategy: str = HYPERPARAMETER_SEARCH_STRATEGY,
+                 num_trials: int = HYPERPARAMETER_SEARCH_TRIALS, timeout: float = HYPERPARAMETER_SEARCH_TIMEOUT,
+                 n_jobs: int = 1):
+
+        if strategy not in AVAILABLE_STRATEGIES:
+            raise ValueError(f"Unknown hyperparameter search strategy {strategy}, expected one of "
+                             f"{AVAILABLE_STRATEGIES}")
+
+        if strategy == "bayesian" and optuna is None:
+            print("optuna is not installed, falling back to successive halving.")
+            strategy = "halving"
+
+        self.scoring = scoring
+        self.cv = cv
+        self.strategy = strategy
+        self.num_trials = num_trials
+        self.timeout = timeout
+        self.n_jobs = n_jobs
+
+        # One row per trial: parameters, score (None if pruned), resource and seconds spent
+        self.trials: List[Dict] = []
+
+    def search_grid(self, estimator, param_grid: Dict, X: np.ndarray, y: np.ndarray) -> Tuple:
+        """
+        This function evaluates every point of the grid on every fold.
+        :return: Refitted best estimator, best parameters and best cross validated score.
+        """
+
+        grid_search = GridSearchCV(estimator=estimator, param_grid=param_grid, cv=self.cv, scoring=self.scoring,
+                                   n_jobs=self.n_jobs)
+        grid_search.fit(X, y)
+
+        self.record_cv_results(grid_search.cv_results_, "n_samples")
+
+        return grid_search.best_estimator_, grid_search.best_params_, grid_search.best_score_
+
+    def search_halving(self, estimator, search_space: Dict, X: np.ndarray, y: np.ndarray,
+                       resource: str = "n_samples") -> Tuple:
+        """
+        This function races num_trials random candidates, only the best third of them survives each round,
+        and survivors get three times more of the resource (training rows or n_estimators).
+        The first round starts small enough for the last round to use all of the resource.
+        :return: Refitted best estimator, best parameters and best cross validated score.
+        """
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+
+        if resource == "n_samples":
+            max_resources = "auto"
+        else:
+            # Candidates are trained up to the number of estimators the model is configured with
+            max_resources = estimator.get_params()[resource]
+
+        halving_search = HalvingRandomSearchCV(estimator=estimator, param_distributions=to_distributions(search_space),
+                                               n_candidates=self.num_trials, factor=3, resource=resource,
+                                               min_resources="exhaust", max_resources=max_resources, cv=self.cv,
+                                               scoring=self.scoring, random_state=random_state, n_jobs=self.n_jobs)
+        halving_search.fit(X, y)
+
+        self.record_cv_results(halving_search.cv_results_, resource)
+
+        return halving_search.best_estimator_, halving_search.best_params_, halving_search.best_score_
+
+    def search_bayesian(self, estimator, search_space: Dict, X: np.ndarray, y: np.ndarray) -> Tuple:
+        """
+        This function proposes candidates with a tree-structured Parzen estimator, folds of a candidate are
+        evaluated one by one and the candidate is dropped as soon as its running score falls below the median.
+        :return: Refitted best estimator, best parameters and best cross validated score.
+        """
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+
+        def objective(trial) -> float:
+            parameters = suggest_parameters(trial, search_space)
+            candidate = clone(estimator).set_params(**parameters)
+
+            start = time.perf_counter()
+            fold_scores = []
+
+            try:
+                for fold, (train_rows, validation_rows) in enumerate(self.cv):
+                    candidate.fit(X[train_rows], y[train_rows])
+                    fold_scores.append(self.scoring(candidate, X[validation_rows], y[validation_rows]))
+
+                    trial.report(float(np.mean(fold_scores)), fold)
+                    if trial.should_prune():
+                        raise optuna.TrialPruned()
+            finally:
+                pruned = len(fold_scores) < len(self.cv)
+                self.trials.append({
+                    "parameters": parameters,
+                    "score": None if pruned else float(np.mean(fold_scores)),
+                    "resource": f"{len(fold_scores)}/{len(self.cv)} folds",
+                    "seconds": time.perf_counter() - start
+                })
+
+            return float(np.mean(fold_scores))
+
+        optuna.logging.set_verbosity(optuna.logging.WARNING)
+
+        study = optuna.create_study(direction="maximize", sampler=optuna.samplers.TPESampler(seed=random_state),
+                                    pruner=optuna.pruners.MedianPruner(n_startup_trials=5))
+        study.optimize(objective, n_trials=self.num_trials, timeout=self.timeout)
+
+        best_estimator = clone(estimator).set_params(**study.best_params)
+        best_estimator.fit(X, y)
+
+        return best_estimator, study.best_params, study.best_value
+
+    def record_cv_results(self, cv_results: Dict, resource: str):
+        num_folds = len(self.cv)
+
+        for index, parameters in enumerate(cv_results["params"]):
+            seconds = (cv_results["mean_fit_time"][index] + cv_results["mean_score_time"][index]) * num_folds
+
+            if "n_resources" in cv_results:
+                resource_used = f"{cv_results['n_resources'][index]} {resource}"
+            else:
+                resource_used = f"{num_folds} folds"
+
+            self.trials.append({
+                "parameters": parameters,
+                "score": float(cv_results["mean_test_score"][index]),
+                "resource": resource_used,
+                "seconds": float(seconds)
+            })
+
+    def print_trials(self):
+        print(f"{len(self.trials)} trials, {sum(trial['seconds'] for trial in self.trials):.2f}s in total:")
+
+        for index, trial in enumerate(self.trials):
+            score = "pruned" if trial["score"] is None else f"F{BETA} {trial['score']:.4f}"
+            print(f"Trial {index}:\t{score}\t{trial['seconds']:.2f}s\t{trial['resource']}\t{trial['parameters']}")
+
+    def search(self, estimator, X: np.ndarray, y: np.ndarray, param_grid: Dict,
+               search_space: Union[None, Dict] = None, resource: str = "n_samples") -> Tuple:
+        """
+        This function tunes the hyperparameters of an estimator with the configured strategy.
+        Models without a search space are tuned on their param_grid with an exhaustive grid search.
+        :param estimator: Estimator to be tuned
+        :param X: Training matrix
+        :param y: Training labels
+        :param param_grid: Grid for the grid search
+        :param search_space: Parameter to choices or (kind, low, high), for halving and bayesian searches
+        :param resource: What successive halving grows, n_samples or a parameter such as n_estimators
+        :return: Refitted best estimator, best parameters and best cross validated score.
+        """
+
+        self.trials = []
+
+        strategy = self.strategy if search_space else "grid"
+
+        print(f"Hyperparameter search: {strategy}")
+
+        if strategy == "halving":
+            result = self.search_halving(estimator, search_space, X, y, resource)
+        elif strategy == "bayesian":
+            result = self.search_bayesian(estimator, search_space, X, y)
+        else:
+            result = self.search_grid(estimator, param_grid, X, y)
+
+        self.print_trials()
+
+        return result
@@ -0,0 +1,146 @@
+import hashlib
+import os
+from typing import Iterator, List
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from config import PATH_TO_RAW_DATA, PATH_TO_RAW_CACHE, RAW_DATA_CHUNK_SIZE
+
+# Raw workbook has a title row above the header row
+HEADER_ROW = 1
+
+
+def _iter_xls_rows(path: str) -> Iterator[List]:
+    import xlrd
+
+    # on_demand keeps other sheets unparsed, xls (BIFF) has no way to parse a sheet partially
+    workbook = xlrd.open_workbook(path, on_demand=True)
+    try:
+        sheet = workbook.sheet_by_index(0)
+        for row_index in range(sheet.nrows):
+            yield sheet.row_values(row_index)
+    finally:
+        workbook.release_resources()
+
+
+def _iter_xlsx_rows(path: str) -> Iterator[List]:
+    import openpyxl
+
+    # Read only mode streams rows straight from the xml without building the sheet in memory
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in workbook.worksheets[0].iter_rows(values_only=True):
+            yield list(row)
+    finally:
+        workbook.close()
+
+
+def iter_raw_data_chunks(path: str = PATH_TO_RAW_DATA, chunk_size: int = RAW_DATA_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    This function streams the raw workbook in chunks of rows, for workbooks too big to parse in one go.
+    Numeric cells are returned as floats, use read_raw_data for the same dtypes pd.read_excel would give.
+    :param path: Path to the raw workbook (xls or xlsx)
+    :param chunk_size: Number of rows per chunk
+    :return: Iterator over data frames with the raw column names.
+    """
+
+    rows = _iter_xls_rows(path) if path.lower().endswith(".xls") else _iter_xlsx_rows(path)
+
+    header = None
+    chunk = []
+
+    for row_index, row in enumerate(rows):
+        if row_index < HEADER_ROW:
+            continue
+
+        if row_index == HEADER_ROW:
+            header = [str(value) for value in row]
+            continue
+
+        chunk.append(row)
+
+        if len(chunk) == chunk_size:
+            yield pd.DataFrame(chunk, columns=header, dtype=float)
+            chunk = []
+
+    if chunk or header is None:
+        yield pd.DataFrame(chunk, columns=header, dtype=float)
+
+
+def raw_data_key(path: str = PATH_TO_RAW_DATA) -> str:
+    """
+    This function derives the cache key of the raw workbook from its size, modification time and content.
+    :param path: Path to the raw workbook
+    :return: Hex digest of the workbook.
+    """
+
+    raw_data_stat = os.stat(path)
+
+    digest = hashlib.sha256(f"{raw_data_stat.st_size}-{raw_data_stat.st_mtime_ns}".encode())
+
+    with open(path, "rb") as raw_file:
+        for block in iter(lambda: raw_file.read(2 ** 20), b""):
+            digest.update(block)
+
+    return digest.hexdigest()
+
+
+def _restore_integer_columns(data: pd.DataFrame) -> pd.DataFrame:
+    # Spreadsheets store every number as a double, whole number columns become integers like in pd.read_excel
+    for current_column in data.columns:
+        values = data[current_column]
+        if pd.api.types.is_float_dtype(values.dtype) and values.notna().all() and (values == values.round()).all():
+            data[current_column] = values.astype("int64")
+
+    return data
+
+
+def build_raw_data_cache(path: str = PATH_TO_RAW_DATA, chunk_size: int = RAW_DATA_CHUNK_SIZE) -> str:
+    """
+    This function converts the raw workbook into a columnar cache, chunk by chunk.
+    :param path: Path to the raw workbook
+    :param chunk_size: Number of rows converted at once
+    :return: Path to the cached data.
+    """
+
+    os.makedirs(PATH_TO_RAW_CACHE, exist_ok=True)
+
+    cache_path = os.path.join(PATH_TO_RAW_CACHE, f"{raw_data_key(path)}.parquet")
+
+    if os.path.exists(cache_path):
+        return cache_path
+
+    print("Converting raw data to columnar cache...")
+
+    temporary_path = f"{cache_path}.tmp"
+    writer = None
+
+    try:
+        for chunk in iter_raw_data_chunks(path, chunk_size):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+            if writer is None:
+                writer = pq.ParquetWriter(temporary_path, table.schema, compression="zstd")
+
+            writer.write_table(table)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    os.replace(temporary_path, cache_path)
+
+    print("Raw data has been converted.")
+
+    return cache_path
+
+
+def read_raw_data(path: str = PATH_TO_RAW_DATA) -> pd.DataFrame:
+    """
+    This function reads the raw workbook through the columnar cache, the workbook is only parsed when it changes.
+    :param path: Path to the raw workbook
+    :return: Raw data, same as pd.read_excel(path, header=[1]).
+    """
+
+    return _restore_integer_columns(pq.read_table(build_raw_data_cache(path)).to_pandas())
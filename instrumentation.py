@@ -0,0 +1,425 @@
+import functools
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Tuple, Union
+
+from config import PATH_TO_TRACE, TRACING
+from profiling import start_profiling, stop_profiling
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# How often the resident memory of the open spans is sampled (seconds)
+MEMORY_SAMPLING_INTERVAL = 0.01
+
+# /proc/self/statm stays open, it is reopened by forked processes, as it keeps pointing at the opening process
+_statm = None
+_statm_pid = None
+
+
+def resident_memory() -> int:
+    """
+    This function reads the current resident memory of the process.
+    :return: Resident memory in bytes, the peak so far where /proc is not available.
+    """
+
+    global _statm, _statm_pid
+
+    try:
+        if _statm is None or _statm_pid != os.getpid():
+            _statm = os.open("/proc/self/statm", os.O_RDONLY)
+            _statm_pid = os.getpid()
+        return int(os.pread(_statm, 128, 0).split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        if resource is None:
+            return 0
+        # Linux reports kilobytes, macOS bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def data_shape(data) -> Tuple[Union[None, int], Union[None, int]]:
+    """
+    This function gives the number of rows and columns of a data frame, array or sparse matrix.
+    :param data: Data to be measured, anything else gives no shape
+    :return: Rows and columns, None where unknown.
+    """
+
+    shape = getattr(data, "shape", None)
+
+    if not isinstance(shape, tuple) or len(shape) == 0:
+        return None, None
+
+    return shape[0], shape[1] if len(shape) > 1 else 1
+
+
+class Span:
+    """
+    A timed step of a run. Spans nest, the enclosing span of a thread is the parent of the spans opened inside it.
+    """
+
+    def __init__(self, name: str, parent_id: Union[None, str] = None, depth: int = 0, data=None,
+                 attributes: Union[None, Dict] = None):
+
+        self.name = name
+        self.id = uuid.uuid4().hex[:16]
+        self.parent_id = parent_id
+        self.depth = depth
+
+        self.rows_in, self.columns_in = data_shape(data)
+        self.rows_out, self.columns_out = None, None
+        self.attributes = dict(attributes or {})
+
+        self.start = time.time()
+        self.peak_memory = resident_memory()
+        self.start_memory = self.peak_memory
+
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    def set(self, **attributes):
+        """
+        This function adds attributes to the span, e.g. the name of the evaluated model.
+        :return: This function returns nothing.
+        """
+
+        self.attributes.update(attributes)
+
+    def set_output(self, data):
+        """
+        This function records the shape of the output of the step.
+        :param data: Output of the step
+        :return: This function returns nothing.
+        """
+
+        self.rows_out, self.columns_out = data_shape(data)
+
+    def finish(self) -> Dict:
+        """
+        This function closes the span.
+        :return: Record of the span.
+        """
+
+        wall_seconds = time.perf_counter() - self._wall_start
+        cpu_seconds = time.process_time() - self._cpu_start
+
+        end_memory = resident_memory()
+        self.peak_memory = max(self.peak_memory, end_memory)
+
+        return {
+            "id": self.id,
+            "parent": self.parent_id,
+            "depth": self.depth,
+            "name": self.name,
+            "pid": os.getpid(),
+            "start": self.start,
+            "wall_seconds": wall_seconds,
+            "cpu_seconds": cpu_seconds,
+            "start_rss_mb": self.start_memory / 1024 ** 2,
+            "end_rss_mb": end_memory / 1024 ** 2,
+            "peak_rss_mb": self.peak_memory / 1024 ** 2,
+            "rows_in": self.rows_in,
+            "columns_in": self.columns_in,
+            "rows_out": self.rows_out,
+            "columns_out": self.columns_out,
+            **self.attributes
+        }
+
+
+class Tracer:
+    """
+    Writes the spans of a run to a JSON lines file, one line per finished span. Worker processes append to the same
+    file, under the span that started them. The memory of open spans is sampled by one background thread,
+    so a span costs some tens of microseconds.
+    """
+
+    def __init__(self, path: str = PATH_TO_TRACE, run_id: Union[None, str] = None,
+                 root_id: Union[None, str] = None, root_depth: int = -1):
+
+        self.path = path
+        self.run_id = run_id or uuid.uuid4().hex[:16]
+
+        # Outermost spans are children of the root, a span of the parent process in worker processes
+        self.root_id = root_id
+        self.root_depth = root_depth
+
+        self._local = threading.local()
+        self._open_spans: Dict[str, Span] = {}
+        self._lock = threading.Lock()
+        self._sampler: Union[None, threading.Thread] = None
+
+        # Trace file of the process that opened it, forked workers open their own
+        self._file = None
+        self._file_pid = None
+
+    def current_span(self) -> Union[None, Span]:
+        """
+        This function gives the innermost open span of the calling thread.
+        :return: The span, None if no span is open.
+        """
+
+        stack = self._stack()
+
+        return stack[-1] if stack else None
+
+    def _stack(self) -> List[Span]:
+        if not hasattr(self._local, "stack"):
+            self._local.stack = []
+        return self._local.stack
+
+    def _sample_memory(self):
+        while True:
+            time.sleep(MEMORY_SAMPLING_INTERVAL)
+
+            with self._lock:
+                if not self._open_spans:
+                    continue
+                open_spans = list(self._open_spans.values())
+
+            memory = resident_memory()
+            for open_span in open_spans:
+                open_span.peak_memory = max(open_span.peak_memory, memory)
+
+    def _write(self, record: Dict):
+        line = json.dumps({"run": self.run_id, **record}, default=str) + "\n"
+
+        with self._lock:
+            if self._file is None or self._file_pid != os.getpid():
+                # Line buffered appends write whole lines at once, which keeps lines of concurrent processes apart
+                self._file = open(self.path, "a", buffering=1)
+                self._file_pid = os.getpid()
+
+            self._file.write(line)
+
+    @contextmanager
+    def span(self, name: str, data=None, **attributes) -> Iterator[Span]:
+        """
+        This function records a step as a span.
+        :param name: Name of the step
+        :param data: Input of the step, its rows and columns are recorded
+        :param attributes: Further attributes of the span
+        :return: Context manager giving the open span.
+        """
+
+        # The sampler is started lazily, so forked worker processes get their own
+        if self._sampler is None or not self._sampler.is_alive():
+            self._sampler = threading.Thread(target=self._sample_memory, daemon=True)
+            self._sampler.start()
+
+        stack = self._stack()
+        if stack:
+            current_span = Span(name, stack[-1].id, stack[-1].depth + 1, data, attributes)
+        else:
+            current_span = Span(name, self.root_id, self.root_depth + 1, data, attributes)
+
+        stack.append(current_span)
+        with self._lock:
+            self._open_spans[current_span.id] = current_span
+
+        try:
+            yield current_span
+        except BaseException as exception:
+            current_span.set(error=type(exception).__name__)
+            raise
+        finally:
+            stack.pop()
+            with self._lock:
+                del self._open_spans[current_span.id]
+
+            self._write(current_span.finish())
+
+
+# Tracer of the current process, None while tracing is off
+_tracer: Union[None, Tracer] = None
+
+
+def start_trace(path: str = PATH_TO_TRACE) -> Union[None, Tracer]:
+    """
+    This function starts a new trace, spans of earlier runs in the trace file are dropped.
+    :param path: Path to the trace file
+    :return: The tracer, None if TRACING is off.
+    """
+
+    global _tracer
+
+    if not TRACING:
+        return None
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    open(path, "w").close()
+
+    _tracer = Tracer(path)
+
+    return _tracer
+
+
+def trace_settings() -> Union[None, Tuple]:
+    """
+    This function gives what a worker process needs to append to the current trace, under the current span.
+    :return: Trace path, run id, id and depth of the current span, None if nothing is traced.
+    """
+
+    if _tracer is None:
+        return None
+
+    current_span = _tracer.current_span()
+    if current_span is None:
+        return _tracer.path, _tracer.run_id, _tracer.root_id, _tracer.root_depth
+
+    return _tracer.path, _tracer.run_id, current_span.id, current_span.depth
+
+
+def join_trace(settings: Union[None, Tuple]):
+    """
+    This function makes a worker process append its spans to the trace of its parent process.
+    :param settings: Result of trace_settings in the parent process
+    :return: This function returns nothing.
+    """
+
+    global _tracer
+
+    _tracer = None if settings is None else Tracer(*settings)
+
+
+class _NoSpan:
+    # Stands in for a span while tracing is off
+    def set(self, **attributes):
+        pass
+
+    def set_output(self, data):
+        pass
+
+
+class _NoSpanContext:
+    def __enter__(self) -> _NoSpan:
+        return _NoSpan()
+
+    def __exit__(self, *exception):
+        return False
+
+
+@contextmanager
+def span(name: str, data=None, **attributes) -> Iterator[Union[Span, _NoSpan]]:
+    """
+    This function records a step as a span of the current trace, it does nothing if no trace is started.
+    Steps listed in PROFILED_STEPS are profiled as well, see profiling.py.
+    :param name: Name of the step
+    :param data: Input of the step, its rows and columns are recorded
+    :param attributes: Further attributes of the span
+    :return: Context manager giving the open span.
+    """
+
+    with (_NoSpanContext() if _tracer is None else _tracer.span(name, data, **attributes)) as current_span:
+        profiler = start_profiling(name, attributes, None if _tracer is None else _tracer.run_id)
+
+        if profiler is None:
+            yield current_span
+            return
+
+        try:
+            yield current_span
+        finally:
+            current_span.set(profiles=stop_profiling(profiler))
+
+
+def traced(method: Callable) -> Callable:
+    """
+    This decorator records a stage method as a span named <Stage>.<method>, with the shape of the data of the stage
+    before and after the method.
+    :param method: Method of a stage
+    :return: The decorated method.
+    """
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with span(f"{type(self).__name__}.{method.__name__}", getattr(self, "data", None)) as current_span:
+            result = method(self, *args, **kwargs)
+            current_span.set_output(getattr(self, "data", None))
+
+        return result
+
+    return wrapper
+
+
+def read_trace(path: str = PATH_TO_TRACE) -> List[Dict]:
+    """
+    This function reads the spans of a trace.
+    :param path: Path to the trace file
+    :return: Span records in the order they finished.
+    """
+
+    with open(path) as trace_file:
+        return [json.loads(line) for line in trace_file if line.strip()]
+
+
+def summarize_trace(records: List[Dict]) -> List[Dict]:
+    """
+    This function adds up the spans of every step, steps are listed in the order they started, each under
+    its enclosing step.
+    :param records: Span records
+    :return: One row per step: name, depth, count, wall/CPU seconds, peak memory and the last shapes seen.
+    """
+
+    records_by_id = {record["id"]: record for record in records}
+
+    def path_of(record: Dict) -> Tuple:
+        names = [record["name"]]
+        while record["parent"] in records_by_id:
+            record = records_by_id[record["parent"]]
+            names.append(record["name"])
+        return tuple(reversed(names))
+
+    rows: Dict[Tuple, Dict] = {}
+
+    for record in sorted(records, key=lambda current_record: current_record["start"]):
+        path = path_of(record)
+
+        if path not in rows:
+            rows[path] = {"name": record["name"], "depth": len(path) - 1, "count": 0, "wall_seconds": 0.0,
+                          "cpu_seconds": 0.0, "peak_rss_mb": 0.0}
+
+        row = rows[path]
+        row["count"] += 1
+        row["wall_seconds"] += record["wall_seconds"]
+        row["cpu_seconds"] += record["cpu_seconds"]
+        row["peak_rss_mb"] = max(row["peak_rss_mb"], record["peak_rss_mb"])
+        for key in ["rows_in", "columns_in", "rows_out", "columns_out"]:
+            row[key] = record[key]
+
+    # Children come right after their parent, siblings keep their start order
+    order = list(rows)
+    return [rows[path] for path in sorted(order, key=lambda path: [order.index(path[:index + 1])
+                                                                  for index in range(len(path))])]
+
+
+def print_trace_summary(path: str = PATH_TO_TRACE):
+    """
+    This function prints where the traced run spent its time and memory.
+    :param path: Path to the trace file
+    :return: This function returns nothing.
+    """
+
+    try:
+        records = read_trace(path)
+    except FileNotFoundError:
+        print(f"No such file {path}")
+        return
+
+    def shape(rows, columns) -> str:
+        return "" if rows is None else f"{rows}x{columns}"
+
+    print(f"\n{'Step':<60} {'Count':>6} {'Wall (s)':>10} {'CPU (s)':>10} {'Peak (MB)':>10} {'In':>14} {'Out':>14}")
+
+    for row in summarize_trace(records):
+        name = "  " * row["depth"] + row["name"]
+        print(f"{name[:60]:<60} {row['count']:>6} {row['wall_seconds']:>10.2f} {row['cpu_seconds']:>10.2f} "
+              f"{row['peak_rss_mb']:>10.1f} {shape(row['rows_in'], row['columns_in']):>14} "
+              f"{shape(row['rows_out'], row['columns_out']):>14}")
+
+    print(f"Trace: {path}")
@@ -1,26 +1,65 @@
-from balancing import DataBalancingStage
-from cleaning import DataCleaningStage
-from evaluate import EvaluationStage
-from feature_engineering import FeatureEngineeringStage
-from gathering import DataGatheringStage
-from preprocessing import PreprocessingStage
+import argparse
+
+from cache import StageCache
+from instrumentation import start_trace, print_trace_summary
+from pipeline import Pipeline
+from profiling import AVAILABLE_PROFILERS, configure_profiling, parse_profiled_step, profiling_settings
+from stages import STAGE_REGISTRY, create_stages
+
+# Parameters of the stages, stages left out use their defaults
+# Pass checkpoint=True to a stage to dump its output, so later stages can be run on their own
+STAGE_PARAMETERS = {
+    "cleaning": {"outlier_removal_method": 0},
+    "balancing": {"method": "adasyn"},  # random_undersample, smote, adasyn or streaming_undersample
+    "preprocessing": {"checkpoint": True}
+}
 
 if __name__ == '__main__':
-    data_gathering_stage = DataGatheringStage()
-    cleaning_stage = DataCleaningStage(outlier_removal_method=0)
-    balancing_stage = DataBalancingStage("adasyn") # random_undersample, smote or adasyn
-    feature_engineering_stage =FeatureEngineeringStage()
-    preprocesing_stage = PreprocessingStage()
-    model_evaluation_stage = EvaluationStage()
-
-    pipeline = [
-        #data_gathering_stage,
-        #cleaning_stage,
-        #balancing_stage,
-        #feature_engineering_stage,
-        #preprocesing_stage,
-        model_evaluation_stage
-    ]
-
-    for current_stage in pipeline:
-        current_stage.execute_stage()
+    parser = argparse.ArgumentParser(description="Run the pipeline, or some of its stages. Only the modules of the "
+                                                 "stages that run are imported.")
+    parser.add_argument("stages", nargs="*",
+                        help=f"Stages to run in order, every stage by default: {' '.join(STAGE_REGISTRY)}. "
+                             f"A pipeline not starting with gathering reads the last checkpoint.")
+    parser.add_argument("--balancing", default=None, help="Balancing method, overrides STAGE_PARAMETERS")
+    parser.add_argument("--no-cache", action="store_true", help="Run every stage instead of restoring cached ones")
+    parser.add_argument("--profile", action="append", default=[], metavar="STEP[:KEY=VALUE,...]",
+                        help="Profile a step (span name of the trace summary), only its spans with the given "
+                             "attributes, e.g. --profile FeatureEngineeringStage or "
+                             "--profile \"EvaluationStage.evaluate_model:model=Random Forest\". Can be repeated, "
+                             "replaces PROFILED_STEPS")
+    parser.add_argument("--profiler", choices=AVAILABLE_PROFILERS, default=None, help="Profiler, overrides PROFILER")
+    parser.add_argument("--profile-allocations", action=argparse.BooleanOptionalAction, default=None,
+                        help="Track allocations of profiled steps, overrides PROFILE_ALLOCATIONS")
+    arguments = parser.parse_args()
+
+    stage_names = arguments.stages or list(STAGE_REGISTRY)
+
+    unknown_stages = [name for name in stage_names if name not in STAGE_REGISTRY]
+    if unknown_stages:
+        parser.error(f"Unknown stages {unknown_stages}, expected some of {list(STAGE_REGISTRY)}")
+
+    if arguments.balancing is not None:
+        STAGE_PARAMETERS["balancing"] = {**STAGE_PARAMETERS.get("balancing", {}), "method": arguments.balancing}
+
+    if arguments.profile:
+        try:
+            profiled_steps = dict(parse_profiled_step(step) for step in arguments.profile)
+        except ValueError as error:
+            parser.error(str(error))
+    else:
+        profiled_steps, _, _ = profiling_settings()
+
+    configure_profiling(profiled_steps, arguments.profiler, arguments.profile_allocations)
+
+    # Every stage and step is timed, see PATH_TO_TRACE, nothing is traced with TRACING off
+    tracer = start_trace()
+
+    # Unchanged stages are restored from the stage cache, only the stages after the first change are recomputed
+    pipeline = Pipeline(create_stages(stage_names, STAGE_PARAMETERS),
+                        cache=None if arguments.no_cache else StageCache())
+
+    pipeline.run()
+
+    # Without a tracer the trace file is left over from an earlier run, if there is one at all
+    if tracer is not None:
+        print_trace_summary(tracer.path)
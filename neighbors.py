@@ -0,0 +1,361 @@
+import glob
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Dict, Tuple, Union
+
+import numpy as np
+from scipy.sparse import csr_matrix
+from sklearn.neighbors import NearestNeighbors, KNeighborsTransformer
+
+from config import PATH_TO_NEIGHBOR_GRAPHS, NEIGHBOR_GRAPHS_SIZE_LIMIT, NEIGHBOR_ALGORITHM, NEIGHBOR_N_JOBS
+
+# Recently used graphs of the current process, so consumers within one run do not read the disk cache twice
+# and every candidate of a hyperparameter search reuses the graphs of its folds
+_loaded_graphs: OrderedDict = OrderedDict()
+LOADED_GRAPHS_MEMORY_LIMIT = 2 ** 30
+
+
+def array_key(X: np.ndarray) -> str:
+    """
+    This function hashes the content of an array, a dataset version is identified by it.
+    :param X: Array to be hashed
+    :return: Hex digest of the array.
+    """
+
+    X = np.ascontiguousarray(X)
+
+    digest = hashlib.sha256(json.dumps([str(X.dtype), X.shape]).encode())
+    digest.update(X.data)
+
+    return digest.hexdigest()
+
+
+def clear_loaded_graphs():
+    """
+    This function forgets the graphs kept in memory, the next consumers read them from disk or build them again.
+    :return: This function returns nothing.
+    """
+
+    _loaded_graphs.clear()
+
+
+def evict_neighbor_graphs(directory: str = PATH_TO_NEIGHBOR_GRAPHS, size_limit: int = NEIGHBOR_GRAPHS_SIZE_LIMIT,
+                          keep: Union[None, str] = None):
+    """
+    This function removes least recently used graphs until the disk cache fits into its size limit.
+    :param directory: Directory of the cached graphs
+    :param size_limit: Size limit of the cached graphs (bytes)
+    :param keep: Path of a graph that is never evicted
+    :return: This function returns nothing.
+    """
+
+    entries = []
+
+    for file_name in os.listdir(directory):
+        path = os.path.join(directory, file_name)
+
+        if not file_name.endswith(".npz") or ".tmp-" in file_name:
+            continue
+
+        try:
+            graph_stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+
+        entries.append((graph_stat.st_mtime, graph_stat.st_size, path))
+
+    total_size = sum(size for _, size, _ in entries)
+
+    for _, size, path in sorted(entries):
+        if total_size <= size_limit:
+            break
+
+        if path == keep:
+            continue
+
+        print(f"Evicting cached neighbor graph {os.path.basename(path)}")
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+
+def _to_graph(distances: np.ndarray, indices: np.ndarray, num_columns: int) -> csr_matrix:
+    num_rows, n_neighbors = indices.shape
+    indptr = np.arange(0, num_rows * n_neighbors + 1, n_neighbors)
+
+    return csr_matrix((distances.ravel(), indices.ravel(), indptr), shape=(num_rows, num_columns))
+
+
+class NeighborGraph:
+    """
+    k nearest neighbor graph of one dataset version, built once and shared by every consumer of that version.
+    Rows can be grouped into subsets (e.g. classes), neighbors of a subset are searched within the subset only.
+    Neighbors of a row include the row itself, like NearestNeighbors.kneighbors(X) on the fitted X.
+    Graphs of a persisted dataset version are cached on disk, others (e.g. cross validation folds) only in memory.
+    """
+
+    def __init__(self, X: np.ndarray, subsets: Union[None, Dict] = None, algorithm: str = NEIGHBOR_ALGORITHM,
+                 n_jobs: int = NEIGHBOR_N_JOBS, persist: bool = True, directory: str = PATH_TO_NEIGHBOR_GRAPHS,
+                 size_limit: int = NEIGHBOR_GRAPHS_SIZE_LIMIT):
+
+        self.X = np.ascontiguousarray(X)
+        self.algorithm = algorithm
+        self.n_jobs = n_jobs
+        self.persist = persist
+        self.directory = directory
+        self.size_limit = size_limit
+
+        self.key = array_key(self.X)
+
+        # Subset name to its sorted rows, subsets are also recognized by the hash of their rows of X
+        self.subsets: Dict = {None: np.arange(len(self.X))}
+        self._subset_names: Dict[str, object] = {self.key: None}
+
+        # Search structure of each subset, only built for queries of other points
+        self._indexes: Dict = {}
+
+        for name, rows in (subsets or {}).items():
+            self.add_subset(name, rows)
+
+        if self.persist:
+            os.makedirs(self.directory, exist_ok=True)
+
+    def __deepcopy__(self, memo):
+        # Graphs are never modified, so copies made by sklearn's clone can share one
+        return self
+
+    def __getstate__(self) -> Dict:
+        # Search structures are cheap to rebuild next to the neighbor queries they serve
+        state = self.__dict__.copy()
+        state["_indexes"] = {}
+
+        return state
+
+    def add_subset(self, name, rows: np.ndarray):
+        """
+        This function registers a subset of the rows, e.g. the rows of a class.
+        :param name: Name of the subset
+        :param rows: Rows of the subset
+        :return: This function returns nothing.
+        """
+
+        rows = np.sort(np.asarray(rows))
+
+        self.subsets[name] = rows
+        self._subset_names[array_key(self.X[rows])] = name
+
+    def find_subset(self, X: np.ndarray):
+        """
+        This function finds the subset whose rows are exactly the given array.
+        :param X: Rows of the dataset
+        :return: Name of the subset (None for the whole dataset), raises KeyError if X is not a known subset.
+        """
+
+        X = np.asarray(X)
+
+        if X.shape[1:] != self.X.shape[1:]:
+            raise KeyError("Not a subset of the neighbor graph")
+
+        return self._subset_names[array_key(X.astype(self.X.dtype, copy=False))]
+
+    def _cached(self, name: str, n_neighbors: int, compute, persist: bool) -> Tuple[np.ndarray, np.ndarray]:
+        # Cached neighbors are stored as <name>-<n_neighbors>.npz, a graph with more neighbors serves fewer
+        name = hashlib.sha256(f"{name}-{self.algorithm}".encode()).hexdigest()
+        path = os.path.join(self.directory, f"{name}-{n_neighbors}.npz")
+
+        for loaded_path in list(_loaded_graphs):
+            if os.path.basename(loaded_path).startswith(f"{name}-") and \
+                    _loaded_graphs[loaded_path][1].shape[1] >= n_neighbors:
+                _loaded_graphs.move_to_end(loaded_path)
+                distances, indices = _loaded_graphs[loaded_path]
+                return distances[:, :n_neighbors], indices[:, :n_neighbors]
+
+        for cached_path in glob.glob(os.path.join(self.directory, f"{name}-*.npz")) if persist else []:
+            if int(os.path.basename(cached_path)[len(name) + 1:-len(".npz")]) >= n_neighbors:
+                path = cached_path
+                with np.load(path) as graph:
+                    distances, indices = graph["distances"], graph["indices"]
+                # Marks the graph as recently used for the eviction
+                os.utime(path)
+                print(f"Reusing cached neighbor graph ({len(indices)} rows, {indices.shape[1]} neighbors).")
+                break
+        else:
+            distances, indices = compute()
+
+            if persist:
+                print(f"Built neighbor graph ({len(indices)} rows, {n_neighbors} neighbors).")
+                temporary_path = os.path.join(self.directory, f"{name}.tmp-{n_neighbors}.npz")
+                np.savez(temporary_path, distances=distances, indices=indices)
+                os.replace(temporary_path, path)
+
+                evict_neighbor_graphs(self.directory, self.size_limit, keep=path)
+
+        _loaded_graphs[path] = distances, indices
+        while len(_loaded_graphs) > 1 and sum(graph[0].nbytes + graph[1].nbytes
+                                              for graph in _loaded_graphs.values()) > LOADED_GRAPHS_MEMORY_LIMIT:
+            _loaded_graphs.popitem(last=False)
+
+        return distances[:, :n_neighbors], indices[:, :n_neighbors]
+
+    def index(self, subset=None) -> NearestNeighbors:
+        """
+        This function gives the search structure of a subset.
+        :param subset: Name of the subset, the whole dataset if None
+        :return: NearestNeighbors fitted on the rows of the subset.
+        """
+
+        if subset not in self._indexes:
+            self._indexes[subset] = NearestNeighbors(algorithm=self.algorithm, n_jobs=self.n_jobs)
+            self._indexes[subset].fit(self.X[self.subsets[subset]])
+
+        return self._indexes[subset]
+
+    def kneighbors(self, subset=None, n_neighbors: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This function gives the neighbors of every row of a subset among the subset, the row itself included.
+        :param subset: Name of the subset, the whole dataset if None
+        :param n_neighbors: Number of neighbors, the row itself included
+        :return: Distances and indices (positions within the subset) of the neighbors, sorted by distance.
+        """
+
+        rows = self.subsets[subset]
+        subset_key = self.key if subset is None else array_key(rows)
+
+        return self._cached(f"{self.key}-{subset_key}", n_neighbors,
+                            lambda: self.index(subset).kneighbors(self.X[rows], n_neighbors), persist=self.persist)
+
+    def query(self, X: np.ndarray, subset=None, n_neighbors: int = 5) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This function gives the neighbors of other points among a subset. Queried points are usually one-off
+        (new batches, permuted columns), so their neighbors are only kept in memory.
+        :param X: Points to be queried
+        :param subset: Name of the subset, the whole dataset if None
+        :param n_neighbors: Number of neighbors
+        :return: Distances and indices (positions within the subset) of the neighbors, sorted by distance.
+        """
+
+        rows = self.subsets[subset]
+        subset_key = self.key if subset is None else array_key(rows)
+
+        return self._cached(f"{self.key}-{subset_key}-{array_key(X)}", n_neighbors,
+                            lambda: self.index(subset).kneighbors(X, n_neighbors), persist=False)
+
+    def kneighbors_graph(self, subset=None, n_neighbors: int = 5) -> csr_matrix:
+        """
+        This function gives the neighbors of a subset as a sparse distance graph, for estimators with
+        metric="precomputed". Self distances are stored as explicit zeros.
+        :param subset: Name of the subset, the whole dataset if None
+        :param n_neighbors: Number of neighbors, the row itself included
+        :return: CSR distance graph (subset rows x subset rows).
+        """
+
+        distances, indices = self.kneighbors(subset, n_neighbors)
+
+        return _to_graph(distances, indices, len(self.subsets[subset]))
+
+    def query_graph(self, X: np.ndarray, subset=None, n_neighbors: int = 5) -> csr_matrix:
+        """
+        This function gives the neighbors of other points as a sparse distance graph.
+        :param X: Points to be queried
+        :param subset: Name of the subset, the whole dataset if None
+        :param n_neighbors: Number of neighbors
+        :return: CSR distance graph (points x subset rows).
+        """
+
+        distances, indices = self.query(X, subset, n_neighbors)
+
+        return _to_graph(distances, indices, len(self.subsets[subset]))
+
+
+class GraphNeighbors(NearestNeighbors):
+    """
+    NearestNeighbors answering from a NeighborGraph when it is fitted on, and queried with, subsets of the graph.
+    Other data falls back to an ordinary neighbor search. Imbalanced-learn samplers take it as k_neighbors.
+    """
+
+    def __init__(self, n_neighbors: int = 5, *, graph: Union[None, NeighborGraph] = None,
+                 algorithm: str = NEIGHBOR_ALGORITHM, n_jobs: int = NEIGHBOR_N_JOBS):
+
+        super().__init__(n_neighbors=n_neighbors, algorithm=algorithm, n_jobs=n_jobs)
+
+        self.graph = graph
+
+    def fit(self, X, y=None):
+        self.fitted_subset_ = None
+        self.fitted_on_graph_ = False
+
+        if self.graph is not None:
+            try:
+                self.fitted_subset_ = self.graph.find_subset(X)
+                self.fitted_on_graph_ = True
+                self.n_samples_fit_ = len(X)
+                return self
+            except KeyError:
+                pass
+
+        return super().fit(X, y)
+
+    def kneighbors(self, X=None, n_neighbors=None, return_distance=True):
+        if n_neighbors is None:
+            n_neighbors = self.n_neighbors
+
+        if not self.fitted_on_graph_:
+            return super().kneighbors(X, n_neighbors, return_distance)
+
+        fitted_rows = self.graph.subsets[self.fitted_subset_]
+
+        try:
+            query_rows = self.graph.subsets[self.graph.find_subset(X)]
+            positions = np.searchsorted(fitted_rows, query_rows)
+            if not np.array_equal(fitted_rows[np.minimum(positions, len(fitted_rows) - 1)], query_rows):
+                raise KeyError("Queried rows are not among the fitted rows")
+
+            distances, indices = self.graph.kneighbors(self.fitted_subset_, n_neighbors)
+            distances, indices = distances[positions], indices[positions]
+        except KeyError:
+            # Other points (or X=None, where NearestNeighbors leaves the points themselves out) are searched as usual
+            super().fit(self.graph.X[fitted_rows])
+            self.fitted_on_graph_ = False
+
+            return super().kneighbors(X, n_neighbors, return_distance)
+
+        if return_distance:
+            return distances, indices
+
+        return indices
+
+
+class GraphTransformer(KNeighborsTransformer):
+    """
+    KNeighborsTransformer with cached graphs. Combined with KNeighborsClassifier(metric="precomputed"), every grid
+    point and repeated run reuses the graph of a fold instead of searching the neighbors again.
+    """
+
+    def fit(self, X, y=None):
+        if self.mode != "distance":
+            raise ValueError("GraphTransformer only builds distance graphs")
+
+        # The search structure is built by the graph, and only if other points are queried. Folds are one-off
+        # dataset versions, their graphs are kept in memory for the candidates of a search but never written to disk
+        self.graph_ = NeighborGraph(X, algorithm=self.algorithm, n_jobs=self.n_jobs, persist=False)
+
+        self.n_features_in_ = self.graph_.X.shape[1]
+        self.n_samples_fit_ = len(self.graph_.X)
+
+        return self
+
+    def transform(self, X):
+        # Every sample of the fitted data is its own neighbor, hence the extra one
+        n_neighbors = self.n_neighbors + 1
+
+        if X is self.graph_.X or (X.shape == self.graph_.X.shape and array_key(X) == self.graph_.key):
+            return self.graph_.kneighbors_graph(None, n_neighbors)
+
+        return self.graph_.query_graph(X, None, n_neighbors)
+
+    def fit_transform(self, X, y=None):
+        return self.fit(X, y).transform(X)
@@ -0,0 +1,152 @@
+import os
+from typing import List, Union
+
+import joblib
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+from sklearn.ensemble import IsolationForest
+from sklearn.neighbors import LocalOutlierFactor
+
+from neighbors import NeighborGraph
+from config import PATH_TO_OUTLIER_DETECTOR, OUTLIER_FEATURES, OUTLIER_N_JOBS, OUTLIER_SAMPLE_SIZE, \
+    OUTLIER_CHUNK_SIZE, RANDOM_SEED
+
+# lof:              Local outlier factor over the shared neighbor graph, built with a kd-tree
+#                   (ball tree above KD_TREE_MAX_DIMENSIONS features)
+# isolation_forest: Isolation forest fitted on a sample of at most sample_size rows
+AVAILABLE_METHODS = ["lof", "isolation_forest"]
+
+# kd-trees lose their edge over ball trees in high dimensions
+KD_TREE_MAX_DIMENSIONS = 30
+
+# Neighbors used by the local outlier factor, the default of LocalOutlierFactor
+LOF_NEIGHBORS = 20
+
+
+class OutlierDetector:
+    """
+    Outlier detector over an explicit list of features, the target variable is never one of them,
+    so the fitted detector can filter new batches without refitting.
+    """
+
+    def __init__(self, method: str = "lof", features: Union[None, List[str]] = OUTLIER_FEATURES,
+                 target_variable: str = "DEFAULT", n_jobs: int = OUTLIER_N_JOBS,
+                 sample_size: int = OUTLIER_SAMPLE_SIZE, chunk_size: int = OUTLIER_CHUNK_SIZE):
+
+        if method not in AVAILABLE_METHODS:
+            raise ValueError(f"Unknown outlier removal method {method}, expected one of {AVAILABLE_METHODS}")
+
+        self.method = method
+        self.features = features
+        self.target_variable = target_variable
+        self.n_jobs = n_jobs
+        self.sample_size = sample_size
+        self.chunk_size = chunk_size
+
+        self.detector: Union[None, LocalOutlierFactor, IsolationForest] = None
+        self.neighbor_graph: Union[None, NeighborGraph] = None
+
+    def feature_matrix(self, data: pd.DataFrame, start: int = 0, end: Union[None, int] = None) -> np.ndarray:
+        """
+        This function picks the detector features of a range of rows.
+        :param data: Data with the detector features
+        :param start: First row
+        :param end: Row after the last row, the last row of the data if None
+        :return: Feature matrix of the rows.
+        """
+
+        return data[self.features].iloc[start:end].to_numpy(dtype=np.float64)
+
+    def fit(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        This function fits the detector on the data.
+        :param data: Training data
+        :return: Outlier labels of the training data, -1 for outliers and 1 for inliers.
+        """
+
+        if self.features is None:
+            self.features = [column for column in data.columns if column != self.target_variable]
+
+        if self.target_variable in self.features:
+            raise ValueError(f"Target variable {self.target_variable} cannot be an outlier detection feature")
+
+        print(f"Outlier detection features: {self.features}")
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+
+        if self.method == "lof":
+            algorithm = "kd_tree" if len(self.features) <= KD_TREE_MAX_DIMENSIONS else "ball_tree"
+            print(f"Fitting local outlier factor over a {algorithm} on {len(data)} rows...")
+
+            # Neighbors come from the shared neighbor graph, novelty mode lets new batches be scored against it
+            self.neighbor_graph = NeighborGraph(self.feature_matrix(data), algorithm=algorithm, n_jobs=self.n_jobs)
+
+            self.detector = LocalOutlierFactor(n_neighbors=LOF_NEIGHBORS, metric="precomputed", novelty=True)
+            self.detector.fit(self.neighbor_graph.kneighbors_graph(None, LOF_NEIGHBORS + 1))
+
+            # Training rows are labeled by their own outlier factors, exactly like fit_predict does
+            return np.where(self.detector.negative_outlier_factor_ < self.detector.offset_, -1, 1)
+
+        sample = data
+        if len(data) > self.sample_size:
+            sample = data.sample(n=self.sample_size, random_state=random_state)
+
+        print(f"Fitting isolation forest on {len(sample)} of {len(data)} rows...")
+
+        self.detector = IsolationForest(random_state=random_state, n_jobs=self.n_jobs)
+        self.detector.fit(self.feature_matrix(sample))
+
+        return self.predict(data)
+
+    def predict(self, data: pd.DataFrame) -> np.ndarray:
+        """
+        This function labels the rows of a batch. Isolation forest scores chunks of rows in parallel,
+        local outlier factor queries the neighbor graph of the training rows, which searches in parallel itself.
+        :param data: Batch with the detector features
+        :return: Outlier labels, -1 for outliers and 1 for inliers.
+        """
+
+        if self.method == "lof":
+            # Distances from the batch to the training rows, LOF works on precomputed neighbors
+            return self.detector.predict(self.neighbor_graph.query_graph(self.feature_matrix(data), None,
+                                                                         LOF_NEIGHBORS))
+
+        chunks = range(0, len(data), self.chunk_size)
+
+        labels = Parallel(n_jobs=self.n_jobs)(
+            delayed(self.detector.predict)(self.feature_matrix(data, start, start + self.chunk_size))
+            for start in chunks)
+
+        return np.concatenate(labels) if labels else np.empty(0, dtype=int)
+
+    def remove_outliers(self, data: pd.DataFrame) -> pd.DataFrame:
+        """
+        This function drops the outliers of a new batch.
+        :param data: Batch with the detector features
+        :return: Inliers of the batch.
+        """
+
+        return data[self.predict(data) == 1]
+
+    def save(self, path: str = PATH_TO_OUTLIER_DETECTOR):
+        """
+        This function stores the fitted detector.
+        :param path: Path to the detector file
+        :return: This function returns nothing.
+        """
+
+        temporary_path = f"{path}.tmp"
+        joblib.dump(self, temporary_path)
+
+        os.replace(temporary_path, path)
+
+    @staticmethod
+    def load(path: str = PATH_TO_OUTLIER_DETECTOR) -> "OutlierDetector":
+        """
+        This function loads a fitted detector.
+        :param path: Path to the detector file
+        :return: The fitted detector.
+        """
+
+        return joblib.load(path)
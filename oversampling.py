@@ -0,0 +1,175 @@
+from typing import Callable, Union
+
+import numpy as np
+import pandas as pd
+from joblib import Parallel, delayed
+
+from config import BALANCING_CHUNK_SIZE, BALANCING_N_JOBS, RANDOM_SEED
+from neighbors import NeighborGraph
+
+# smote:  Synthetic rows between random minority rows and one of their k nearest minority neighbors
+# adasyn: Like smote, but minority rows surrounded by other classes get more synthetic rows
+AVAILABLE_METHODS = ["smote", "adasyn"]
+
+
+def restore_dtype(values: np.ndarray, dtype: np.dtype) -> np.ndarray:
+    """
+    This function casts interpolated values back to the dtype of their column. Integer columns, codes like SEX,
+    EDUCATION and PAY_1..PAY_6 among them, are rounded to the nearest integer first, so synthetic rows only take
+    values between the codes of the rows they were interpolated from.
+    :param values: Values of the column
+    :param dtype: Dtype of the column in the input data
+    :return: Values in the dtype of the column.
+    """
+
+    if np.issubdtype(dtype, np.integer) or np.issubdtype(dtype, np.bool_):
+        return np.rint(values).astype(dtype)
+
+    return values.astype(dtype, copy=False)
+
+
+class ChunkedOversampler:
+    """
+    SMOTE / ADASYN oversampler generating synthetic rows chunk by chunk, straight into a preallocated output.
+    Only the rows, neighbors and random draws of one chunk are held besides the output, and every chunk has its
+    own seed, so the result does not depend on the number of jobs.
+    """
+
+    def __init__(self, method: str = "smote", k_neighbors: int = 5, chunk_size: int = BALANCING_CHUNK_SIZE,
+                 n_jobs: int = BALANCING_N_JOBS):
+
+        if method not in AVAILABLE_METHODS:
+            raise ValueError(f"Unknown oversampling method {method}, expected one of {AVAILABLE_METHODS}")
+
+        self.method = method
+        self.k_neighbors = k_neighbors
+        self.chunk_size = chunk_size
+        self.n_jobs = n_jobs
+
+    def samples_per_row(self, graph: NeighborGraph, y: np.ndarray, label, num_samples: int) -> np.ndarray:
+        """
+        This function decides how many synthetic rows ADASYN derives from every row of a class.
+        :param graph: Neighbor graph of every row
+        :param y: Target variable
+        :param label: Class to be oversampled
+        :param num_samples: Number of synthetic rows wanted for the class
+        :return: Number of synthetic rows per row of the class.
+        """
+
+        _, indices = graph.kneighbors(None, self.k_neighbors + 1)
+
+        # Share of the neighbors (the row itself left out) that belong to another class
+        ratio = (y[indices[graph.subsets[label], 1:]] != label).sum(axis=1) / self.k_neighbors
+
+        if not ratio.sum():
+            raise ValueError(f"No neighbor of class {label} belongs to another class, ADASYN is not suited "
+                             f"for this data, use SMOTE instead")
+
+        return np.rint(ratio / ratio.sum() * num_samples).astype(int)
+
+    def generate_chunk(self, X_class: np.ndarray, neighbors: np.ndarray, start: int, end: int,
+                       cumulative_samples: Union[None, np.ndarray], seed: np.random.SeedSequence,
+                       output: np.ndarray):
+        """
+        This function writes synthetic rows start..end of a class into the output.
+        :param X_class: Rows of the class
+        :param neighbors: k nearest neighbors of every row of the class, positions within the class
+        :param start: First synthetic row of the chunk
+        :param end: Synthetic row after the last one of the chunk
+        :param cumulative_samples: Running total of synthetic rows per class row (ADASYN), None for SMOTE
+        :param seed: Seed of the chunk
+        :param output: Output rows of the chunk
+        :return: This function returns nothing.
+        """
+
+        random_generator = np.random.default_rng(seed)
+
+        if cumulative_samples is None:
+            rows = random_generator.integers(0, len(X_class), end - start)
+        else:
+            rows = np.searchsorted(cumulative_samples, np.arange(start, end), side="right")
+
+        columns = random_generator.integers(0, neighbors.shape[1], end - start)
+        steps = random_generator.uniform(size=(end - start, 1))
+
+        base = X_class[rows]
+        output[:] = base + steps * (X_class[neighbors[rows, columns]] - base)
+
+    def fit_resample(self, data: pd.DataFrame, target_variable: str = "DEFAULT",
+                     graph_factory: Union[None, Callable[[np.ndarray, np.ndarray], NeighborGraph]] = None
+                     ) -> pd.DataFrame:
+        """
+        This function oversamples every class to the size of the majority class.
+        :param data: Data to be balanced
+        :param target_variable: Column with the classes
+        :param graph_factory: Builds the neighbor graph of the input features and classes (every class a subset),
+        e.g. the graph shared by a stage, a graph of its own is built if None
+        :return: Original rows followed by the synthetic rows of each class.
+        """
+
+        input_features = [column for column in data.columns if column != target_variable]
+        y = data[target_variable].to_numpy()
+
+        labels, counts = np.unique(y, return_counts=True)
+        samples_to_generate = {label: counts.max() - count for label, count in zip(labels, counts)}
+        num_rows = len(data) + sum(samples_to_generate.values())
+
+        # Original rows are copied in column by column, so no second full copy of the data is made
+        dtype = np.result_type(np.float32, *data[input_features].dtypes)
+        output = np.empty((num_rows, len(input_features)), dtype=dtype)
+        for column_index, column in enumerate(input_features):
+            output[:len(data), column_index] = data[column].to_numpy()
+
+        output_labels = np.empty(num_rows, dtype=y.dtype)
+        output_labels[:len(data)] = y
+
+        X = output[:len(data)]
+        if graph_factory is None:
+            graph = NeighborGraph(X, subsets={label: np.flatnonzero(y == label) for label in labels},
+                                  n_jobs=self.n_jobs)
+        else:
+            graph = graph_factory(X, y)
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+        seed_sequence = np.random.SeedSequence(random_state)
+
+        offset = len(data)
+
+        for label in labels:
+            num_samples = samples_to_generate[label]
+            if num_samples == 0:
+                continue
+
+            cumulative_samples = None
+            if self.method == "adasyn":
+                samples_per_row = self.samples_per_row(graph, y, label, num_samples)
+                cumulative_samples = np.cumsum(samples_per_row)
+                # Rounding may change the total, it never grows beyond the reserved rows though
+                num_samples = min(int(cumulative_samples[-1]), num_samples)
+
+            print(f"Generating {num_samples} synthetic rows of class {label} in chunks of {self.chunk_size}...")
+
+            X_class = X[graph.subsets[label]]
+            _, neighbors = graph.kneighbors(label, self.k_neighbors + 1)
+            neighbors = neighbors[:, 1:]
+
+            chunks = [(start, min(start + self.chunk_size, num_samples))
+                      for start in range(0, num_samples, self.chunk_size)]
+            seeds = seed_sequence.spawn(len(chunks))
+
+            # Chunks write into disjoint slices of the output, threads share it without copies
+            Parallel(n_jobs=self.n_jobs, prefer="threads")(
+                delayed(self.generate_chunk)(X_class, neighbors, start, end, cumulative_samples, seed,
+                                             output[offset + start:offset + end])
+                for (start, end), seed in zip(chunks, seeds))
+
+            output_labels[offset:offset + num_samples] = label
+            offset += num_samples
+
+        # ADASYN may round to fewer synthetic rows than reserved. Rows are interpolated in floating point,
+        # every column gets its own dtype back, like imblearn's samplers give
+        resampled = pd.DataFrame({column: restore_dtype(output[:offset, column_index], data[column].dtype)
+                                  for column_index, column in enumerate(input_features)})
+        resampled[target_variable] = output_labels[:offset]
+
+        return resampled
@@ -0,0 +1,85 @@
+from typing import List, Union
+
+import pandas as pd
+
+from cache import StageCache, fingerprint_data, stage_key
+from gathering import DataGatheringStage
+from instrumentation import span
+from storage import read_intermediate
+
+
+class Pipeline:
+
+    def __init__(self, stages: List, cache: Union[None, StageCache] = None):
+
+        self.stages = stages
+
+        self.cache = cache
+
+    def run(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        This function runs the stages in order, handing each stage's output to the next one in memory.
+        Stages only touch the disk if they were created with checkpoint=True. A stage may then return None, its output
+        is left in the intermediate store and the next stage reads it from there.
+        :param data: Input of the first stage, the first stage loads its own input if None
+        :return: Output of the last stage.
+        """
+
+        if self.cache is None:
+            for current_stage in self.stages:
+                with span(type(current_stage).__name__, data) as stage_span:
+                    data = current_stage.execute_stage(data)
+                    stage_span.set_output(data)
+
+            return data
+
+        return self.run_cached(data)
+
+    def run_cached(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        This function restores the longest cached prefix of the pipeline and recomputes the rest.
+        :param data: Input of the first stage, the first stage loads its own input if None
+        :return: Output of the last stage.
+        """
+
+        if data is None and not isinstance(self.stages[0], DataGatheringStage):
+            # Input comes from the intermediate store, it has to be hashed to be addressed
+            data = read_intermediate()
+
+        if data is None:
+            # Raw data is fingerprinted through the gathering stage parameters
+            input_key = "raw"
+        else:
+            input_key = fingerprint_data(data)
+
+        keys = []
+        for current_stage in self.stages:
+            input_key = stage_key(current_stage, input_key)
+            keys.append(input_key)
+
+        # Everything up to the last cached stage can be skipped
+        first_stage_to_run = 0
+        for index, key in enumerate(keys):
+            if self.cache.contains(key):
+                first_stage_to_run = index + 1
+
+        for index in range(first_stage_to_run):
+            stage_name = type(self.stages[index]).__name__
+
+            if index < first_stage_to_run - 1:
+                print(f"Skipping stage {stage_name}, a later stage is cached.")
+                continue
+
+            with span(stage_name, restored_from_cache=True) as stage_span:
+                print(f"Restoring stage {stage_name} from cache...")
+                data, log = self.cache.get(keys[index])
+                print(log, end="")
+                print(f"Restored stage {stage_name} from cache.")
+                stage_span.set_output(data)
+
+        for index in range(first_stage_to_run, len(self.stages)):
+            with span(type(self.stages[index]).__name__, data) as stage_span:
+                data = self.cache.execute_stage(self.stages[index], keys[index], data)
+                stage_span.set_output(data)
+
+        return data
@@ -1,13 +1,29 @@
+from typing import Union, Dict
+
 import pandas as pd
 
-from config import PATH_TO_TEMPORARY_DATA
+from config import PATH_TO_TEMPORARY_DATA, ONE_HOT_FORMAT
+from instrumentation import span, traced
+from schema import print_memory_usage
+from storage import read_intermediate, write_intermediate
+from transform import ScoringTransform
 
 
 class PreprocessingStage:
 
-    def __init__(self):
+    def __init__(self, checkpoint: bool = False, one_hot_format: str = ONE_HOT_FORMAT):
         self.data = pd.DataFrame
 
+        self.checkpoint = checkpoint
+
+        if one_hot_format not in ["dense", "sparse"]:
+            raise ValueError(f"Unknown one hot format {one_hot_format}, expected dense or sparse")
+
+        self.one_hot_format = one_hot_format
+
+        self.scoring_transform = ScoringTransform()
+
+    @traced
     def load_data(self):
         """
         This function reads the data produced by previous stage.
@@ -16,12 +32,13 @@ class PreprocessingStage:
 
         try:
             print("Loading data...")
-            self.data = pd.read_csv(PATH_TO_TEMPORARY_DATA)
+            self.data = read_intermediate()
             print("Data has been loaded.")
         except FileNotFoundError:
             print(f"No such file {PATH_TO_TEMPORARY_DATA}")
             quit()
 
+    @traced
     def dump_csv(self):
         """
         This function dumps the data for oncoming stages
@@ -29,65 +46,61 @@ class PreprocessingStage:
         """
         print("Dumping...")
 
-        self.data.to_csv(PATH_TO_TEMPORARY_DATA, index=False)
+        write_intermediate(self.data)
 
         print("Dumped.")
 
-    def group_unlabeled_values(self):
-
-        self.data["EDUCATION"] = self.data["EDUCATION"].replace([0, 5, 6], 4)
-
-        self.data["MARRIAGE"] = self.data["MARRIAGE"].replace([0], 3)
-
-    def normalize_columns(self):
-
-        columns_to_normalize = ["LIMIT_BAL", "AGE", "SEX", "MAX_DELAY", "LONGEST_STREAK",
-                                "BILL_AMT1","BILL_AMT2","BILL_AMT3","BILL_AMT4","BILL_AMT5","BILL_AMT6",
-                                "PAY_AMT1", "PAY_AMT2", "PAY_AMT3", "PAY_AMT4", "PAY_AMT5", "PAY_AMT6"]
-
-        for current_column in columns_to_normalize:
-            print(f"Normalizing {current_column}...")
-
-            min_value = self.data[current_column].min()
-            max_value = self.data[current_column].max()
-            self.data[current_column] = (self.data[current_column] - min_value) / (max_value - min_value)
-
-    def one_hot_encode_categorical_variables(self):
-        print("One hot encoding categorical variables...")
-
-        categorical_features = ["SEX", "EDUCATION", "MARRIAGE", "OVERPAID", "DELAYED", "OVERDRAFT"]
-
-        for current_feature in categorical_features:
-            print(f"Encoding {current_feature}...")
-
-            current_dummy = pd.get_dummies(self.data[current_feature], prefix=current_feature)
-
-            self.data = pd.concat([self.data, current_dummy], axis=1)
+    @traced
+    def preprocess(self):
+        """
+        This function fits the scoring transform on the data and preprocesses the data with it.
+        The fitted transform is saved, so new records can be scored without running the pipeline. The data is not
+        split into training and test rows yet, the transform is fitted on both.
+        :return: This function returns nothing.
+        """
 
-        self.data.drop(columns=categorical_features, inplace=True)
+        print("Fitting preprocessing transform...")
+        with span("ScoringTransform.fit", self.data):
+            self.scoring_transform.fit(self.data)
 
-        print("One hot encoding complete.")
+        print(f"Normalizing {list(self.scoring_transform.minimums)}...")
+        print(f"One hot encoding {list(self.scoring_transform.vocabularies)}...")
+        with span("ScoringTransform.transform_frame", self.data, one_hot_format=self.one_hot_format) as transform_span:
+            self.data = self.scoring_transform.transform_frame(self.data, sparse=self.one_hot_format == "sparse")
+            transform_span.set_output(self.data)
 
-    def preprocess(self):
+        self.scoring_transform.save()
+        print("Preprocessing transform saved.")
 
-        self.group_unlabeled_values()
-
-        self.normalize_columns()
+    def cache_parameters(self) -> Dict:
+        """
+        This function lists what the output of this stage depends on besides its input data and code.
+        :return: Parameters of the stage.
+        """
 
-        self.one_hot_encode_categorical_variables()
+        return {"one_hot_format": self.one_hot_format}
 
-    def execute_stage(self):
+    def execute_stage(self, data: Union[None, pd.DataFrame] = None) -> pd.DataFrame:
         """
         This function executes the current stage.
-        :return: This function returns nothing.
+        :param data: Output of the previous stage, it is loaded from disk if None
+        :return: Output of the current stage.
         """
 
         print("Beginning stage: Preprocessing")
 
-        self.load_data()
+        if data is None:
+            self.load_data()
+        else:
+            self.data = data
 
         self.preprocess()
 
-        self.dump_csv()
+        if self.checkpoint:
+            self.dump_csv()
+
+        print_memory_usage(self.data)
 
         print("Stage finished: Preprocessing")
+
+        return self.data
@@ -0,0 +1,399 @@
+import cProfile
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Dict, List, Tuple, Union
+
+from config import PATH_TO_PROFILES, PROFILED_STEPS, PROFILER, PROFILING_INTERVAL, PROFILE_ALLOCATIONS
+
+# cprofile: Deterministic profiler, every call is timed, slows down call heavy code
+# sampling: Stacks of the profiled thread are sampled every PROFILING_INTERVAL seconds, hardly slows anything down
+AVAILABLE_PROFILERS = ["cprofile", "sampling"]
+
+# Frames kept per allocation, and allocation sites listed, by the allocation tracking
+ALLOCATION_FRAMES = 32
+TOP_ALLOCATIONS = 25
+
+# Profiles of a process are not nested, cProfile and tracemalloc measure a single step at a time
+_active_profiler: Union[None, "StepProfiler"] = None
+
+# Profiles of processes outside of a trace are grouped by the start of the process
+_process_start = time.strftime("%Y%m%d-%H%M%S")
+
+
+def parse_profiled_step(text: str) -> Tuple[str, Dict[str, str]]:
+    """
+    This function parses a profiled step given on the command line, e.g. "EvaluationStage.evaluate_model:model=KNN".
+    :param text: Span name, optionally followed by a colon and comma separated key=value attributes
+    :return: Span name and the attributes its span must have.
+    """
+
+    name, _, attributes_text = text.partition(":")
+    attributes = {}
+
+    for pair in filter(None, (pair.strip() for pair in attributes_text.split(","))):
+        key, separator, value = pair.partition("=")
+        if not separator or not key.strip():
+            raise ValueError(f"Invalid attribute {pair!r} of profiled step {text!r}, expected key=value")
+        attributes[key.strip()] = value.strip()
+
+    if not name.strip():
+        raise ValueError(f"Invalid profiled step {text!r}, expected a span name")
+
+    return name.strip(), attributes
+
+
+def configure_profiling(steps: Dict[str, Dict], profiler: Union[None, str] = None,
+                        allocations: Union[None, bool] = None):
+    """
+    This function overrides the profiling settings of config.py for the current process, e.g. from the command line.
+    :param steps: Span name to the attributes its span must have, replaces PROFILED_STEPS
+    :param profiler: One of AVAILABLE_PROFILERS, PROFILER is kept if None
+    :param allocations: Whether allocations are tracked, PROFILE_ALLOCATIONS is kept if None
+    :return: This function returns nothing.
+    """
+
+    global PROFILED_STEPS, PROFILER, PROFILE_ALLOCATIONS
+
+    if profiler is not None and profiler not in AVAILABLE_PROFILERS:
+        raise ValueError(f"Unknown profiler {profiler}, expected one of {AVAILABLE_PROFILERS}")
+
+    PROFILED_STEPS = dict(steps)
+    PROFILER = PROFILER if profiler is None else profiler
+    PROFILE_ALLOCATIONS = PROFILE_ALLOCATIONS if allocations is None else allocations
+
+
+def profiling_settings() -> Tuple[Dict[str, Dict], str, bool]:
+    """
+    This function gives the profiling settings of the current process, worker processes import config anew and
+    apply them with configure_profiling.
+    :return: Profiled steps, profiler and whether allocations are tracked.
+    """
+
+    return PROFILED_STEPS, PROFILER, PROFILE_ALLOCATIONS
+
+
+def is_profiled(name: str, attributes: Dict) -> bool:
+    """
+    This function decides whether a step is profiled, see PROFILED_STEPS.
+    :param name: Name of the step (span)
+    :param attributes: Attributes of the step, e.g. the evaluated model
+    :return: True if the step is profiled.
+    """
+
+    if name not in PROFILED_STEPS:
+        return False
+
+    required_attributes = PROFILED_STEPS[name] or {}
+
+    # Attributes given on the command line are strings
+    return all(key in attributes and str(attributes[key]) == str(value) for key, value in required_attributes.items())
+
+
+def _frame_name(code) -> str:
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _function_name(function: Tuple) -> str:
+    filename, line, name = function
+    if filename == "~":
+        # Built-in functions, e.g. <method 'reduce' of 'numpy.ufunc' objects>
+        return name
+    return f"{name} ({os.path.basename(filename)}:{line})"
+
+
+def _strip_common_prefix(stacks: Counter) -> Counter:
+    # Frames above the step are shared by every stack, the outermost frame of the step is kept as the root
+    if not stacks:
+        return stacks
+
+    stack_frames = [stack.split(";") for stack in stacks]
+    common = 0
+    while all(len(frames) > common + 1 for frames in stack_frames) and \
+            len({frames[common] for frames in stack_frames}) == 1:
+        common += 1
+
+    stripped = Counter()
+    for frames, count in zip(stack_frames, stacks.values()):
+        stripped[";".join(frames[max(common - 1, 0):])] += count
+
+    return stripped
+
+
+def write_collapsed_stacks(stacks: Counter, path: str):
+    """
+    This function writes stacks in the collapsed format of flamegraph.pl, one "root;...;leaf weight" line per stack.
+    The file can be rendered by flamegraph.pl, inferno or speedscope.
+    :param stacks: Collapsed stack to weight
+    :param path: Path to the file
+    :return: This function returns nothing.
+    """
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as collapsed_file:
+        for stack, weight in sorted(stacks.items()):
+            if weight > 0:
+                collapsed_file.write(f"{stack} {weight}\n")
+
+    os.replace(temporary_path, path)
+
+
+def collapse_cprofile_stats(stats: pstats.Stats) -> Counter:
+    """
+    This function turns a cProfile call graph into collapsed stacks. cProfile only knows callers and callees,
+    not whole stacks, so the time of a function is split among its callers in proportion to the time each of
+    them spent in it.
+    :param stats: Profile statistics
+    :return: Collapsed stack to microseconds spent in its leaf.
+    """
+
+    callees: Dict[Tuple, Dict[Tuple, float]] = {}
+    roots = []
+
+    for function, (_, _, _, _, callers) in stats.stats.items():
+        if not callers:
+            roots.append(function)
+        for caller, caller_stats in callers.items():
+            callees.setdefault(caller, {})[function] = caller_stats[3]
+
+    stacks = Counter()
+
+    def walk(function: Tuple, share: float, stack: List[str], on_stack: set):
+        _, _, total_time, cumulative_time, _ = stats.stats[function]
+        if not cumulative_time or share <= 0:
+            return
+
+        stack = stack + [_function_name(function)]
+        scale = share / cumulative_time
+
+        stacks[";".join(stack)] += round(total_time * scale * 1e6)
+
+        for callee, callee_time in callees.get(function, {}).items():
+            # Recursion is cut at the first repetition, its time stays with the outer call
+            if callee not in on_stack:
+                walk(callee, callee_time * scale, stack, on_stack | {callee})
+
+    for root in roots:
+        walk(root, stats.stats[root][3], [], {root})
+
+    return stacks
+
+
+class StackSampler:
+    """
+    Sampling profiler of a single thread, a background thread records the stack of the profiled thread
+    every interval. Sampling only reads the frames, so the profiled code runs at almost full speed.
+    """
+
+    def __init__(self, interval: float = PROFILING_INTERVAL):
+
+        self.interval = interval
+        self.stacks = Counter()
+
+        self._thread_id = threading.get_ident()
+        self._stop = threading.Event()
+        self._sampler = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self._thread_id)
+
+            frames = []
+            while frame is not None:
+                frames.append(_frame_name(frame.f_code))
+                frame = frame.f_back
+
+            if frames:
+                self.stacks[";".join(reversed(frames))] += 1
+
+    def start(self):
+        self._sampler.start()
+
+    def stop(self) -> Counter:
+        """
+        This function stops sampling.
+        :return: Collapsed stack to number of samples.
+        """
+
+        self._stop.set()
+        self._sampler.join()
+
+        return _strip_common_prefix(self.stacks)
+
+
+class StepProfiler:
+    """
+    Profiles a single step, writes a collapsed stack file (and the raw cProfile statistics with the cprofile profiler)
+    plus, with PROFILE_ALLOCATIONS, the top allocation sites and a collapsed stack file of the memory the step
+    allocated and still holds at its end.
+    """
+
+    def __init__(self, name: str, attributes: Union[None, Dict] = None, profiler: str = PROFILER,
+                 allocations: bool = PROFILE_ALLOCATIONS, directory: Union[None, str] = None,
+                 run_id: Union[None, str] = None):
+
+        if profiler not in AVAILABLE_PROFILERS:
+            raise ValueError(f"Unknown profiler {profiler}, expected one of {AVAILABLE_PROFILERS}")
+
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.profiler = profiler
+        self.allocations = allocations
+
+        self.directory = os.path.join(directory or PATH_TO_PROFILES, run_id or _process_start)
+        self.pid = os.getpid()
+
+        self._profile: Union[None, cProfile.Profile] = None
+        self._sampler: Union[None, StackSampler] = None
+        self._started_tracemalloc = False
+        self._start = 0.0
+
+    @property
+    def file_prefix(self) -> str:
+        # e.g. EvaluationStage.evaluate_model-model=Random_Forest-12345
+        label = "-".join([self.name] + [f"{key}={value}" for key, value in self.attributes.items()])
+        return os.path.join(self.directory, f"{re.sub(r'[^A-Za-z0-9_.=-]+', '_', label)}-{os.getpid()}")
+
+    def start(self):
+        """
+        This function starts profiling the calling thread.
+        :return: This function returns nothing.
+        """
+
+        if self.allocations:
+            self._started_tracemalloc = not tracemalloc.is_tracing()
+            if self._started_tracemalloc:
+                tracemalloc.start(ALLOCATION_FRAMES)
+            tracemalloc.clear_traces()
+            tracemalloc.reset_peak()
+
+        self._start = time.perf_counter()
+
+        if self.profiler == "cprofile":
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        else:
+            self._sampler = StackSampler()
+            self._sampler.start()
+
+    def stop(self) -> List[str]:
+        """
+        This function stops profiling and writes the results.
+        :return: Paths to the written files.
+        """
+
+        if self._profile is not None:
+            self._profile.disable()
+        else:
+            stacks = self._sampler.stop()
+
+        seconds = time.perf_counter() - self._start
+
+        snapshot = None
+        if self.allocations:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak_allocated = tracemalloc.get_traced_memory()
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+        os.makedirs(self.directory, exist_ok=True)
+        prefix = self.file_prefix
+        paths = []
+
+        if self._profile is not None:
+            self._profile.dump_stats(f"{prefix}.prof")
+            paths.append(f"{prefix}.prof")
+            stacks = collapse_cprofile_stats(pstats.Stats(self._profile))
+
+        write_collapsed_stacks(stacks, f"{prefix}.collapsed")
+        paths.append(f"{prefix}.collapsed")
+
+        if snapshot is not None:
+            paths.extend(self.write_allocations(snapshot, peak_allocated, seconds, prefix))
+
+        return paths
+
+    def write_allocations(self, snapshot: tracemalloc.Snapshot, peak_allocated: int, seconds: float,
+                          prefix: str) -> List[str]:
+        """
+        This function writes the top allocation sites of the step and a collapsed stack file of its allocations.
+        :param snapshot: Allocations held at the end of the step
+        :param peak_allocated: Peak of the memory allocated through Python during the step (bytes)
+        :param seconds: Duration of the step
+        :param prefix: Path prefix of the files
+        :return: Paths to the written files.
+        """
+
+        snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__),
+                                           tracemalloc.Filter(False, __file__)])
+
+        lines = [f"Step: {self.name} {self.attributes}",
+                 f"Duration: {seconds:.2f} s, peak traced memory: {peak_allocated / 1024 ** 2:.1f} MB",
+                 f"Top {TOP_ALLOCATIONS} allocation sites still holding memory at the end of the step:", ""]
+
+        for statistic in snapshot.statistics("lineno")[:TOP_ALLOCATIONS]:
+            frame = statistic.traceback[0]
+            lines.append(f"{statistic.size / 1024 ** 2:>10.2f} MB {statistic.count:>9} blocks  "
+                         f"{frame.filename}:{frame.lineno}")
+
+        temporary_path = f"{prefix}.allocations.txt.tmp"
+        with open(temporary_path, "w") as allocations_file:
+            allocations_file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, f"{prefix}.allocations.txt")
+
+        # Kilobytes per allocation stack, tracebacks are stored most recent call last
+        stacks = Counter()
+        for statistic in snapshot.statistics("traceback"):
+            stack = ";".join(f"{os.path.basename(frame.filename)}:{frame.lineno}" for frame in statistic.traceback)
+            stacks[stack] += round(statistic.size / 1024)
+
+        write_collapsed_stacks(_strip_common_prefix(stacks), f"{prefix}.allocations.collapsed")
+
+        return [f"{prefix}.allocations.txt", f"{prefix}.allocations.collapsed"]
+
+
+def start_profiling(name: str, attributes: Dict, run_id: Union[None, str] = None) -> Union[None, StepProfiler]:
+    """
+    This function starts profiling a step if it is one of PROFILED_STEPS.
+    :param name: Name of the step (span)
+    :param attributes: Attributes of the step
+    :param run_id: Run the profile belongs to, profiles of a run share a directory
+    :return: The profiler, None if the step is not profiled or another step of the process is being profiled.
+    """
+
+    global _active_profiler
+
+    if not is_profiled(name, attributes):
+        return None
+
+    # Forked worker processes inherit the profiler of their parent, but it does not run in them
+    if _active_profiler is not None and _active_profiler.pid == os.getpid():
+        return None
+
+    # Settings are read when the step starts, configure_profiling may have changed them after the import
+    _active_profiler = StepProfiler(name, attributes, profiler=PROFILER, allocations=PROFILE_ALLOCATIONS, run_id=run_id)
+    _active_profiler.start()
+
+    return _active_profiler
+
+
+def stop_profiling(profiler: StepProfiler) -> List[str]:
+    """
+    This function stops profiling a step and writes its profiles.
+    :param profiler: Result of start_profiling
+    :return: Paths to the written files.
+    """
+
+    global _active_profiler
+
+    _active_profiler = None
+
+    paths = profiler.stop()
+    print(f"Profiles of {profiler.name} saved to {profiler.directory}")
+
+    return paths
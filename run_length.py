@@ -0,0 +1,56 @@
+import numpy as np
+
+# Every function here works row-wise on a 2D boolean mask (individuals x months) without Python loops.
+
+
+def run_lengths(mask: np.ndarray) -> np.ndarray:
+    """
+    This function measures the length of the run of True values ending at each position of every row.
+    :param mask: Boolean matrix
+    :return: Integer matrix of the same shape, 0 where mask is False.
+    """
+
+    counts = np.cumsum(mask, axis=1, dtype=np.int64)
+
+    # Count reached at the last False position, the current run started right after it
+    counts_at_breaks = np.maximum.accumulate(np.where(mask, 0, counts), axis=1)
+
+    return counts - counts_at_breaks
+
+
+def longest_run(mask: np.ndarray) -> np.ndarray:
+    """
+    This function finds the length of the longest run of True values within every row.
+    :param mask: Boolean matrix
+    :return: Length of the longest run per row.
+    """
+
+    if mask.shape[1] == 0:
+        return np.zeros(mask.shape[0], dtype=np.int64)
+
+    return run_lengths(mask).max(axis=1)
+
+
+def leading_run(mask: np.ndarray) -> np.ndarray:
+    """
+    This function finds the length of the run of True values that starts at the first column of every row.
+    :param mask: Boolean matrix
+    :return: Length of the leading run per row.
+    """
+
+    return np.logical_and.accumulate(mask, axis=1).sum(axis=1, dtype=np.int64)
+
+
+def count_runs(mask: np.ndarray) -> np.ndarray:
+    """
+    This function counts the separate runs of True values within every row.
+    :param mask: Boolean matrix
+    :return: Number of runs per row.
+    """
+
+    if mask.shape[1] == 0:
+        return np.zeros(mask.shape[0], dtype=np.int64)
+
+    run_starts = mask[:, 1:] & ~mask[:, :-1]
+
+    return mask[:, 0].astype(np.int64) + run_starts.sum(axis=1, dtype=np.int64)
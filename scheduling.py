@@ -0,0 +1,63 @@
+import json
+import os
+from typing import Dict, List, Tuple
+
+from config import PATH_TO_MODEL_TIMINGS
+
+
+def load_timings(path: str = PATH_TO_MODEL_TIMINGS) -> Dict[str, float]:
+    """
+    This function reads how long each model took to evaluate in previous runs.
+    :param path: Path to the timings file
+    :return: Model name to seconds, empty if nothing was recorded yet.
+    """
+
+    try:
+        with open(path) as timings_file:
+            return json.load(timings_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+
+def save_timings(timings: Dict[str, float], path: str = PATH_TO_MODEL_TIMINGS):
+    """
+    This function records how long each model took to evaluate, on top of the previously recorded timings.
+    :param timings: Model name to seconds
+    :param path: Path to the timings file
+    :return: This function returns nothing.
+    """
+
+    recorded_timings = load_timings(path)
+    recorded_timings.update(timings)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as timings_file:
+        json.dump(recorded_timings, timings_file, indent=4, sort_keys=True)
+
+    os.replace(temporary_path, path)
+
+
+def longest_first(names: List[str], timings: Dict[str, float]) -> List[int]:
+    """
+    This function orders the models longest processing time first, which keeps the makespan of a worker pool short.
+    Models without a recorded timing are assumed to be the longest ones.
+    :param names: Model names
+    :param timings: Model name to seconds
+    :return: Indices of the models in the order they should be started.
+    """
+
+    return sorted(range(len(names)), key=lambda index: -timings.get(names[index], float("inf")))
+
+
+def split_worker_budget(n_jobs: int, num_tasks: int) -> Tuple[int, int]:
+    """
+    This function splits a worker budget between concurrently evaluated models and the fits within each model.
+    :param n_jobs: Total number of workers
+    :param num_tasks: Number of models to evaluate
+    :return: Number of models evaluated at once and number of workers each of them gets.
+    """
+
+    outer_jobs = max(1, min(n_jobs, num_tasks))
+    inner_jobs = max(1, n_jobs // outer_jobs)
+
+    return outer_jobs, inner_jobs
@@ -0,0 +1,133 @@
+import sys
+from typing import Dict, Union
+
+import numpy as np
+import pandas as pd
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+# Compact dtypes of the credit default columns, from refined raw columns to engineered features.
+# Categorical variables are small integer codes rather than pandas categoricals, so models can consume them as is.
+COLUMN_DTYPES: Dict[str, np.dtype] = {
+    "LIMIT_BAL": np.dtype(np.float32),
+    "SEX": np.dtype(np.uint8),
+    "EDUCATION": np.dtype(np.uint8),
+    "MARRIAGE": np.dtype(np.uint8),
+    "AGE": np.dtype(np.uint8),
+    **{f"PAY_{i}": np.dtype(np.int8) for i in [1, 2, 3, 4, 5, 6]},
+    **{f"BILL_AMT{i}": np.dtype(np.int32) for i in [1, 2, 3, 4, 5, 6]},
+    **{f"PAY_AMT{i}": np.dtype(np.int32) for i in [1, 2, 3, 4, 5, 6]},
+    "DEFAULT": np.dtype(np.uint8),
+    "ACTIVITY": np.dtype(np.float32),
+    "OVERPAID": np.dtype(np.uint8),
+    "DELAYED": np.dtype(np.uint8),
+    "OVERDRAFT": np.dtype(np.uint8),
+    "MAX_DELAY": np.dtype(np.int8),
+    "LONGEST_STREAK": np.dtype(np.int8),
+    "CURRENT_STREAK": np.dtype(np.int8),
+    "DELAY_EPISODES": np.dtype(np.int8),
+    "LONGEST_DELAY_RUN": np.dtype(np.int8)
+}
+
+# One hot encoded columns are named after the encoded variable, e.g. EDUCATION_2
+ONE_HOT_PREFIXES = ["SEX_", "EDUCATION_", "MARRIAGE_", "OVERPAID_", "DELAYED_", "OVERDRAFT_"]
+ONE_HOT_DTYPE = np.dtype(np.uint8)
+
+# Normalized columns are stored in single precision
+NORMALIZED_DTYPE = np.dtype(np.float32)
+
+
+def column_dtype(column: str) -> Union[None, np.dtype]:
+    """
+    This function looks up the declared dtype of a column.
+    :param column: Column name
+    :return: Declared dtype, None if the column is not part of the schema.
+    """
+
+    if column in COLUMN_DTYPES:
+        return COLUMN_DTYPES[column]
+
+    if any(column.startswith(prefix) for prefix in ONE_HOT_PREFIXES):
+        return ONE_HOT_DTYPE
+
+    return None
+
+
+def _fits_integer_dtype(values: pd.Series, dtype: np.dtype) -> bool:
+    if len(values) == 0:
+        return True
+
+    if values.isna().any():
+        return False
+
+    if not pd.api.types.is_integer_dtype(values.dtype) and not pd.api.types.is_bool_dtype(values.dtype):
+        if not (values == values.round()).all():
+            return False
+
+    limits = np.iinfo(dtype)
+
+    return limits.min <= values.min() and values.max() <= limits.max
+
+
+def apply_schema(data: pd.DataFrame) -> pd.DataFrame:
+    """
+    This function casts the columns of the data to their declared dtypes, in place.
+    Integer casts are only done when they are lossless. Columns whose values do not fit (e.g. after normalization)
+    are kept in floating point, in single precision.
+    :param data: Data to be cast
+    :return: The same data frame.
+    """
+
+    for current_column in data.columns:
+        dtype = column_dtype(current_column)
+
+        if dtype is None or data[current_column].dtype == dtype:
+            continue
+
+        if np.issubdtype(dtype, np.integer):
+            if _fits_integer_dtype(data[current_column], dtype):
+                data[current_column] = data[current_column].astype(dtype)
+            elif pd.api.types.is_float_dtype(data[current_column].dtype):
+                data[current_column] = data[current_column].astype(NORMALIZED_DTYPE)
+        else:
+            data[current_column] = data[current_column].astype(dtype)
+
+    return data
+
+
+def print_memory_usage(data: pd.DataFrame):
+    """
+    This function displays how much memory the data occupies, next to what it would take as 64 bit columns.
+    :param data: Data to be measured
+    :return: This function returns nothing.
+    """
+
+    memory_usage = data.memory_usage(index=False, deep=True).sum()
+    wide_memory_usage = len(data) * len(data.columns) * 8
+
+    saving = 0 if wide_memory_usage == 0 else (1 - memory_usage / wide_memory_usage) * 100
+
+    print(f"Memory usage: {memory_usage / 1024 ** 2:.2f} MB "
+          f"({wide_memory_usage / 1024 ** 2:.2f} MB as 64 bit columns, {saving:.1f}% saving)")
+
+
+def print_peak_memory(moment: str):
+    """
+    This function displays the peak resident memory of the process so far.
+    :param moment: When the peak is measured, e.g. "before balancing"
+    :return: This function returns nothing.
+    """
+
+    if resource is None:
+        print(f"Peak memory ({moment}): not available on this platform")
+        return
+
+    # Linux reports kilobytes, macOS bytes
+    peak_memory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != "darwin":
+        peak_memory *= 1024
+
+    print(f"Peak memory ({moment}): {peak_memory / 1024 ** 2:.2f} MB")
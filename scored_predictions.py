@@ -0,0 +1,175 @@
+import json
+import os
+import re
+from typing import Dict, Tuple, Union
+
+import numpy as np
+from sklearn.metrics import auc, confusion_matrix
+
+from config import BETA, PATH_TO_DECISION_THRESHOLDS
+
+
+class ScoredPredictions:
+    """
+    Scores of a model on a data set, every metric and curve is derived from them without running the model again.
+    Scores are sorted once, which gives the confusion counts at every distinct score as a threshold: ROC and
+    precision-recall curves and the F-beta of every threshold come from these counts in O(n log n) overall.
+    A row is predicted positive if its score is at least the threshold.
+    """
+
+    def __init__(self, y_true: np.ndarray, scores: np.ndarray, classes: np.ndarray,
+                 default_predictions: Union[None, np.ndarray] = None, beta: float = BETA):
+
+        self.y_true = np.asarray(y_true)
+        self.scores = np.asarray(scores)
+        self.classes = np.asarray(classes)
+        self.beta = beta
+
+        # Predictions of the model itself, the 0.5 probability cutoff for most classifiers
+        self.default_predictions = default_predictions
+
+        order = np.argsort(-self.scores, kind="mergesort")
+        sorted_scores = self.scores[order]
+        is_positive = self.y_true[order] == self.classes[1]
+
+        # Last row of every run of equal scores, thresholds go from the highest score to the lowest
+        threshold_rows = np.r_[np.flatnonzero(np.diff(sorted_scores)), len(sorted_scores) - 1]
+
+        self.thresholds = sorted_scores[threshold_rows]
+        self.true_positives = np.cumsum(is_positive)[threshold_rows]
+        self.false_positives = threshold_rows + 1 - self.true_positives
+
+        self.num_positives = int(is_positive.sum())
+        self.num_negatives = len(is_positive) - self.num_positives
+
+    @classmethod
+    def from_model(cls, model, X, y_true: np.ndarray, beta: float = BETA) -> "ScoredPredictions":
+        """
+        This function scores a data set with a single pass of the model.
+        :param model: Fitted binary classifier
+        :param X: Input features
+        :param y_true: Target variable
+        :param beta: Beta of the F-beta score
+        :return: Scored predictions of the model.
+        """
+
+        if hasattr(model, "predict_proba"):
+            probabilities = model.predict_proba(X)
+            # predict takes the most probable class, the first one on ties
+            return cls(y_true, probabilities[:, 1], model.classes_, model.classes_[probabilities.argmax(axis=1)],
+                       beta)
+
+        scores = model.decision_function(X)
+        return cls(y_true, scores, model.classes_, model.classes_[(scores > 0).astype(int)], beta)
+
+    def predictions(self, threshold: Union[None, float] = None) -> np.ndarray:
+        """
+        This function predicts the classes at a threshold.
+        :param threshold: Lowest score predicted positive, None gives the predictions of the model itself
+        :return: Predicted classes.
+        """
+
+        if threshold is None and self.default_predictions is not None:
+            return self.default_predictions
+
+        return self.classes[(self.scores >= (0.5 if threshold is None else threshold)).astype(int)]
+
+    def confusion_matrix(self, threshold: Union[None, float] = None) -> np.ndarray:
+        return confusion_matrix(self.y_true, self.predictions(threshold), labels=self.classes)
+
+    def fbeta(self, threshold: Union[None, float] = None) -> float:
+        (_, false_positives), (false_negatives, true_positives) = self.confusion_matrix(threshold)
+        return float(self._fbeta(true_positives, false_positives, false_negatives))
+
+    def accuracy(self, threshold: Union[None, float] = None) -> float:
+        return float(np.mean(self.predictions(threshold) == self.y_true))
+
+    def _fbeta(self, true_positives, false_positives, false_negatives):
+        # Same as sklearn's fbeta_score, 0 where nothing is predicted or present
+        numerator = (1 + self.beta ** 2) * true_positives
+        denominator = numerator + self.beta ** 2 * false_negatives + false_positives
+
+        return np.divide(numerator, denominator, out=np.zeros(np.shape(numerator)), where=denominator > 0)
+
+    def fbeta_curve(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        This function gives the F-beta score of every threshold.
+        :return: Thresholds (highest first) and their F-beta scores.
+        """
+
+        false_negatives = self.num_positives - self.true_positives
+
+        return self.thresholds, self._fbeta(self.true_positives, self.false_positives, false_negatives)
+
+    def best_threshold(self) -> Tuple[float, float]:
+        """
+        This function finds the threshold with the highest F-beta score, the highest such threshold on ties.
+        :return: Threshold and its F-beta score.
+        """
+
+        thresholds, fbeta_scores = self.fbeta_curve()
+        best = int(np.argmax(fbeta_scores))
+
+        return float(thresholds[best]), float(fbeta_scores[best])
+
+    def roc_curve(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        This function gives the ROC curve, starting at the origin like sklearn's roc_curve.
+        :return: False positive rates, true positive rates and the area under the curve.
+        """
+
+        false_positive_rates = np.r_[0, self.false_positives] / max(self.num_negatives, 1)
+        true_positive_rates = np.r_[0, self.true_positives] / max(self.num_positives, 1)
+
+        return false_positive_rates, true_positive_rates, float(auc(false_positive_rates, true_positive_rates))
+
+    def precision_recall_curve(self) -> Tuple[np.ndarray, np.ndarray, float]:
+        """
+        This function gives the precision-recall curve.
+        :return: Precisions, recalls (growing) and the average precision, as in sklearn's average_precision_score.
+        """
+
+        precisions = self.true_positives / (self.true_positives + self.false_positives)
+        recalls = self.true_positives / max(self.num_positives, 1)
+
+        return precisions, recalls, float(np.sum(np.diff(np.r_[0, recalls]) * precisions))
+
+
+def _threshold_path(model_name: str, directory: str) -> str:
+    return os.path.join(directory, f"{re.sub(r'[^A-Za-z0-9_.-]+', '_', model_name)}.json")
+
+
+def save_decision_threshold(model_name: str, record: Dict, directory: str = PATH_TO_DECISION_THRESHOLDS):
+    """
+    This function stores the tuned decision threshold of a model, one file per model, so models evaluated
+    in parallel do not overwrite each other.
+    :param model_name: Name of the model
+    :param record: Threshold along with what it was tuned for, e.g. features, parameters and scores
+    :param directory: Directory of the thresholds
+    :return: This function returns nothing.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    path = _threshold_path(model_name, directory)
+
+    temporary_path = f"{path}.tmp"
+    with open(temporary_path, "w") as threshold_file:
+        json.dump({"model": model_name, **record}, threshold_file, indent=4, default=str)
+
+    os.replace(temporary_path, path)
+
+
+def load_decision_threshold(model_name: str, directory: str = PATH_TO_DECISION_THRESHOLDS) -> Union[None, Dict]:
+    """
+    This function reads the tuned decision threshold of a model.
+    :param model_name: Name of the model
+    :param directory: Directory of the thresholds
+    :return: Record saved by save_decision_threshold, None if the model was not evaluated yet.
+    """
+
+    try:
+        with open(_threshold_path(model_name, directory)) as threshold_file:
+            return json.load(threshold_file)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return None
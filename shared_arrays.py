@@ -0,0 +1,51 @@
+import os
+from typing import Callable
+
+import numpy as np
+
+from config import PATH_TO_SHARED_ARRAYS
+
+# Rows copied into a memory mapped array at once, bounds the temporary copies made while materializing
+MATERIALIZE_CHUNK_SIZE = 2 ** 16
+
+
+def materialize_array(name: str, shape: tuple, dtype: np.dtype, fill_rows: Callable[[int, int], np.ndarray],
+                      directory: str = PATH_TO_SHARED_ARRAYS) -> np.memmap:
+    """
+    This function writes a contiguous array into a memory mapped .npy file, chunk by chunk, and opens it read only.
+    Worker processes reading the same file share one copy of it through the page cache.
+    :param name: File name of the array, without extension
+    :param shape: Shape of the array
+    :param dtype: Dtype of the array
+    :param fill_rows: Function returning the rows between its two arguments (start, end)
+    :param directory: Directory of the array files
+    :return: Read only memory mapped array.
+    """
+
+    os.makedirs(directory, exist_ok=True)
+
+    path = os.path.join(directory, f"{name}.npy")
+    temporary_path = os.path.join(directory, f"{name}.tmp.npy")
+
+    array = np.lib.format.open_memmap(temporary_path, mode="w+", dtype=dtype, shape=shape)
+
+    for start in range(0, shape[0], MATERIALIZE_CHUNK_SIZE):
+        end = min(start + MATERIALIZE_CHUNK_SIZE, shape[0])
+        array[start:end] = fill_rows(start, end)
+
+    array.flush()
+    del array
+
+    os.replace(temporary_path, path)
+
+    return open_array(path)
+
+
+def open_array(path: str) -> np.memmap:
+    """
+    This function opens a materialized array without reading it.
+    :param path: Path to the .npy file
+    :return: Read only memory mapped array.
+    """
+
+    return np.load(path, mmap_mode="r")
@@ -0,0 +1,50 @@
+import importlib
+from typing import Dict, List, Tuple
+
+# Stage name to the module and class of the stage. Modules are imported when a stage is created, so a pipeline
+# only pays for the libraries of the stages it runs (scikit-learn, imblearn, xgboost, matplotlib take seconds).
+STAGE_REGISTRY: Dict[str, Tuple[str, str]] = {
+    "gathering": ("gathering", "DataGatheringStage"),
+    "cleaning": ("cleaning", "DataCleaningStage"),
+    "balancing": ("balancing", "DataBalancingStage"),
+    "feature_engineering": ("feature_engineering", "FeatureEngineeringStage"),
+    "preprocessing": ("preprocessing", "PreprocessingStage"),
+    "evaluation": ("evaluate", "EvaluationStage")
+}
+
+
+def stage_class(name: str) -> type:
+    """
+    This function imports the class of a stage.
+    :param name: Name of the stage in STAGE_REGISTRY
+    :return: The stage class.
+    """
+
+    if name not in STAGE_REGISTRY:
+        raise ValueError(f"Unknown stage {name}, expected one of {list(STAGE_REGISTRY)}")
+
+    module_name, class_name = STAGE_REGISTRY[name]
+
+    return getattr(importlib.import_module(module_name), class_name)
+
+
+def create_stage(name: str, **parameters):
+    """
+    This function creates a stage, importing its module first.
+    :param name: Name of the stage in STAGE_REGISTRY
+    :param parameters: Parameters of the stage, e.g. method="adasyn" for balancing
+    :return: The stage.
+    """
+
+    return stage_class(name)(**parameters)
+
+
+def create_stages(names: List[str], parameters: Dict[str, Dict]) -> List:
+    """
+    This function creates stages in the given order.
+    :param names: Names of the stages
+    :param parameters: Stage name to its parameters, stages without an entry use their defaults
+    :return: The stages.
+    """
+
+    return [create_stage(name, **parameters.get(name, {})) for name in names]
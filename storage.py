@@ -0,0 +1,233 @@
+import os
+from typing import Iterable, Iterator, List, Union
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.feather as feather
+import pyarrow.parquet as pq
+
+from config import PATH_TO_TEMPORARY_DATA, INTERMEDIATE_FORMAT, INTERMEDIATE_COMPRESSION
+from schema import apply_schema
+
+AVAILABLE_FORMATS = ["feather", "parquet", "csv"]
+
+
+def _check_format(data_format: str):
+    if data_format not in AVAILABLE_FORMATS:
+        raise ValueError(f"Unknown intermediate format {data_format}, expected one of {AVAILABLE_FORMATS}")
+
+
+def _read_table(path: str, data_format: str, columns: Union[None, List[str]] = None) -> pa.Table:
+    if data_format == "feather":
+        # Memory mapping lets Arrow skip the columns we did not ask for
+        return feather.read_table(path, columns=columns, memory_map=True)
+
+    return pq.read_table(path, columns=columns, memory_map=True)
+
+
+def _write_table(table: pa.Table, path: str, data_format: str, compression: str):
+    # Write next to the target and swap it in, the old file may still be memory mapped
+    temporary_path = f"{path}.tmp"
+
+    if data_format == "feather":
+        feather.write_feather(table, temporary_path, compression=compression)
+    else:
+        pq.write_table(table, temporary_path, compression=compression)
+
+    os.replace(temporary_path, path)
+
+
+def _densify(data: pd.DataFrame) -> pd.DataFrame:
+    # Arrow has no sparse columns, they are stored dense and come back dense
+    sparse_columns = {column: dtype.subtype for column, dtype in data.dtypes.items()
+                      if isinstance(dtype, pd.SparseDtype)}
+
+    return data.astype(sparse_columns) if sparse_columns else data
+
+
+def read_intermediate_columns(path: str = PATH_TO_TEMPORARY_DATA,
+                              data_format: str = INTERMEDIATE_FORMAT) -> List[str]:
+    """
+    This function reads the column names of the intermediate data without loading any rows.
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :return: Column names in the order they are stored.
+    """
+    _check_format(data_format)
+
+    if data_format == "feather":
+        with pa.memory_map(path) as source:
+            return pa.ipc.open_file(source).schema.names
+
+    if data_format == "parquet":
+        return pq.read_schema(path).names
+
+    return pd.read_csv(path, nrows=0).columns.tolist()
+
+
+def read_intermediate(columns: Union[None, List[str]] = None, path: str = PATH_TO_TEMPORARY_DATA,
+                      data_format: str = INTERMEDIATE_FORMAT) -> pd.DataFrame:
+    """
+    This function reads the intermediate data produced by the previous stage.
+    :param columns: Columns to load, all columns are loaded if None
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :return: The intermediate data.
+    """
+    _check_format(data_format)
+
+    if data_format == "csv":
+        # CSV does not keep dtypes, so the schema is applied again
+        return apply_schema(pd.read_csv(path, usecols=columns))
+
+    return _read_table(path, data_format, columns).to_pandas()
+
+
+def iter_intermediate_chunks(chunk_size: int, columns: Union[None, List[str]] = None,
+                             path: str = PATH_TO_TEMPORARY_DATA,
+                             data_format: str = INTERMEDIATE_FORMAT) -> Iterator[pd.DataFrame]:
+    """
+    This function streams the intermediate data in chunks of rows, only one chunk is converted to pandas at a time.
+    :param chunk_size: Number of rows per chunk
+    :param columns: Columns to load, all columns are loaded if None
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :return: Iterator over the chunks, in stored row order. Data without rows yields a single empty chunk, so its
+    columns and dtypes are kept.
+    """
+    _check_format(data_format)
+
+    if data_format == "csv":
+        num_chunks = 0
+        for num_chunks, chunk in enumerate(pd.read_csv(path, usecols=columns, chunksize=chunk_size), 1):
+            yield apply_schema(chunk)
+        if not num_chunks:
+            yield apply_schema(pd.read_csv(path, usecols=columns, nrows=0))
+        return
+
+    if data_format == "parquet":
+        parquet_file = pq.ParquetFile(path, memory_map=True)
+        num_chunks = 0
+        for num_chunks, batch in enumerate(parquet_file.iter_batches(batch_size=chunk_size, columns=columns), 1):
+            yield batch.to_pandas()
+        if not num_chunks:
+            yield parquet_file.schema_arrow.empty_table().select(columns or parquet_file.schema_arrow.names).to_pandas()
+        return
+
+    # Slices of a memory mapped table are zero copy, rows are only read when a chunk is converted
+    table = _read_table(path, data_format, columns)
+    for start in range(0, max(table.num_rows, 1), chunk_size):
+        yield table.slice(start, chunk_size).to_pandas()
+
+
+def write_intermediate_chunks(chunks: Iterable[pd.DataFrame], path: str = PATH_TO_TEMPORARY_DATA,
+                              data_format: str = INTERMEDIATE_FORMAT,
+                              compression: str = INTERMEDIATE_COMPRESSION) -> int:
+    """
+    This function writes the intermediate data chunk by chunk, so it never has to be in memory as a whole.
+    Every chunk must have the columns and dtypes of the first one. At least one chunk (possibly empty) is needed.
+    :param chunks: Chunks of rows, in order
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :param compression: Compression codec for binary formats
+    :return: Number of rows written.
+    """
+    _check_format(data_format)
+
+    # Write next to the target and swap it in, the old file may still be memory mapped or be the input
+    temporary_path = f"{path}.tmp"
+    schema = None
+    writer = None
+    num_rows = 0
+
+    try:
+        for chunk in chunks:
+            chunk = _densify(chunk)
+
+            if data_format == "csv":
+                # Only the first chunk starts the file and writes the header
+                chunk.to_csv(temporary_path, index=False, mode="w" if schema is None else "a", header=schema is None)
+                schema = chunk.dtypes
+                num_rows += len(chunk)
+                continue
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+
+            if writer is None:
+                schema = table.schema
+                if data_format == "feather":
+                    options = pa.ipc.IpcWriteOptions(compression=None if compression == "uncompressed" else compression)
+                    writer = pa.ipc.new_file(temporary_path, schema, options=options)
+                else:
+                    writer = pq.ParquetWriter(temporary_path, schema, compression=compression)
+
+            writer.write_table(table.cast(schema))
+            num_rows += len(chunk)
+    finally:
+        if writer is not None:
+            writer.close()
+
+    if schema is None:
+        raise ValueError("No chunks to write")
+
+    os.replace(temporary_path, path)
+
+    return num_rows
+
+
+def write_intermediate(data: pd.DataFrame, path: str = PATH_TO_TEMPORARY_DATA,
+                       data_format: str = INTERMEDIATE_FORMAT, compression: str = INTERMEDIATE_COMPRESSION):
+    """
+    This function writes the intermediate data for oncoming stages. Index is not stored.
+    :param data: Data to be written
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :param compression: Compression codec for binary formats
+    :return: This function returns nothing.
+    """
+    _check_format(data_format)
+
+    data = _densify(data)
+
+    if data_format == "csv":
+        data.to_csv(path, index=False)
+        return
+
+    _write_table(pa.Table.from_pandas(data, preserve_index=False), path, data_format, compression)
+
+
+def append_intermediate_columns(data: pd.DataFrame, path: str = PATH_TO_TEMPORARY_DATA,
+                                data_format: str = INTERMEDIATE_FORMAT, compression: str = INTERMEDIATE_COMPRESSION):
+    """
+    This function adds (or replaces) columns of the intermediate data, row order must match the stored data.
+    Stored columns are passed through as Arrow buffers and never converted to pandas.
+    :param data: Columns to be added
+    :param path: Path to the intermediate data
+    :param data_format: One of feather, parquet or csv
+    :param compression: Compression codec for binary formats
+    :return: This function returns nothing.
+    """
+    _check_format(data_format)
+
+    data = _densify(data)
+
+    if data_format == "csv":
+        stored_data = pd.read_csv(path)
+        stored_data[data.columns.tolist()] = data.reset_index(drop=True)
+        stored_data.to_csv(path, index=False)
+        return
+
+    table = _read_table(path, data_format)
+
+    if table.num_rows != len(data):
+        raise ValueError(f"Cannot append {len(data)} rows to intermediate data with {table.num_rows} rows")
+
+    for current_column in data.columns:
+        values = pa.Array.from_pandas(data[current_column])
+
+        if current_column in table.column_names:
+            table = table.set_column(table.column_names.index(current_column), current_column, values)
+        else:
+            table = table.append_column(current_column, values)
+
+    _write_table(table, path, data_format, compression)
@@ -0,0 +1,167 @@
+from typing import Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+from config import RANDOM_SEED
+from schema import apply_schema
+
+# Months are ordered like the refined columns, 1 is the most recent month (September) and 6 the oldest (April)
+NUM_MONTHS = 6
+
+# Share of defaulters in the UCI credit default data
+DEFAULT_RATE = 0.2212
+
+# Categories and their shares in the UCI credit default data
+SEX_SHARES = {1: 0.396, 2: 0.604}
+EDUCATION_SHARES = {0: 0.0005, 1: 0.353, 2: 0.468, 3: 0.164, 4: 0.004, 5: 0.009, 6: 0.0015}
+MARRIAGE_SHARES = {0: 0.002, 1: 0.455, 2: 0.532, 3: 0.011}
+
+# Rows generated at once, every chunk has its own seed, so the data only depends on the seed and the number of rows
+SYNTHETIC_CHUNK_SIZE = 2 ** 18
+
+
+def _choice(random_generator: np.random.Generator, shares: dict, num_rows: int) -> np.ndarray:
+    probabilities = np.array(list(shares.values()))
+
+    return random_generator.choice(list(shares.keys()), num_rows, p=probabilities / probabilities.sum())
+
+
+def _sigmoid(values: np.ndarray) -> np.ndarray:
+    return 1 / (1 + np.exp(-values))
+
+
+def _generate_payment_statuses(random_generator: np.random.Generator, risk: np.ndarray) -> np.ndarray:
+    """
+    This function walks the repayment status of every row month by month, from the oldest month on.
+    Statuses: -2 no consumption, -1 paid duly, 0 revolving credit, 1..8 months of payment delay.
+    Riskier rows start delaying more often and recover less often.
+    :return: Statuses (rows x months), most recent month first.
+    """
+
+    num_rows = len(risk)
+    statuses = np.empty((num_rows, NUM_MONTHS), dtype=np.int8)
+
+    current = _choice(random_generator, {-2: 0.15, -1: 0.2, 0: 0.65}, num_rows).astype(np.int8)
+    delayed_from_start = random_generator.random(num_rows) < _sigmoid(-2.2 + 1.3 * risk)
+    current[delayed_from_start] = 1 + (risk[delayed_from_start] > 1)
+
+    for month in range(NUM_MONTHS - 1, -1, -1):
+        statuses[:, month] = current
+
+        draws = random_generator.random(num_rows)
+        next_status = current.copy()
+
+        inactive = current == -2
+        next_status[inactive & (draws < 0.12)] = -1
+        next_status[inactive & (draws >= 0.12) & (draws < 0.18)] = 0
+
+        # Rows paying on time start delaying with a risk dependent probability, otherwise mostly keep their habit
+        on_time = (current == -1) | (current == 0)
+        starts_delaying = on_time & (draws < _sigmoid(-3.4 + 1.4 * risk))
+        switches = on_time & ~starts_delaying & (draws > 0.9)
+        next_status[starts_delaying] = 1 + (random_generator.random(starts_delaying.sum()) < 0.7)
+        next_status[switches] = np.where(current[switches] == 0, -1, 0)
+        next_status[on_time & (draws > 0.985)] = -2
+
+        # Delayed rows fall further behind, keep paying the minimum, or catch up
+        delayed = current > 0
+        falls_behind = delayed & (draws < _sigmoid(-1.9 + 0.8 * risk))
+        catches_up = delayed & ~falls_behind & (draws > 0.7)
+        next_status[falls_behind] = np.minimum(current[falls_behind] + 1, 8)
+        next_status[catches_up] = 0
+
+        current = next_status
+
+    return statuses
+
+
+def generate_credit_data_chunk(num_rows: int, seed: Union[None, int, np.random.SeedSequence] = None) -> pd.DataFrame:
+    """
+    This function generates rows with the columns and dtypes DataGatheringStage produces from the UCI credit
+    default workbook. A latent risk of every row drives its credit limit, repayment statuses, bill statements,
+    payments and the target variable, so PAY_*, BILL_AMT*, PAY_AMT* and DEFAULT are correlated like in the data.
+    :param num_rows: Number of rows
+    :param seed: Seed of the rows
+    :return: Synthetic rows.
+    """
+
+    random_generator = np.random.default_rng(seed)
+
+    risk = random_generator.standard_normal(num_rows)
+
+    data = {}
+
+    limit_balance = np.exp(11.8 - 0.25 * risk + 0.65 * random_generator.standard_normal(num_rows))
+    data["LIMIT_BAL"] = np.clip(np.round(limit_balance, -4), 10000, 1000000)
+    data["SEX"] = _choice(random_generator, SEX_SHARES, num_rows)
+    data["EDUCATION"] = _choice(random_generator, EDUCATION_SHARES, num_rows)
+    data["MARRIAGE"] = _choice(random_generator, MARRIAGE_SHARES, num_rows)
+    data["AGE"] = np.clip(np.rint(21 + random_generator.gamma(2.6, 5.5, num_rows)), 21, 79)
+
+    statuses = _generate_payment_statuses(random_generator, risk)
+    for month in range(NUM_MONTHS):
+        data[f"PAY_{month + 1}"] = statuses[:, month]
+
+    # Credit utilization drifts month by month, delays pile up interest on top of it
+    utilization = np.clip(random_generator.beta(1.1, 1.9, num_rows) + 0.08 * risk, 0, 1.1)
+    bill_statements = np.empty((num_rows, NUM_MONTHS))
+    for month in range(NUM_MONTHS - 1, -1, -1):
+        utilization = np.clip(utilization + 0.03 * random_generator.standard_normal(num_rows)
+                              + 0.03 * (statuses[:, month] > 0), 0, 1.2)
+        bill_statements[:, month] = data["LIMIT_BAL"] * utilization
+
+    bill_statements[statuses == -2] = 0
+    paid_duly = statuses == -1
+    bill_statements[paid_duly] *= random_generator.uniform(0, 0.3, paid_duly.sum())
+    overpaid = random_generator.random((num_rows, NUM_MONTHS)) < 0.02
+    bill_statements[overpaid] = -random_generator.exponential(1500, overpaid.sum())
+
+    # Payment of a month settles the bill of the month before: in full when paid duly, the minimum when revolving
+    # and hardly anything when delayed
+    previous_bills = np.maximum(np.concatenate([bill_statements[:, 1:], bill_statements[:, -1:]], axis=1), 0)
+    paid_share = np.select([statuses == -2, statuses == -1, statuses == 0],
+                           [random_generator.uniform(0, 0.05, (num_rows, NUM_MONTHS)),
+                            random_generator.uniform(0.8, 1.0, (num_rows, NUM_MONTHS)),
+                            random_generator.uniform(0.03, 0.12, (num_rows, NUM_MONTHS))],
+                           random_generator.uniform(0, 0.04, (num_rows, NUM_MONTHS)))
+    payments = previous_bills * paid_share
+
+    for month in range(NUM_MONTHS):
+        data[f"BILL_AMT{month + 1}"] = np.rint(bill_statements[:, month])
+    for month in range(NUM_MONTHS):
+        data[f"PAY_AMT{month + 1}"] = np.rint(payments[:, month])
+
+    # Defaulters are the rows with the highest liability, a mix of the latent risk and the recent delays
+    liability = 0.6 * risk + 0.2 * np.clip(statuses[:, 0], 0, 3) + 0.6 * random_generator.standard_normal(num_rows)
+    data["DEFAULT"] = liability > np.quantile(liability, 1 - DEFAULT_RATE) if num_rows else liability > 0
+
+    return apply_schema(pd.DataFrame(data))
+
+
+def iter_credit_data(num_rows: int, random_state: Union[None, int] = RANDOM_SEED,
+                     chunk_size: int = SYNTHETIC_CHUNK_SIZE) -> Iterator[pd.DataFrame]:
+    """
+    This function streams synthetic credit default rows in chunks, for sizes that should not be built in one go.
+    :param num_rows: Number of rows
+    :param random_state: Seed of the data, None draws fresh data every time
+    :param chunk_size: Number of rows per chunk
+    :return: Iterator over the chunks.
+    """
+
+    chunks = range(0, num_rows, chunk_size)
+    seeds = np.random.SeedSequence(random_state if random_state else None).spawn(len(chunks))
+
+    for start, seed in zip(chunks, seeds):
+        yield generate_credit_data_chunk(min(chunk_size, num_rows - start), seed)
+
+
+def generate_credit_data(num_rows: int, random_state: Union[None, int] = RANDOM_SEED) -> pd.DataFrame:
+    """
+    This function generates synthetic credit default data, see generate_credit_data_chunk.
+    :param num_rows: Number of rows
+    :param random_state: Seed of the data, None draws fresh data every time
+    :return: Synthetic data with the columns and dtypes of the gathered data.
+    """
+
+    return pd.concat(iter_credit_data(num_rows, random_state), ignore_index=True)
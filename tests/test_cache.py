@@ -0,0 +1,89 @@
+import importlib
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import cache
+from cache import StageCache, stage_key
+
+STAGE_SOURCE = '''from toy_helper import OFFSET
+
+
+class ToyStage:
+
+    def __init__(self, factor: int = 1):
+        self.factor = factor
+
+    def cache_parameters(self):
+        return {"factor": self.factor, "offset": OFFSET}
+'''
+
+
+def toy_stage_module(directory, monkeypatch):
+    # Sources are looked up next to cache.py, the toy stage and the module it imports live in a temporary directory
+    (directory / "toy_stage.py").write_text(STAGE_SOURCE)
+    (directory / "toy_helper.py").write_text("OFFSET = 0\n")
+
+    monkeypatch.setattr(cache, "__file__", str(directory / "cache.py"))
+    monkeypatch.syspath_prepend(str(directory))
+
+    return importlib.import_module("toy_stage")
+
+
+def stage_output(num_rows: int = 1000) -> pd.DataFrame:
+    random_generator = np.random.default_rng(0)
+
+    return pd.DataFrame({"LIMIT_BAL": random_generator.uniform(size=num_rows),
+                         "DEFAULT": random_generator.integers(0, 2, num_rows).astype(np.uint8)})
+
+
+def entry_size(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, file_name)) for file_name in os.listdir(directory))
+
+
+def test_stage_key_changes_with_parameters_source_and_input(tmp_path, monkeypatch):
+    module = toy_stage_module(tmp_path, monkeypatch)
+
+    key = stage_key(module.ToyStage(), "input")
+
+    assert stage_key(module.ToyStage(), "input") == key
+    assert stage_key(module.ToyStage(factor=2), "input") != key
+    assert stage_key(module.ToyStage(), "other input") != key
+
+    # Modules a stage imports are part of its source
+    (tmp_path / "toy_helper.py").write_text("OFFSET = 0  # edited\n")
+    helper_key = stage_key(module.ToyStage(), "input")
+    assert helper_key != key
+
+    (tmp_path / "toy_stage.py").write_text(STAGE_SOURCE + "\n# edited\n")
+    assert stage_key(module.ToyStage(), "input") not in [key, helper_key]
+
+
+def test_eviction_removes_least_recently_used_entry(tmp_path):
+    data = stage_output()
+
+    probe = StageCache(str(tmp_path / "probe"))
+    probe.put("probe", data, "log")
+    size = entry_size(str(tmp_path / "probe" / "probe"))
+
+    stage_cache = StageCache(str(tmp_path / "cache"), size_limit=2 * size + size // 2)
+
+    stage_cache.put("first", data, "log")
+    stage_cache.put("second", data, "log")
+
+    now = time.time()
+    os.utime(tmp_path / "cache" / "first", (now - 200, now - 200))
+    os.utime(tmp_path / "cache" / "second", (now - 100, now - 100))
+
+    # Restoring an entry marks it as recently used, the other one is evicted first
+    restored, log = stage_cache.get("first")
+    pd.testing.assert_frame_equal(restored, data)
+    assert log == "log"
+
+    stage_cache.put("third", data, "log")
+
+    assert stage_cache.contains("first")
+    assert not stage_cache.contains("second")
+    assert stage_cache.contains("third")
@@ -0,0 +1,114 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engine import PatternCache, compute_features
+
+PAYMENT_STATUS_COLUMNS = [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
+BILL_STATEMENT_COLUMNS = [f"BILL_AMT{i}" for i in [1, 2, 3, 4, 5, 6]]
+
+
+def payment_data(num_rows: int = 3000, seed: int = 0) -> pd.DataFrame:
+    random_generator = np.random.default_rng(seed)
+
+    return pd.DataFrame({
+        **{column: random_generator.integers(-2, 9, num_rows).astype(np.int8) for column in PAYMENT_STATUS_COLUMNS},
+        **{column: random_generator.integers(-1000, 200000, num_rows).astype(np.int32)
+           for column in BILL_STATEMENT_COLUMNS}
+    })
+
+
+def row_runs(row) -> list:
+    # Lengths of the runs of True values of a row, in order
+    runs = []
+    length = 0
+
+    for value in row:
+        if value:
+            length += 1
+        elif length:
+            runs.append(length)
+            length = 0
+
+    if length:
+        runs.append(length)
+
+    return runs
+
+
+def row_by_row_features(data: pd.DataFrame) -> pd.DataFrame:
+    # Features as the stage computed them with pandas, streaks row by row, before the feature engine
+    payment_statuses = data[PAYMENT_STATUS_COLUMNS]
+    bill_statements = data[BILL_STATEMENT_COLUMNS]
+
+    on_time_runs = [row_runs(row) for row in (payment_statuses <= 0).to_numpy()]
+    delayed_runs = [row_runs(row) for row in (payment_statuses > 0).to_numpy()]
+
+    return pd.DataFrame({
+        "ACTIVITY": 1 - (payment_statuses == -2).sum(axis=1) / 6,
+        "OVERPAID": (bill_statements < 0).any(axis=1).astype(int),
+        "DELAYED": (payment_statuses > 0).any(axis=1).astype(int),
+        "OVERDRAFT": (bill_statements > 0).any(axis=1).astype(int),
+        "MAX_DELAY": payment_statuses.max(axis=1).clip(lower=0),
+        "LONGEST_STREAK": [max(runs, default=0) for runs in on_time_runs],
+        "CURRENT_STREAK": [runs[0] if runs and row[0] <= 0 else 0
+                           for runs, row in zip(on_time_runs, payment_statuses.to_numpy())],
+        "DELAY_EPISODES": [len(runs) for runs in delayed_runs],
+        "LONGEST_DELAY_RUN": [max(runs, default=0) for runs in delayed_runs]
+    })
+
+
+def engine_features(data: pd.DataFrame, **parameters) -> pd.DataFrame:
+    return pd.DataFrame(compute_features(data[PAYMENT_STATUS_COLUMNS].to_numpy(),
+                                         data[BILL_STATEMENT_COLUMNS].to_numpy(), **parameters))
+
+
+@pytest.mark.parametrize("chunk_size", [1, 128, 2 ** 16])
+def test_fused_pass_matches_row_by_row_features(chunk_size):
+    data = payment_data()
+
+    features = engine_features(data, chunk_size=chunk_size, memoize_patterns=False)
+
+    pd.testing.assert_frame_equal(features, row_by_row_features(data), check_dtype=False)
+
+
+def test_missing_statuses_match_row_by_row_features():
+    data = payment_data().astype({column: np.float32 for column in PAYMENT_STATUS_COLUMNS})
+    data = data.mask(np.random.default_rng(1).uniform(size=data.shape) < 0.1)
+
+    pd.testing.assert_frame_equal(engine_features(data), row_by_row_features(data), check_dtype=False)
+
+
+def test_memoized_patterns_match_fused_pass():
+    data = payment_data()
+
+    memoized = engine_features(data)
+
+    pd.testing.assert_frame_equal(memoized, engine_features(data, memoize_patterns=False))
+    pd.testing.assert_frame_equal(memoized, row_by_row_features(data), check_dtype=False)
+
+
+def test_warm_pattern_cache_matches_fused_pass(tmp_path, capsys):
+    pattern_cache = PatternCache(str(tmp_path))
+
+    # Rows of the second data partly repeat the first, the warm cache only computes the new patterns
+    first = payment_data(seed=0)
+    second = pd.concat([first.iloc[:1000], payment_data(seed=1)], ignore_index=True)
+
+    pd.testing.assert_frame_equal(engine_features(first, pattern_cache=pattern_cache),
+                                  engine_features(first, memoize_patterns=False))
+    capsys.readouterr()
+
+    warm = engine_features(second, pattern_cache=pattern_cache)
+    counts = re.search(r"(\d+) unique payment patterns among \d+ rows, (\d+) of them computed",
+                       capsys.readouterr().out)
+
+    known_patterns = set(first[PAYMENT_STATUS_COLUMNS].itertuples(index=False))
+    second_patterns = set(second[PAYMENT_STATUS_COLUMNS].itertuples(index=False))
+
+    assert int(counts.group(1)) == len(second_patterns)
+    assert int(counts.group(2)) == len(second_patterns - known_patterns) < len(second_patterns)
+    pd.testing.assert_frame_equal(warm, engine_features(second, memoize_patterns=False))
+    pd.testing.assert_frame_equal(engine_features(second, pattern_cache=pattern_cache), warm)
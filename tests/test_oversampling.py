@@ -0,0 +1,63 @@
+import numpy as np
+import pandas as pd
+import pytest
+from imblearn.over_sampling import ADASYN, SMOTE
+
+from neighbors import NeighborGraph
+from oversampling import ChunkedOversampler
+
+CATEGORICAL_COLUMNS = ["SEX", "EDUCATION", "MARRIAGE"] + [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
+
+SAMPLERS = {"smote": SMOTE, "adasyn": ADASYN}
+
+
+def credit_data(num_rows: int = 600, minority_share: float = 0.25, seed: int = 0) -> pd.DataFrame:
+    # Every code of a categorical column shows up, so interpolated codes can only be codes of the input
+    random_generator = np.random.default_rng(seed)
+
+    data = pd.DataFrame({
+        "LIMIT_BAL": random_generator.uniform(10000, 500000, num_rows).astype(np.float32),
+        "SEX": random_generator.integers(1, 3, num_rows).astype(np.uint8),
+        "EDUCATION": random_generator.integers(1, 5, num_rows).astype(np.uint8),
+        "MARRIAGE": random_generator.integers(1, 4, num_rows).astype(np.uint8),
+        "AGE": random_generator.integers(21, 70, num_rows).astype(np.uint8),
+        **{f"PAY_{i}": random_generator.integers(-2, 9, num_rows).astype(np.int8) for i in [1, 2, 3, 4, 5, 6]},
+        "BILL_AMT1": random_generator.integers(-1000, 200000, num_rows).astype(np.int32),
+        "DEFAULT": (random_generator.uniform(size=num_rows) < minority_share).astype(np.uint8)
+    })
+
+    return data
+
+
+def in_memory_graph(X: np.ndarray, y: np.ndarray) -> NeighborGraph:
+    return NeighborGraph(X, subsets={label: np.flatnonzero(y == label) for label in np.unique(y)}, persist=False)
+
+
+def imblearn_resample(method: str, data: pd.DataFrame) -> pd.DataFrame:
+    X, y = data.drop(columns=["DEFAULT"]), data["DEFAULT"]
+    X_resampled, y_resampled = SAMPLERS[method](random_state=0).fit_resample(X, y)
+
+    return pd.concat([X_resampled, y_resampled], axis=1)
+
+
+@pytest.mark.parametrize("method", ["smote", "adasyn"])
+def test_synthetic_rows_keep_dtypes_and_categories(method):
+    data = credit_data()
+
+    chunked = ChunkedOversampler(method=method, chunk_size=64).fit_resample(data, graph_factory=in_memory_graph)
+    reference = imblearn_resample(method, data)
+
+    assert len(chunked) > len(data)
+    assert chunked.dtypes.to_dict() == reference.dtypes.to_dict() == data.dtypes.to_dict()
+
+    for column in CATEGORICAL_COLUMNS:
+        assert set(chunked[column]) == set(reference[column]) == set(data[column]), column
+
+
+def test_original_rows_come_first_unchanged():
+    data = credit_data()
+
+    chunked = ChunkedOversampler(method="smote").fit_resample(data, graph_factory=in_memory_graph)
+
+    pd.testing.assert_frame_equal(chunked.iloc[:len(data)], data)
+    assert chunked["DEFAULT"].value_counts().nunique() == 1
@@ -0,0 +1,77 @@
+import numpy as np
+import pytest
+
+from run_length import count_runs, leading_run, longest_run
+
+
+def len_longest_nonpositive_subseq(lst):
+    # Row by row LONGEST_STREAK of feature_engineering/longest_streak.py before it was vectorized
+    subsequences = []
+    start_index = None
+
+    for i, num in enumerate(lst):
+        if num <= 0:
+            if start_index is None:
+                start_index = i
+        elif start_index is not None:
+            subsequences.append(lst[start_index:i])
+            start_index = None
+
+    if start_index is not None:
+        subsequences.append(lst[start_index:])
+
+    return max((len(subsequence) for subsequence in subsequences), default=0)
+
+
+def row_runs(row):
+    # Lengths of the runs of True values of a row, in order
+    runs = []
+    length = 0
+
+    for value in row:
+        if value:
+            length += 1
+        elif length:
+            runs.append(length)
+            length = 0
+
+    if length:
+        runs.append(length)
+
+    return runs
+
+
+def payment_statuses(num_rows: int = 2000, num_months: int = 6, seed: int = 0) -> np.ndarray:
+    return np.random.default_rng(seed).integers(-2, 9, (num_rows, num_months)).astype(np.int8)
+
+
+@pytest.mark.parametrize("missing", [False, True])
+def test_longest_run_matches_row_by_row_longest_streak(missing):
+    statuses = payment_statuses()
+
+    if missing:
+        # Missing statuses break a streak, just like in the row by row version
+        statuses = statuses.astype(np.float32)
+        statuses[np.random.default_rng(1).uniform(size=statuses.shape) < 0.1] = np.nan
+
+    expected = [len_longest_nonpositive_subseq(list(row)) for row in statuses]
+
+    np.testing.assert_array_equal(longest_run(statuses <= 0), expected)
+
+
+@pytest.mark.parametrize("num_months", [1, 6, 12])
+def test_run_kernels_match_row_by_row_runs(num_months):
+    mask = payment_statuses(num_months=num_months, seed=num_months) > 0
+
+    runs = [row_runs(row) for row in mask]
+
+    np.testing.assert_array_equal(longest_run(mask), [max(row, default=0) for row in runs])
+    np.testing.assert_array_equal(count_runs(mask), [len(row) for row in runs])
+    np.testing.assert_array_equal(leading_run(mask), [row[0] if row and mask[index, 0] else 0
+                                                      for index, row in enumerate(runs)])
+
+
+def test_run_kernels_handle_empty_shapes():
+    for mask in [np.zeros((0, 6), dtype=bool), np.zeros((3, 0), dtype=bool)]:
+        for kernel in [longest_run, leading_run, count_runs]:
+            np.testing.assert_array_equal(kernel(mask), np.zeros(mask.shape[0]))
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from sklearn.metrics import fbeta_score
+
+from scored_predictions import ScoredPredictions
+
+
+def scored_data(num_rows: int = 400, seed: int = 0):
+    random_generator = np.random.default_rng(seed)
+
+    y_true = (random_generator.uniform(size=num_rows) < 0.3).astype(int)
+    # Rounded scores tie, so several rows share a threshold
+    scores = np.round(np.clip(0.3 * y_true + random_generator.uniform(size=num_rows) * 0.7, 0, 1), 2)
+
+    return y_true, scores
+
+
+def brute_force_best_threshold(y_true, scores, classes, beta):
+    # Every distinct score as the threshold, the highest threshold wins ties
+    thresholds = np.unique(scores)[::-1]
+    fbeta_scores = np.array([fbeta_score(y_true, classes[(scores >= threshold).astype(int)], beta=beta,
+                                         pos_label=classes[1], zero_division=0) for threshold in thresholds])
+
+    best = int(np.flatnonzero(np.isclose(fbeta_scores, fbeta_scores.max(), rtol=0, atol=1e-12))[0])
+
+    return thresholds[best], fbeta_scores[best], thresholds, fbeta_scores
+
+
+@pytest.mark.parametrize("beta", [0.5, 1, 10])
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_best_threshold_matches_brute_force_sweep(beta, seed):
+    y_true, scores = scored_data(seed=seed)
+    classes = np.array([0, 1])
+
+    scored_predictions = ScoredPredictions(y_true, scores, classes, beta=beta)
+
+    threshold, fbeta = scored_predictions.best_threshold()
+    expected_threshold, expected_fbeta, thresholds, fbeta_scores = brute_force_best_threshold(y_true, scores,
+                                                                                              classes, beta)
+
+    assert threshold == expected_threshold
+    assert fbeta == pytest.approx(expected_fbeta)
+    assert scored_predictions.fbeta(threshold) == pytest.approx(fbeta)
+
+    curve_thresholds, curve_fbeta_scores = scored_predictions.fbeta_curve()
+    np.testing.assert_array_equal(curve_thresholds, thresholds)
+    np.testing.assert_allclose(curve_fbeta_scores, fbeta_scores)
+
+
+def test_best_threshold_with_string_classes():
+    y_true, scores = scored_data()
+    classes = np.array(["no", "yes"])
+
+    threshold, fbeta = ScoredPredictions(classes[y_true], scores, classes, beta=10).best_threshold()
+    expected_threshold, expected_fbeta, _, _ = brute_force_best_threshold(classes[y_true], scores, classes, 10)
+
+    assert threshold == expected_threshold
+    assert fbeta == pytest.approx(expected_fbeta)
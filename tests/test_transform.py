@@ -0,0 +1,46 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from feature_engineering import FeatureEngineeringStage
+from gathering import COLUMN_RENAMES
+from synthetic import generate_credit_data
+from transform import ScoringTransform
+
+
+@pytest.fixture(scope="module")
+def engineered_data() -> pd.DataFrame:
+    # The pattern cache is left out, so nothing is written outside of the test
+    return FeatureEngineeringStage(use_pattern_cache=False).execute_stage(generate_credit_data(3000, random_state=0))
+
+
+def model_input(transform: ScoringTransform, data: pd.DataFrame) -> np.ndarray:
+    return transform.transform_frame(data)[transform.feature_columns].to_numpy(dtype=np.float32)
+
+
+def test_records_match_transform_frame(engineered_data):
+    transform = ScoringTransform().fit(engineered_data)
+    expected = model_input(transform, engineered_data)
+
+    # Large inputs memoize payment patterns, a handful of records is computed row by row
+    records = engineered_data[transform.input_columns]
+    np.testing.assert_array_equal(transform.transform(records), expected)
+    np.testing.assert_array_equal(transform.transform(records.iloc[:50].to_dict("records")), expected[:50])
+    np.testing.assert_array_equal(transform.transform(records.iloc[0].to_dict()), expected[:1])
+
+    # Records may use the raw column names of the workbook
+    raw_records = records.iloc[:50].rename(columns={refined: raw for raw, refined in COLUMN_RENAMES.items()})
+    np.testing.assert_array_equal(transform.transform(raw_records.to_dict("records")), expected[:50])
+
+
+def test_loaded_transform_matches_fitted_one(engineered_data, tmp_path):
+    transform = ScoringTransform().fit(engineered_data)
+    transform.save(str(tmp_path / "scoring_transform.json"))
+
+    loaded = ScoringTransform.load(str(tmp_path / "scoring_transform.json"))
+
+    assert loaded.feature_columns == transform.feature_columns
+    pd.testing.assert_frame_equal(loaded.transform_frame(engineered_data), transform.transform_frame(engineered_data))
+
+    records = engineered_data[transform.input_columns].iloc[:50].to_dict("records")
+    np.testing.assert_array_equal(loaded.transform(records), model_input(transform, engineered_data)[:50])
@@ -0,0 +1,54 @@
+import pandas as pd
+import pytest
+
+from balancing import DataBalancingStage
+from synthetic import generate_credit_data
+from undersampling import StreamingUndersampler
+
+
+def chunk_source_of(data: pd.DataFrame, chunk_size: int):
+    def chunk_source(columns):
+        selected = data if columns is None else data[columns]
+        return (selected.iloc[start:start + chunk_size] for start in range(0, len(data), chunk_size))
+
+    return chunk_source
+
+
+def undersample(data: pd.DataFrame, chunk_size: int) -> pd.DataFrame:
+    return pd.concat(StreamingUndersampler().fit_transform(chunk_source_of(data, chunk_size)))
+
+
+@pytest.fixture(scope="module")
+def credit_data() -> pd.DataFrame:
+    return generate_credit_data(5000, random_state=0)
+
+
+def test_kept_rows_do_not_depend_on_chunk_size(credit_data):
+    reference = undersample(credit_data, len(credit_data))
+
+    class_counts = reference["DEFAULT"].value_counts()
+    assert class_counts.nunique() == 1
+    assert class_counts.iloc[0] == credit_data["DEFAULT"].value_counts().min()
+
+    for chunk_size in [1000, 333, 64]:
+        pd.testing.assert_frame_equal(undersample(credit_data, chunk_size), reference)
+
+
+@pytest.mark.parametrize("chunk_size", [1000, 64])
+def test_stage_output_matches_undersampler(credit_data, chunk_size):
+    stage = DataBalancingStage("streaming_undersample", chunk_size=chunk_size)
+
+    output = stage.execute_stage(credit_data)
+
+    assert output["DEFAULT"].value_counts().to_dict() == \
+        undersample(credit_data, len(credit_data))["DEFAULT"].value_counts().to_dict()
+    assert output.dtypes.to_dict() == credit_data.dtypes.to_dict()
+
+
+def test_data_without_rows_keeps_its_columns(credit_data):
+    empty = credit_data.iloc[:0]
+
+    output = DataBalancingStage("streaming_undersample", chunk_size=64).execute_stage(empty)
+
+    assert len(output) == 0
+    assert output.dtypes.to_dict() == empty.dtypes.to_dict()
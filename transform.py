@@ -0,0 +1,365 @@
+import json
+import os
+from typing import Dict, List, Union
+
+import numpy as np
+import pandas as pd
+from scipy.sparse import csr_matrix
+
+from config import PATH_TO_SCORING_TRANSFORM
+from feature_engine import FEATURE_REGISTRY, compute_features
+from gathering import COLUMN_RENAMES
+from schema import ONE_HOT_DTYPE, NORMALIZED_DTYPE
+
+# Values without a label are grouped into the "others" value of their variable
+UNLABELED_VALUES = {
+    "EDUCATION": ([0, 5, 6], 4),
+    "MARRIAGE": ([0], 3)
+}
+
+COLUMNS_TO_NORMALIZE = ["LIMIT_BAL", "AGE", "SEX", "MAX_DELAY", "LONGEST_STREAK",
+                        "CURRENT_STREAK", "DELAY_EPISODES", "LONGEST_DELAY_RUN",
+                        "BILL_AMT1", "BILL_AMT2", "BILL_AMT3", "BILL_AMT4", "BILL_AMT5", "BILL_AMT6",
+                        "PAY_AMT1", "PAY_AMT2", "PAY_AMT3", "PAY_AMT4", "PAY_AMT5", "PAY_AMT6"]
+
+# Categorical variables are one hot encoded after normalization, so SEX is encoded by its normalized value
+CATEGORICAL_FEATURES = ["SEX", "EDUCATION", "MARRIAGE", "OVERPAID", "DELAYED", "OVERDRAFT"]
+
+PAYMENT_STATUS_COLUMNS = [f"PAY_{i}" for i in [1, 2, 3, 4, 5, 6]]
+BILL_STATEMENT_COLUMNS = [f"BILL_AMT{i}" for i in [1, 2, 3, 4, 5, 6]]
+
+
+class ScoringTransform:
+    """
+    Preprocessing fitted on the feature engineered data: learned min/max of normalized columns, category vocabularies
+    and column order. The same transform turns the pipeline data into model input and new raw records into model
+    input, so both always agree.
+    """
+
+    def __init__(self, target_variable: str = "DEFAULT"):
+
+        self.target_variable = target_variable
+
+        # Columns of the fitted data, before preprocessing
+        self.columns: List[str] = []
+
+        self.minimums: Dict[str, float] = {}
+        self.maximums: Dict[str, float] = {}
+
+        # Categorical variable to its values and the dummy column of each value
+        self.vocabularies: Dict[str, List] = {}
+        self.dummy_columns: Dict[str, List[str]] = {}
+
+        # Raw record columns to model input matrix, built on first use
+        self._plan: Union[None, Dict] = None
+
+    @property
+    def output_columns(self) -> List[str]:
+        """
+        Columns of the preprocessed data, in order.
+        """
+
+        columns = [column for column in self.columns if column not in self.vocabularies]
+
+        for categorical_feature in self.vocabularies:
+            columns.extend(self.dummy_columns[categorical_feature])
+
+        return columns
+
+    @property
+    def feature_columns(self) -> List[str]:
+        """
+        Columns of the model input matrix, the output columns without the target variable.
+        """
+
+        return [column for column in self.output_columns if column != self.target_variable]
+
+    @property
+    def input_columns(self) -> List[str]:
+        """
+        Raw columns a record needs, engineered features are computed from them.
+        """
+
+        engineered_features = [definition["name"] for definition in FEATURE_REGISTRY]
+
+        return [column for column in self.columns
+                if column not in engineered_features and column != self.target_variable]
+
+    @staticmethod
+    def group_unlabeled_values(column: str, values: np.ndarray) -> np.ndarray:
+        if column not in UNLABELED_VALUES:
+            return values
+
+        unlabeled_values, others = UNLABELED_VALUES[column]
+
+        return np.where(np.isin(values, unlabeled_values), np.asarray(others, dtype=values.dtype), values)
+
+    def normalize(self, column: str, values: np.ndarray) -> np.ndarray:
+        if column not in self.minimums:
+            return values
+
+        minimum = NORMALIZED_DTYPE.type(self.minimums[column])
+        maximum = NORMALIZED_DTYPE.type(self.maximums[column])
+
+        return (values.astype(NORMALIZED_DTYPE) - minimum) / (maximum - minimum)
+
+    def fit(self, data: pd.DataFrame) -> "ScoringTransform":
+        """
+        This function learns the preprocessing from the feature engineered data.
+        :param data: Output of the feature engineering stage
+        :return: The transform itself.
+        """
+
+        self.columns = data.columns.tolist()
+
+        self.minimums = {}
+        self.maximums = {}
+        self.vocabularies = {}
+        self.dummy_columns = {}
+        self._plan = None
+
+        for current_column in COLUMNS_TO_NORMALIZE:
+            values = self.group_unlabeled_values(current_column, data[current_column].to_numpy())
+            values = values.astype(NORMALIZED_DTYPE)
+
+            self.minimums[current_column] = float(values.min())
+            self.maximums[current_column] = float(values.max())
+
+        for current_feature in CATEGORICAL_FEATURES:
+            values = self.group_unlabeled_values(current_feature, data[current_feature].to_numpy())
+            values = self.normalize(current_feature, values)
+
+            # Sorted and without missing values, like the dummies of pd.get_dummies
+            vocabulary = pd.unique(values[~pd.isna(values)])
+            vocabulary.sort()
+
+            self.vocabularies[current_feature] = vocabulary.tolist()
+            self.dummy_columns[current_feature] = [f"{current_feature}_{value}" for value in vocabulary]
+
+        return self
+
+    def encode_categorical(self, categorical_values: Dict[str, np.ndarray],
+                           sparse: bool = False) -> Union[np.ndarray, csr_matrix]:
+        """
+        This function one hot encodes every categorical variable in a single pass over a fixed vocabulary.
+        Indicators of all variables are written into one preallocated block, in the order of the dummy columns.
+        Values outside the vocabulary of a variable get no indicator set.
+        :param categorical_values: Categorical variable to its (grouped and normalized) values
+        :param sparse: True returns a scipy.sparse CSR matrix instead of a dense block
+        :return: uint8 indicator matrix (rows x dummy columns).
+        """
+
+        num_rows = len(next(iter(categorical_values.values())))
+
+        indicator_rows = []
+        indicator_columns = []
+        offset = 0
+
+        for categorical_feature, vocabulary in self.vocabularies.items():
+            if vocabulary:
+                values = categorical_values[categorical_feature]
+                vocabulary = np.asarray(vocabulary)
+
+                # Vocabularies are sorted, so each value's dummy is found by binary search
+                codes = np.minimum(np.searchsorted(vocabulary, values), len(vocabulary) - 1)
+                known = vocabulary[codes] == values
+
+                indicator_rows.append(np.flatnonzero(known))
+                indicator_columns.append(offset + codes[known])
+
+            offset += len(vocabulary)
+
+        rows = np.concatenate(indicator_rows) if indicator_rows else np.empty(0, dtype=np.intp)
+        columns = np.concatenate(indicator_columns) if indicator_columns else np.empty(0, dtype=np.intp)
+
+        if sparse:
+            return csr_matrix((np.ones(len(rows), dtype=ONE_HOT_DTYPE), (rows, columns)), shape=(num_rows, offset))
+
+        # Column major, so every dummy column is a contiguous slice of the block
+        indicators = np.zeros((num_rows, offset), dtype=ONE_HOT_DTYPE, order="F")
+        indicators[rows, columns] = 1
+
+        return indicators
+
+    def transform_frame(self, data: pd.DataFrame, sparse: bool = False) -> pd.DataFrame:
+        """
+        This function preprocesses feature engineered data, column by column into a single new frame.
+        Values outside the vocabulary of a categorical variable get no dummy set.
+        :param data: Data with the columns the transform was fitted on
+        :param sparse: True stores the dummy columns as pandas sparse columns
+        :return: Preprocessed data.
+        """
+
+        output = {}
+        categorical_values = {}
+
+        for current_column in self.columns:
+            values = data[current_column].to_numpy()
+
+            if current_column in UNLABELED_VALUES or current_column in self.minimums:
+                values = self.normalize(current_column, self.group_unlabeled_values(current_column, values))
+
+            if current_column in self.vocabularies:
+                categorical_values[current_column] = values
+            else:
+                output[current_column] = values
+
+        dummy_columns = [dummy_column for categorical_feature in self.vocabularies
+                         for dummy_column in self.dummy_columns[categorical_feature]]
+        indicators = self.encode_categorical(categorical_values, sparse)
+
+        if sparse:
+            indicators = indicators.tocsc()
+            for position, dummy_column in enumerate(dummy_columns):
+                output[dummy_column] = pd.arrays.SparseArray.from_spmatrix(indicators[:, [position]])
+        else:
+            for position, dummy_column in enumerate(dummy_columns):
+                output[dummy_column] = indicators[:, position]
+
+        return pd.DataFrame(output, index=data.index, copy=False)
+
+    def _build_plan(self) -> Dict:
+        # Index arrays that map raw record values to the model input matrix in a handful of vectorized operations
+        input_columns = self.input_columns
+        engineered_features = [definition["name"] for definition in FEATURE_REGISTRY]
+
+        # Prepared values: raw columns followed by engineered features, grouped and normalized in place
+        prepared_columns = input_columns + engineered_features
+
+        normalized_columns = [column for column in prepared_columns if column in self.minimums]
+        minimums = np.array([self.minimums[column] for column in normalized_columns], dtype=NORMALIZED_DTYPE)
+        maximums = np.array([self.maximums[column] for column in normalized_columns], dtype=NORMALIZED_DTYPE)
+
+        copied_positions, copied_sources = [], []
+        dummy_positions, dummy_sources, dummy_values = [], [], []
+
+        dummy_of = {dummy_column: (categorical_feature, value)
+                    for categorical_feature in self.vocabularies
+                    for dummy_column, value in zip(self.dummy_columns[categorical_feature],
+                                                   self.vocabularies[categorical_feature])}
+
+        for position, feature_column in enumerate(self.feature_columns):
+            if feature_column in dummy_of:
+                categorical_feature, value = dummy_of[feature_column]
+                dummy_positions.append(position)
+                dummy_sources.append(prepared_columns.index(categorical_feature))
+                dummy_values.append(value)
+            else:
+                copied_positions.append(position)
+                copied_sources.append(prepared_columns.index(feature_column))
+
+        # Raw name of each refined input column, records may use either one
+        raw_names = {refined_name: raw_name for raw_name, refined_name in COLUMN_RENAMES.items()}
+
+        self._plan = {
+            "input_columns": input_columns,
+            "raw_names": [raw_names.get(column, column) for column in input_columns],
+            "payment_status_sources": [input_columns.index(column) for column in PAYMENT_STATUS_COLUMNS],
+            "bill_statement_sources": [input_columns.index(column) for column in BILL_STATEMENT_COLUMNS],
+            "engineered_features": engineered_features,
+            "num_prepared": len(prepared_columns),
+            "grouped_sources": [(prepared_columns.index(column), np.array(unlabeled_values, dtype=np.float64), others)
+                                for column, (unlabeled_values, others) in UNLABELED_VALUES.items()
+                                if column in prepared_columns],
+            "normalized_sources": np.array([prepared_columns.index(column) for column in normalized_columns]),
+            "minimums": minimums,
+            "ranges": maximums - minimums,
+            "copied_positions": np.array(copied_positions, dtype=np.intp),
+            "copied_sources": np.array(copied_sources, dtype=np.intp),
+            "dummy_positions": np.array(dummy_positions, dtype=np.intp),
+            "dummy_sources": np.array(dummy_sources, dtype=np.intp),
+            "dummy_values": np.array(dummy_values, dtype=np.float64),
+            "num_features": len(self.feature_columns)
+        }
+
+        return self._plan
+
+    def transform(self, records: Union[Dict, List[Dict], pd.DataFrame]) -> np.ndarray:
+        """
+        This function turns raw records into the model input matrix, without building any data frame.
+        Raw column names (PAY_0) are accepted next to the refined ones (PAY_1), the target variable is not needed.
+        :param records: A raw record, a list of them or a data frame of raw columns
+        :return: float32 matrix with one row per record, columns in the order of feature_columns.
+        """
+
+        plan = self._plan if self._plan is not None else self._build_plan()
+
+        if isinstance(records, dict):
+            records = [records]
+
+        if isinstance(records, pd.DataFrame):
+            inputs = records.rename(columns=COLUMN_RENAMES)[plan["input_columns"]].to_numpy(dtype=np.float64)
+        else:
+            inputs = np.array([[record[column] if column in record else record[raw_name]
+                                for column, raw_name in zip(plan["input_columns"], plan["raw_names"])]
+                               for record in records], dtype=np.float64).reshape(len(records), -1)
+
+        num_rows, num_inputs = inputs.shape
+
+        # Per row computation is cheaper than pattern memoization for a handful of rows
+        features = compute_features(inputs[:, plan["payment_status_sources"]],
+                                    inputs[:, plan["bill_statement_sources"]],
+                                    memoize_patterns=num_rows > 1024)
+
+        prepared = np.empty((num_rows, plan["num_prepared"]), dtype=np.float64)
+        prepared[:, :num_inputs] = inputs
+        for offset, feature_name in enumerate(plan["engineered_features"]):
+            prepared[:, num_inputs + offset] = features[feature_name]
+
+        for source, unlabeled_values, others in plan["grouped_sources"]:
+            values = prepared[:, source]
+            values[(values[:, np.newaxis] == unlabeled_values).any(axis=1)] = others
+
+        # Same single precision arithmetic as transform_frame, so both give identical values
+        normalized_sources = plan["normalized_sources"]
+        prepared[:, normalized_sources] = ((prepared[:, normalized_sources].astype(NORMALIZED_DTYPE)
+                                            - plan["minimums"]) / plan["ranges"])
+
+        matrix = np.empty((num_rows, plan["num_features"]), dtype=np.float32)
+        matrix[:, plan["copied_positions"]] = prepared[:, plan["copied_sources"]]
+        matrix[:, plan["dummy_positions"]] = prepared[:, plan["dummy_sources"]] == plan["dummy_values"]
+
+        return matrix
+
+    def save(self, path: str = PATH_TO_SCORING_TRANSFORM):
+        """
+        This function stores the fitted transform.
+        :param path: Path to the transform file (json)
+        :return: This function returns nothing.
+        """
+
+        fitted = {
+            "target_variable": self.target_variable,
+            "columns": self.columns,
+            "minimums": self.minimums,
+            "maximums": self.maximums,
+            "vocabularies": self.vocabularies,
+            "dummy_columns": self.dummy_columns
+        }
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "w") as transform_file:
+            json.dump(fitted, transform_file, indent=4)
+
+        os.replace(temporary_path, path)
+
+    @classmethod
+    def load(cls, path: str = PATH_TO_SCORING_TRANSFORM) -> "ScoringTransform":
+        """
+        This function loads a fitted transform.
+        :param path: Path to the transform file (json)
+        :return: The fitted transform.
+        """
+
+        with open(path) as transform_file:
+            fitted = json.load(transform_file)
+
+        transform = cls(target_variable=fitted["target_variable"])
+
+        transform.columns = fitted["columns"]
+        transform.minimums = fitted["minimums"]
+        transform.maximums = fitted["maximums"]
+        transform.vocabularies = fitted["vocabularies"]
+        transform.dummy_columns = fitted["dummy_columns"]
+
+        return transform
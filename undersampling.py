@@ -0,0 +1,99 @@
+from typing import Callable, Dict, Iterator
+
+import numpy as np
+import pandas as pd
+
+from config import RANDOM_SEED
+
+
+class StreamingUndersampler:
+    """
+    Random undersampler over chunks of rows, for data that does not fit in memory. A first pass counts the classes,
+    a second pass keeps a seeded sample of every class down to the size of the smallest class.
+    Kept rows are drawn from the class counts alone, so the sample does not depend on the chunk size.
+    """
+
+    def __init__(self, target_variable: str = "DEFAULT"):
+
+        self.target_variable = target_variable
+
+        # Class to number of rows, and class to sorted positions (within the class) of the rows to keep
+        self.class_counts: Dict = {}
+        self.kept_positions: Dict = {}
+
+    def count_classes(self, chunks: Iterator[pd.DataFrame]) -> Dict:
+        """
+        This function counts the rows of every class.
+        :param chunks: Chunks with the target variable
+        :return: Class to number of rows.
+        """
+
+        class_counts: Dict = {}
+
+        for chunk in chunks:
+            for label, count in chunk[self.target_variable].value_counts(sort=False).items():
+                class_counts[label] = class_counts.get(label, 0) + count
+
+        return class_counts
+
+    def fit(self, chunks: Iterator[pd.DataFrame]):
+        """
+        This function counts the classes and draws which rows of every class are kept.
+        :param chunks: Chunks with the target variable, only the target variable is read
+        :return: This function returns nothing.
+        """
+
+        self.class_counts = self.count_classes(chunks)
+
+        # Data without rows has no classes, nothing is kept
+        num_kept = min(self.class_counts.values(), default=0)
+
+        random_state = RANDOM_SEED if RANDOM_SEED else None
+        random_generator = np.random.default_rng(random_state)
+
+        # Classes are visited in sorted order, so the draws do not depend on which class shows up first
+        self.kept_positions = {}
+        for label in sorted(self.class_counts):
+            positions = np.arange(self.class_counts[label])
+            if self.class_counts[label] > num_kept:
+                positions = np.sort(random_generator.choice(self.class_counts[label], num_kept, replace=False))
+            self.kept_positions[label] = positions
+
+        print(f"Class counts: {self.class_counts}, keeping {num_kept} rows of every class.")
+
+    def transform(self, chunks: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+        """
+        This function keeps the drawn rows of every chunk, in their original order.
+        :param chunks: Chunks in the order they were counted
+        :return: Iterator over the kept rows of every chunk.
+        """
+
+        rows_seen = {label: 0 for label in self.kept_positions}
+
+        for chunk in chunks:
+            y = chunk[self.target_variable].to_numpy()
+            keep = np.zeros(len(chunk), dtype=bool)
+
+            for label, positions in self.kept_positions.items():
+                rows = np.flatnonzero(y == label)
+
+                # Position of every row within its class, over every chunk so far
+                class_positions = rows_seen[label] + np.arange(len(rows))
+                found = np.searchsorted(positions, class_positions)
+                keep[rows] = positions[np.minimum(found, len(positions) - 1)] == class_positions
+
+                rows_seen[label] += len(rows)
+
+            yield chunk[keep]
+
+    def fit_transform(self, chunk_source: Callable[..., Iterator[pd.DataFrame]]) -> Iterator[pd.DataFrame]:
+        """
+        This function runs both passes.
+        :param chunk_source: Function returning a new iterator over the chunks, it is called once per pass
+        and is given the columns to load (None for every column)
+        :return: Iterator over the kept rows of every chunk.
+        """
+
+        self.fit(chunk_source([self.target_variable]))
+
+        return self.transform(chunk_source(None))